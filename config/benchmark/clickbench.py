@@ -11,7 +11,7 @@ logger = get_logger(__name__)
 
 
 def get_clickbench_benchmark() -> Benchmark:
-    datasets: List[DataSet] = __load_and_return_clickbench_data()
+    datasets: List[DataSet] = __get_clickbench_data()
     queries = __get_clickbench_queries()
 
     return {
@@ -58,9 +58,7 @@ def __get_clickbench_queries() -> List[Query]:
     return queries
 
 
-def __load_and_return_clickbench_data() -> List[DataSet]:
-    __load_clickbench_data()
-
+def __get_clickbench_data() -> List[DataSet]:
     duckdb_file_path = __get_clickbench_file_path()
     duckdb_file_name_without_extension = os.path.splitext(os.path.basename(duckdb_file_path))[0]
 
@@ -71,7 +69,10 @@ def __load_and_return_clickbench_data() -> List[DataSet]:
     dataset: DataSet = {
         'name': f'clickbench',
         'setup_script': setup_script,
-        'config': {}
+        'files': [duckdb_file_path],
+        'config': {},
+        # the data is only generated once the dataset is run
+        'generate': __load_clickbench_data,
     }
 
 
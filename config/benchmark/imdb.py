@@ -11,7 +11,7 @@ logger = get_logger(__name__)
 
 
 def get_imdb_benchmark() -> Benchmark:
-    datasets: List[DataSet] = __load_and_return_imdb_data()
+    datasets: List[DataSet] = __get_imdb_data()
     queries = get_imdb_queries()
 
     return {
@@ -57,9 +57,7 @@ def get_imdb_queries() -> List[Query]:
     return queries
 
 
-def __load_and_return_imdb_data() -> List[DataSet]:
-    __load_imdb_data()
-
+def __get_imdb_data() -> List[DataSet]:
     duckdb_file_path = __get_imdb_file_path()
     duckdb_file_name_without_extension = os.path.splitext(os.path.basename(duckdb_file_path))[0]
 
@@ -70,7 +68,10 @@ def __load_and_return_imdb_data() -> List[DataSet]:
     dataset: DataSet = {
         'name': f'imdb',
         'setup_script': setup_script,
-        'config': {}
+        'files': [duckdb_file_path],
+        'config': {},
+        # the data is only generated once the dataset is run
+        'generate': __load_imdb_data,
     }
 
 
@@ -32,7 +32,7 @@ JOIN_MICRO_BUILD_QUERIES_DUPS: List[Query] = [
 
 def get_join_micro_build_benchmark() -> Benchmark:
 
-    datasets: List[DataSet] = __generate_and_return_data()
+    datasets: List[DataSet] = __get_data()
 
     queries = JOIN_MICRO_BUILD_QUERIES_DUPS
     return {
@@ -47,9 +47,7 @@ def __get_file_path() -> str:
     return get_data_path(file_name)
 
 
-def __generate_and_return_data() -> List[DataSet]:
-    __generate_data()
-
+def __get_data() -> List[DataSet]:
     duckdb_file_path = __get_file_path()
     duckdb_file_name_without_extension = os.path.splitext(os.path.basename(duckdb_file_path))[0]
 
@@ -61,7 +59,10 @@ def __generate_and_return_data() -> List[DataSet]:
     dataset: DataSet = {
         'name': f'join-micro-build',
         'setup_script': setup_script,
-        'config': {}
+        'files': [duckdb_file_path],
+        'config': {},
+        # the data is only generated once the dataset is run
+        'generate': __generate_data,
     }
 
     return [dataset]
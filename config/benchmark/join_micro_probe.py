@@ -23,6 +23,9 @@ JOIN_PROBE_SELECTIVITIES = [0.01, 0.1, 0.25, 0.5, 0.75, 1.0]
 
 class BenchmarkConfig:
     def __init__(self, selectivity: float, build_to_probe_ratio: float, duplicates: int, probe_cardinality: int):
+        self.selectivity = selectivity
+        self.build_to_probe_ratio = build_to_probe_ratio
+        self.duplicates = duplicates
         self.probe_size = probe_cardinality
         self.build_size = int(round(probe_cardinality / build_to_probe_ratio))
 
@@ -132,81 +135,84 @@ class TestBenchmarkConfig(unittest.TestCase):
 
 def get_join_micro_probe_benchmark() -> Benchmark:
 
-    datasets: List[DataSet] = __generate_and_return_data()
+    datasets: List[DataSet] = __get_data()
 
     queries = []
+    for config in __get_benchmark_configs():
+        (p_name, b_name), (p_query, b_query) = config.get_queries()
+        selectivity_int = round(100 * config.selectivity)
+        build_to_probe_ratio_int = round(config.build_to_probe_ratio)
+
+        query = {
+            'name': f'join_micro_probe_{build_to_probe_ratio_int}_{selectivity_int}_{config.duplicates}',
+            'index': len(queries),
+            'run_script': {
+                "duckdb": f"SELECT * FROM {p_name} as probe JOIN {b_name} as build ON probe.key = build.key;"
+            },
+            'config': {
+                'build_to_probe_ratio': config.build_to_probe_ratio,
+                'selectivity': config.selectivity,
+                'duplicates': config.duplicates,
+                'probe_cardinality': JOIN_PROBE_CARDINALITY,
+                'expected_cardinality': config.expected_cardinality,
+                'build_table_query': b_query,
+                'probe_table_query': p_query,
+            },
+        }
+        queries.append(query)
 
+    return {
+        'name': 'join_micro_probe',
+        'datasets': datasets,
+        'queries': queries
+    }
+
+
+def __get_benchmark_configs() -> List[BenchmarkConfig]:
+    configs = []
+    for selectivity in JOIN_PROBE_SELECTIVITIES:
+        for build_to_probe_ratio in JOIN_BUILD_TO_PROBE_RATIOS:
+            for duplicates in JOIN_BUILD_DUPS:
+                config = BenchmarkConfig(selectivity, build_to_probe_ratio, duplicates, JOIN_PROBE_CARDINALITY)
+                if config.expected_cardinality > 1_000_000_000:
+                    logger.warning(f"Expected result cardinality is too high: {config.expected_cardinality}. Skipping query.")
+                    continue
+                configs.append(config)
+    return configs
+
+
+def __generate_data():
     logger.info(f'Generating data for Join Micro Benchmark...')
     duckdb_file_path = __get_file_path()
 
     # only generate the data if the file does not exist
     if os.path.exists(duckdb_file_path):
         logger.info(f'File {duckdb_file_path} already exists, finished ...')
-        needs_to_generate = False
-    else:
-        logger.info(f'File {duckdb_file_path} does not exist, generating...')
-        needs_to_generate = True
+        return
+    logger.info(f'File {duckdb_file_path} does not exist, generating...')
 
-    n_total_queries = len(JOIN_PROBE_SELECTIVITIES) * len(JOIN_BUILD_TO_PROBE_RATIOS) * len(JOIN_BUILD_DUPS)
-    n_created_queries = 0
+    configs = __get_benchmark_configs()
 
     # set the seed for reproducibility
     con = duckdb.connect(duckdb_file_path)
     con.execute(f"SELECT setseed(0.42);")
-    for selectivity in JOIN_PROBE_SELECTIVITIES:
-        for build_to_probe_ratio in JOIN_BUILD_TO_PROBE_RATIOS:
-            for duplicates in JOIN_BUILD_DUPS:
-                selectivity_int = round(100 * selectivity)
-                build_to_probe_ratio_int = round(build_to_probe_ratio)
-                config = BenchmarkConfig(selectivity, build_to_probe_ratio, duplicates, JOIN_PROBE_CARDINALITY)
-                (p_name, b_name), (p_query, b_query) = config.get_queries()
-
-                expected_cardinality = config.expected_cardinality
-                if expected_cardinality > 1_000_000_000:
-                    logger.warning(f"Expected result cardinality is too high: {expected_cardinality}. Skipping query.")
-                    continue
+    for n_created_queries, config in enumerate(configs):
+        _, (p_query, b_query) = config.get_queries()
+        con.execute(p_query)
+        con.execute(b_query)
 
-                query = {
-                    'name': f'join_micro_probe_{build_to_probe_ratio_int}_{selectivity_int}_{duplicates}',
-                    'index': len(queries),
-                    'run_script': {
-                        "duckdb": f"SELECT * FROM {p_name} as probe JOIN {b_name} as build ON probe.key = build.key;"
-                    },
-                    'config': {
-                        'build_to_probe_ratio': build_to_probe_ratio,
-                        'selectivity': selectivity,
-                        'duplicates': duplicates,
-                        'probe_cardinality': JOIN_PROBE_CARDINALITY,
-                        'expected_cardinality': config.expected_cardinality,
-                        'build_table_query': b_query,
-                        'probe_table_query': p_query,
-                    },
-                }
-                queries.append(query)
-
-                if needs_to_generate:
-                    con.execute(p_query)
-                    con.execute(b_query)
-
-                if n_created_queries % 10 == 0:
-                    logger.info(f"Created {n_created_queries} out of {n_total_queries} queries.")
-                n_created_queries += 1
+        if n_created_queries % 10 == 0:
+            logger.info(f"Created {n_created_queries} out of {len(configs)} queries.")
 
     con.close()
 
-    return {
-        'name': 'join_micro_probe',
-        'datasets': datasets,
-        'queries': queries
-    }
-
 
 def __get_file_path() -> str:
     file_name =  os.path.join('join', f'micro_probe.db')
     return get_data_path(file_name)
 
 
-def __generate_and_return_data() -> List[DataSet]:
+def __get_data() -> List[DataSet]:
 
     duckdb_file_path = __get_file_path()
     duckdb_file_name_without_extension = os.path.splitext(os.path.basename(duckdb_file_path))[0]
@@ -219,7 +225,10 @@ def __generate_and_return_data() -> List[DataSet]:
     dataset: DataSet = {
         'name': f'join-micro-probe',
         'setup_script': setup_script,
-        'config': {}
+        'files': [duckdb_file_path],
+        'config': {},
+        # the data is only generated once the dataset is run
+        'generate': __generate_data,
     }
 
     return [dataset]
@@ -227,5 +236,5 @@ def __generate_and_return_data() -> List[DataSet]:
 
 if __name__ == "__main__":
     # This is just for testing the data generation
-    get_join_micro_probe_benchmark()
+    __generate_data()
     logger.info("Data generation finished.")
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+from functools import partial
 from typing import List
 
 import duckdb
@@ -21,7 +22,7 @@ TPC_DS_QUERIES: List[Query] = [
 
 def get_tpcds_benchmark(scale_factors: List[int]) -> Benchmark:
 
-    datasets: List[DataSet] = __generate_and_return_tpc_data(scale_factors)
+    datasets: List[DataSet] = __get_tpc_data(scale_factors)
 
     queries = TPC_DS_QUERIES
 
@@ -37,9 +38,7 @@ def __get_tpcds_file_path(sf: int) -> str:
     return get_data_path(file_name)
 
 
-def __generate_and_return_tpc_data(sfs: List[int]) -> List[DataSet]:
-    __generate_tpcds_data(sfs)
-
+def __get_tpc_data(sfs: List[int]) -> List[DataSet]:
     datasets: List[DataSet] = []
     for sf in sfs:
         duckdb_file_path = __get_tpcds_file_path(sf)
@@ -52,9 +51,12 @@ def __generate_and_return_tpc_data(sfs: List[int]) -> List[DataSet]:
         dataset: DataSet = {
             'name': f'tpcds-{sf}',
             'setup_script': setup_script,
+            'files': [duckdb_file_path],
             'config': {
                 'sf': sf
-            }
+            },
+            # the data is only generated once the dataset is run
+            'generate': partial(__generate_tpcds_data, [sf]),
         }
 
         datasets.append(dataset)
@@ -2,7 +2,7 @@ import os
 import sys
 
 from src.logger import get_logger
-from src.models import System
+from src.models import System, OperatorProfile
 from src.utils import get_tmp_path
 
 root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
@@ -10,24 +10,35 @@ sys.path.insert(0, root_directory)
 
 import json
 import os
-from typing import Optional, Tuple
+import re
+from functools import lru_cache
+from typing import Optional, Tuple, List
+
+import duckdb
 
 logger = get_logger(__name__)
 
 
-def get_profile_path_duckdb(thread: int) -> str:
-    return get_tmp_path(f'duckdb-profile-thread-{thread}.json')
+def get_profile_path_duckdb(thread: int, batch_index: Optional[int] = None) -> str:
+    if batch_index is None:
+        return get_tmp_path(f'duckdb-profile-thread-{thread}.json')
+    return get_tmp_path(f'duckdb-profile-thread-{thread}-query-{batch_index}.json')
 
 
-def get_duckdb_profile_script(thread: int) -> str:
-    path = get_profile_path_duckdb(thread)
+def get_duckdb_profile_script(thread: int, batch_index: Optional[int] = None) -> str:
+    path = get_profile_path_duckdb(thread, batch_index)
     string = f"PRAGMA enable_profiling = 'json';pragma profile_output='{path}';"
     return string
 
 
-def get_duckdb_runtime_and_cardinality(thread: int) -> Optional[Tuple[float, int]]:
+def get_duckdb_session_marker_script(marker_path: str) -> str:
+    # disable the profiler first so the marker query does not overwrite the profile of the benchmarked query
+    return f"PRAGMA disable_profiling; COPY (SELECT 1) TO '{marker_path}';"
+
+
+def get_duckdb_runtime_and_cardinality(thread: int, batch_index: Optional[int] = None) -> Optional[Tuple[float, int]]:
     # load the json
-    json_path = get_profile_path_duckdb(thread)
+    json_path = get_profile_path_duckdb(thread, batch_index)
 
     # if the query crashed, the file does not exist
     if not os.path.exists(json_path):
@@ -63,6 +74,89 @@ def get_duckdb_runtime_and_cardinality(thread: int) -> Optional[Tuple[float, int
     return runtime, cardinality
 
 
+def get_duckdb_set_option_script(name: str, value: any) -> str:
+    # e.g. memory_limit='4GB', preserve_insertion_order=False or temp_directory='/tmp/spill'
+    if isinstance(value, bool):
+        literal = 'true' if value else 'false'
+    elif isinstance(value, (int, float)):
+        literal = str(value)
+    else:
+        literal = "'" + str(value).replace("'", "''") + "'"
+    return f"SET {name} = {literal};"
+
+
+# floating point columns are compared with 10 significant digits, so that a different summation order of the systems
+# does not show up as a mismatch, all other columns are compared by their text
+CHECKSUM_NORMALIZED_COLUMNS = ("CASE WHEN typeof(COLUMNS(*)) IN ('DOUBLE', 'FLOAT') "
+                               "THEN printf('%.10g', COLUMNS(*)::VARCHAR::DOUBLE) ELSE COLUMNS(*)::VARCHAR END")
+
+
+@lru_cache(maxsize=None)
+def get_benchmark_query_text(benchmark: str, query_nr: int) -> Optional[str]:
+    # the queries of the benchmark extensions are the same in every version, so they are looked up once by the runner
+    try:
+        con = duckdb.connect()
+        con.execute(f"INSTALL {benchmark}; LOAD {benchmark};")
+        row = con.execute(f"SELECT query FROM {benchmark}_queries() WHERE query_nr = ?", [query_nr]).fetchone()
+        con.close()
+    except duckdb.Error as e:
+        logger.warning(f'Cannot look up the query {query_nr} of {benchmark}: {e}')
+        return None
+    return row[0] if row else None
+
+
+def get_duckdb_checksum_script(query: str, output_path: str) -> Optional[str]:
+    # the sum of the row hashes does not depend on the row order, and unlike xor, duplicate rows do not cancel out
+    query = query.strip().rstrip(';').strip()
+
+    # the benchmark pragmas cannot be used as a subquery, so the checksum runs over the query text of the pragma. We
+    # do not use the query function for that, older versions like v1.0.0 do not have it
+    pragma = re.fullmatch(r'PRAGMA\s+(tpch|tpcds)\((\d+)\)', query, re.IGNORECASE)
+    if pragma:
+        query = get_benchmark_query_text(pragma.group(1).lower(), int(pragma.group(2)))
+        if query is None:
+            return None
+        query = query.strip().rstrip(';').strip()
+
+    select = (f"SELECT count(*), sum(hash(result)::HUGEINT) "
+              f"FROM (SELECT {CHECKSUM_NORMALIZED_COLUMNS} FROM ({query})) result")
+    return f"COPY ({select}) TO '{output_path}' (HEADER false);"
+
+
+def flatten_duckdb_operator_tree(node: dict, operators: List[OperatorProfile], parent_id: Optional[int] = None,
+                                 depth: int = 0):
+    # newer versions prefix the fields with operator_ and report the extra info as a dict instead of a string
+    extra_info = node.get('extra_info', '')
+    operator_id = len(operators)
+    operators.append({
+        'operator_id': operator_id,
+        'parent_id': parent_id,
+        'depth': depth,
+        'operator_type': node.get('operator_type', node.get('name')),
+        'operator_name': node.get('operator_name', node.get('name')),
+        'timing': node.get('operator_timing', node.get('timing')),
+        'cardinality': node.get('operator_cardinality', node.get('cardinality')),
+        'extra_info': extra_info if isinstance(extra_info, str) else json.dumps(extra_info),
+    })
+    for child in node.get('children', []):
+        flatten_duckdb_operator_tree(child, operators, operator_id, depth + 1)
+
+
+def get_duckdb_operator_profile(thread: int, batch_index: Optional[int] = None) -> Optional[List[OperatorProfile]]:
+    json_path = get_profile_path_duckdb(thread, batch_index)
+    if not os.path.exists(json_path):
+        return None
+
+    with open(json_path, 'r') as f:
+        profile = json.load(f)
+
+    # the root only holds the query level metrics, the operators are its children
+    operators: List[OperatorProfile] = []
+    for child in profile.get('children', []):
+        flatten_duckdb_operator_tree(child, operators)
+    return operators
+
+
 DUCK_DB_BUILD_100: System = {
     'version': 'v1.0.0',
     'name': 'duckdb',
@@ -73,6 +167,7 @@ DUCK_DB_BUILD_100: System = {
             'github_url': 'https://github.com/duckdb/duckdb/commit/1f98600c2cf8722a6d2f2d805bb4af5e701319fc',
         },
     },
+    'prebuilt': None,
     'run_config': {
         'run_file': 'build/release/duckdb <',
         'run_file_relative_to_build': True,
@@ -81,6 +176,10 @@ DUCK_DB_BUILD_100: System = {
     'set_threads_command': lambda n_threads: f"PRAGMA threads = {n_threads};",
     'get_start_profiler_command': get_duckdb_profile_script,
     'get_metrics': get_duckdb_runtime_and_cardinality,
+    'get_session_marker_command': get_duckdb_session_marker_script,
+    'get_operator_profile': get_duckdb_operator_profile,
+    'get_checksum_command': get_duckdb_checksum_script,
+    'set_option_command': get_duckdb_set_option_script,
 }
 
 DUCK_DB_FACT_INTERSECTION_METRICS: System = {
@@ -183,9 +282,10 @@ DUCK_DB_NIGHTLY: System = {
     **DUCK_DB_BUILD_100,
     'version': 'nightly',
     'build_config': None,
+    'prebuilt': {'version': 'nightly'},
     'run_config': {
-        'run_file_relative_to_build': False,
-        'run_file': '/Users/paul/.local/bin/duckman run nightly <',
+        'run_file_relative_to_build': True,
+        'run_file': 'duckdb <',
     }
 }
 
@@ -205,11 +305,13 @@ DUCK_DB_NIGHTLY_BUILD_LOCALLY: System = {
 
 DUCK_DB_V100: System = {
     **DUCK_DB_BUILD_100,
-    'version': 'v1.0.0',
+    # the build of the same release is called v1.0.0, the versions have to be unique as they name the results
+    'version': 'v1.0.0-prebuilt',
     'build_config': None,
+    'prebuilt': {'version': 'v1.0.0'},
     'run_config': {
-        'run_file_relative_to_build': False,
-        'run_file': '/Users/paul/.local/bin/duckman run 1.0.0 <',
+        'run_file_relative_to_build': True,
+        'run_file': 'duckdb <',
     }
 }
 
@@ -217,9 +319,10 @@ DUCK_DB_V113: System = {
     **DUCK_DB_BUILD_100,
     'version': 'v1.1.3',
     'build_config': None,
+    'prebuilt': {'version': 'v1.1.3'},
     'run_config': {
-        'run_file_relative_to_build': False,
-        'run_file': '/Users/paul/.local/bin/duckman run 1.1.3 <',
+        'run_file_relative_to_build': True,
+        'run_file': 'duckdb <',
     }
 }
 
@@ -0,0 +1,184 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from typing import List, Optional, Tuple
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import RegistryEntry, System, SystemName
+from src.utils import SYSTEMS_PATH
+
+logger = get_logger(__name__)
+
+# prebuilt binaries, one directory per system name, version and hash of the binary
+REGISTRY_PATH = os.path.join(SYSTEMS_PATH, 'registry')
+REGISTRY_ENTRY_FILE_NAME = 'entry.json'
+
+# the hash prefix that names the directory of an entry
+SHA_PREFIX_LENGTH = 16
+
+
+def get_file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_duckdb_version(executable: str) -> Tuple[str, str]:
+    """
+    Runs PRAGMA version with the binary, which checks that it runs on this machine at all, and returns the library
+    version and the commit it was built from.
+    """
+    result = subprocess.run([executable, '-csv', '-noheader'], input='PRAGMA version;', capture_output=True,
+                            text=True, timeout=60)
+    if result.returncode != 0:
+        raise ValueError(f'{executable} failed with exit code {result.returncode}: {result.stderr.strip()}')
+    fields = result.stdout.strip().splitlines()[-1].split(',') if result.stdout.strip() else []
+    if len(fields) < 2:
+        raise ValueError(f'{executable} returned no version: {result.stdout.strip()}')
+    return fields[0], fields[1]
+
+
+def find_executable(directory: str, executable_name: str) -> str:
+    # release archives put the binary at the top level, build directories e.g. in build/release
+    candidates = []
+    for dir_path, _, file_names in os.walk(directory):
+        if executable_name in file_names:
+            candidates.append(os.path.join(dir_path, executable_name))
+    if not candidates:
+        raise ValueError(f'No file named {executable_name} in {directory}')
+    return min(candidates, key=lambda path: path.count(os.sep))
+
+
+def make_executable(path: str):
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def get_entry_path(name: SystemName, version: str, sha256: str) -> str:
+    return os.path.join(REGISTRY_PATH, name, version, sha256[:SHA_PREFIX_LENGTH])
+
+
+def import_binary(name: SystemName, version: str, source: str, executable_name: Optional[str] = None) -> RegistryEntry:
+    """
+    Imports a binary into the registry. The source can be the executable itself, a directory that contains it, or a
+    tar or zip archive of such a directory. The binary is only registered if it reports its version. Importing the same
+    binary twice keeps the first entry.
+    """
+    executable_name = executable_name or name
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if os.path.isdir(source):
+            executable = find_executable(source, executable_name)
+        elif os.path.isfile(source) and (zipfile.is_zipfile(source) or tarfile.is_tarfile(source)):
+            # detected by content, as nightlies are often downloaded without an extension
+            shutil.unpack_archive(source, tmp_dir, 'zip' if zipfile.is_zipfile(source) else 'tar')
+            executable = find_executable(tmp_dir, executable_name)
+            # zip archives do not keep the permissions of the files
+            make_executable(executable)
+        elif os.path.isfile(source):
+            # a downloaded binary is not executable yet, the copy is made executable instead of the source
+            executable = os.path.join(tmp_dir, executable_name)
+            shutil.copy2(source, executable)
+            make_executable(executable)
+        else:
+            raise ValueError(f'{source} does not exist')
+
+        library_version, source_id = get_duckdb_version(executable)
+        sha256 = get_file_sha256(executable)
+        entry_path = get_entry_path(name, version, sha256)
+        if os.path.exists(os.path.join(entry_path, REGISTRY_ENTRY_FILE_NAME)):
+            logger.info(f'{name} {version} with hash {sha256[:SHA_PREFIX_LENGTH]} is already registered')
+            return load_entry(entry_path)
+
+        entry: RegistryEntry = {
+            'name': name,
+            'version': version,
+            'sha256': sha256,
+            'library_version': library_version,
+            'source_id': source_id,
+            'executable': executable_name,
+            'source': os.path.abspath(source),
+            'imported': time.time(),
+        }
+        # the entry is written next to it and renamed, so a half copied binary is never registered
+        tmp_entry_path = f'{entry_path}.tmp-{os.getpid()}'
+        os.makedirs(tmp_entry_path, exist_ok=True)
+        shutil.copy2(executable, os.path.join(tmp_entry_path, executable_name))
+        with open(os.path.join(tmp_entry_path, REGISTRY_ENTRY_FILE_NAME), 'w') as f:
+            json.dump(entry, f, indent=4)
+        os.rename(tmp_entry_path, entry_path)
+
+    if version.startswith('v') and library_version != version:
+        logger.warning(f'{name} {version} reports the version {library_version}')
+    logger.info(f'Registered {name} {version} ({library_version}, {source_id}) at {entry_path}')
+    return entry
+
+
+def load_entry(entry_path: str) -> RegistryEntry:
+    with open(os.path.join(entry_path, REGISTRY_ENTRY_FILE_NAME), 'r') as f:
+        return json.load(f)
+
+
+def list_entries(name: Optional[SystemName] = None, version: Optional[str] = None) -> List[RegistryEntry]:
+    entries: List[RegistryEntry] = []
+    for names_dir in sorted(os.listdir(REGISTRY_PATH)) if os.path.exists(REGISTRY_PATH) else []:
+        if name is not None and names_dir != name:
+            continue
+        for version_dir in sorted(os.listdir(os.path.join(REGISTRY_PATH, names_dir))):
+            if version is not None and version_dir != version:
+                continue
+            for sha_dir in os.listdir(os.path.join(REGISTRY_PATH, names_dir, version_dir)):
+                entry_path = os.path.join(REGISTRY_PATH, names_dir, version_dir, sha_dir)
+                if os.path.exists(os.path.join(entry_path, REGISTRY_ENTRY_FILE_NAME)):
+                    entries.append(load_entry(entry_path))
+    return entries
+
+
+def find_entry(system: System) -> Optional[Tuple[RegistryEntry, str]]:
+    # the entry the system references and its directory, the newest import if the hash is not given
+    prebuilt = system['prebuilt']
+    entries = [
+        entry for entry in list_entries(system['name'], prebuilt['version'])
+        if entry['sha256'].startswith(prebuilt.get('sha256', ''))
+    ]
+    if not entries:
+        return None
+    entry = max(entries, key=lambda e: e['imported'])
+    return entry, get_entry_path(entry['name'], entry['version'], entry['sha256'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='The registry of prebuilt system binaries')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='import a binary, a directory or an archive')
+    import_parser.add_argument('name')
+    import_parser.add_argument('version')
+    import_parser.add_argument('source')
+    import_parser.add_argument('--executable', help='the file name of the binary, the system name by default')
+    subparsers.add_parser('list', help='list all registered binaries')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        entry = import_binary(args.name, args.version, args.source, args.executable)
+        print(f"{entry['name']} {entry['version']} {entry['sha256'][:SHA_PREFIX_LENGTH]} "
+              f"{entry['library_version']} {entry['source_id']}")
+    else:
+        for entry in list_entries():
+            print(f"{entry['name']} {entry['version']} {entry['sha256'][:SHA_PREFIX_LENGTH]} "
+                  f"{entry['library_version']} {entry['source_id']}")
+
+
+if __name__ == "__main__":
+    main()
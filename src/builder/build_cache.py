@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import System, BuildStep
+from src.utils import SYSTEMS_PATH
+
+logger = get_logger(__name__)
+
+# immutable builds, one directory per system, commit and build command
+ARTIFACTS_PATH = os.path.join(SYSTEMS_PATH, 'artifacts')
+ARTIFACT_MANIFEST_FILE_NAME = 'artifact.json'
+
+SHA_PATTERN = re.compile(r'[0-9a-f]{40}')
+
+# the commit and artifact directory of every built system, per system identifier
+_resolved_builds: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+_resolved_builds_lock = Lock()
+
+
+def parse_github_url(github_url: str) -> Tuple[str, Optional[str], Optional[str]]:
+    # the repository, and whether the url points to a commit, a branch or the default branch (None)
+    if '/commit/' in github_url:
+        repo, commit = github_url.split('/commit/')
+        return repo + '.git', 'commit', commit
+    if '/tree/' in github_url:
+        repo, branch = github_url.split('/tree/')
+        return repo + '.git', 'branch', branch
+    return github_url, None, None
+
+
+def resolve_local_commit(path: str, ref: str = 'HEAD') -> Optional[str]:
+    result = subprocess.run(['git', 'rev-parse', '--verify', f'{ref}^{{commit}}'], cwd=path, capture_output=True,
+                            text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def is_clean_checkout(path: str) -> bool:
+    # uncommitted changes are not part of the commit, so such a build cannot be cached by it
+    result = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=path, capture_output=True,
+                            text=True)
+    return result.returncode == 0 and not result.stdout.strip()
+
+
+def get_run_file(system: System) -> str:
+    # the run file can contain the redirection of the script, e.g. 'build/release/duckdb <'
+    return system['run_config']['run_file'].split()[0]
+
+
+def get_build_key(system: System) -> str:
+    # everything that changes the binary of a commit, the parts that are not set keep the keys of older builds
+    build_config = system['build_config']
+    key = build_config['build_command']
+    if build_config.get('configure_command'):
+        key += '\n' + build_config['configure_command']
+    if build_config.get('env'):
+        key += '\n' + json.dumps(build_config['env'], sort_keys=True)
+    if build_config.get('pgo') is not None:
+        key += '\npgo: ' + json.dumps(build_config['pgo'], sort_keys=True, default=str)
+    return key
+
+
+def get_artifact_path(system: System, commit: str) -> str:
+    build_command_hash = hashlib.sha256(get_build_key(system).encode()).hexdigest()[:12]
+    return os.path.join(ARTIFACTS_PATH, system['name'], f'{commit}-{build_command_hash}')
+
+
+def has_artifact(artifact_path: str) -> bool:
+    # the manifest is written last, so a build that crashed while being stored is not used
+    return os.path.exists(os.path.join(artifact_path, ARTIFACT_MANIFEST_FILE_NAME))
+
+
+def load_artifact_manifest(artifact_path: str) -> dict:
+    with open(os.path.join(artifact_path, ARTIFACT_MANIFEST_FILE_NAME), 'r') as f:
+        return json.load(f)
+
+
+def store_artifact(system: System, commit: str, build_dir: str, steps: List[BuildStep]) -> Optional[str]:
+    """
+    Copies the run file of a finished build into its artifact directory. The copy is made in a temporary directory
+    and renamed, so concurrent builds of the same commit cannot produce a half written artifact.
+    """
+    artifact_path = get_artifact_path(system, commit)
+    run_file = get_run_file(system)
+    source = os.path.join(build_dir, run_file)
+    if not os.path.exists(source):
+        logger.error(f'The build of {system["name"]}-{system["version"]} did not produce {source}')
+        return None
+
+    tmp_path = f'{artifact_path}.tmp-{os.getpid()}-{time.monotonic_ns()}'
+    os.makedirs(os.path.dirname(os.path.join(tmp_path, run_file)), exist_ok=True)
+    shutil.copy2(source, os.path.join(tmp_path, run_file))
+    manifest = {
+        'system': system['name'],
+        'version': system['version'],
+        'commit': commit,
+        'build_command': system['build_config']['build_command'],
+        'env': system['build_config'].get('env', {}),
+        'source': system['build_config']['location'],
+        'steps': steps,
+        'created': time.time(),
+    }
+    with open(os.path.join(tmp_path, ARTIFACT_MANIFEST_FILE_NAME), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    try:
+        os.rename(tmp_path, artifact_path)
+    except OSError:
+        # another build stored the same artifact in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return artifact_path
+
+
+def register_build(system_identifier: str, commit: Optional[str], artifact_path: Optional[str]):
+    with _resolved_builds_lock:
+        _resolved_builds[system_identifier] = (commit, artifact_path)
+
+
+def get_resolved_build(system_identifier: str) -> Tuple[Optional[str], Optional[str]]:
+    with _resolved_builds_lock:
+        return _resolved_builds.get(system_identifier, (None, None))
@@ -0,0 +1,113 @@
+import json
+import os
+import shlex
+import shutil
+import sys
+from typing import Dict, List, Optional, Union
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import BuildStep, BuildStepName
+from src.runner.process_runner import run_command
+from src.utils import SYSTEMS_PATH, SafeEncoder
+
+logger = get_logger(__name__)
+
+# the logs and the manifest of the last build of every system
+BUILD_LOGS_PATH = os.path.join(SYSTEMS_PATH, 'builds')
+BUILD_MANIFEST_FILE_NAME = 'build.json'
+
+# lines of the log of a failed step that are shown
+FAILED_LOG_LINES = 20
+
+
+def get_build_log_path(system_identifier: str) -> str:
+    return os.path.join(BUILD_LOGS_PATH, system_identifier)
+
+
+def get_log_tail(log_path: str, n_lines: int = FAILED_LOG_LINES) -> str:
+    if not os.path.exists(log_path):
+        return ''
+    with open(log_path, 'r', errors='replace') as f:
+        return ''.join(f.readlines()[-n_lines:])
+
+
+class BuildLog:
+    """
+    Runs the commands of a build with an explicit working directory, so builds can run next to each other and next to
+    the experiments. The output of every step goes to its own log file, and the wall time, cpu time and peak memory of
+    every step are recorded.
+    """
+
+    def __init__(self, system_identifier: str):
+        self.system_identifier = system_identifier
+        self.path = get_build_log_path(system_identifier)
+        # the logs of an earlier build would be mixed up with this one
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self.steps: Dict[BuildStepName, BuildStep] = {}
+
+    def run(self, step: BuildStepName, command: Union[str, List[str]], cwd: Optional[str] = None,
+            env: Optional[dict] = None) -> bool:
+        command = shlex.join(command) if isinstance(command, list) else command
+        log_path = os.path.join(self.path, f'{step}.log')
+        with open(log_path, 'a') as f:
+            f.write(f'$ cd {cwd or os.getcwd()} && {command}\n')
+
+        result = run_command(command, None, env_vars=env, sample_usage=True, cwd=cwd, output_path=log_path)
+        usage = result['resource_usage']
+        success = result['return_code'] == 0
+        self.add_step(step, command, success, usage['wall_time'], usage['user_time'] + usage['system_time'],
+                      usage['peak_rss_bytes'], log_path)
+
+        if not success:
+            logger.error(f'{step} of {self.system_identifier} failed with exit code {result["return_code"]}, see '
+                         f'{log_path}:\n{get_log_tail(log_path)}')
+        return success
+
+    def add_step(self, step: BuildStepName, command: str, success: bool, wall_time: float, cpu_time: float = 0.0,
+                 peak_rss_bytes: int = 0, log_path: Optional[str] = None):
+        # a step can consist of several commands, e.g. fetching a commit that is not on a branch
+        record = self.steps.setdefault(step, {
+            'name': step,
+            'commands': [],
+            'success': True,
+            'wall_time': 0.0,
+            'cpu_time': 0.0,
+            'peak_rss_bytes': 0,
+            'log_path': log_path or os.path.join(self.path, f'{step}.log'),
+        })
+        record['commands'].append(command)
+        record['success'] = success
+        record['wall_time'] += wall_time
+        record['cpu_time'] += cpu_time
+        record['peak_rss_bytes'] = max(record['peak_rss_bytes'], peak_rss_bytes)
+
+    def get_steps(self) -> List[BuildStep]:
+        return list(self.steps.values())
+
+    def write_manifest(self, manifest: dict):
+        with open(os.path.join(self.path, BUILD_MANIFEST_FILE_NAME), 'w') as f:
+            json.dump(manifest, f, indent=4, cls=SafeEncoder)
+
+
+def load_build_manifest(system_identifier: str) -> Optional[dict]:
+    path = os.path.join(get_build_log_path(system_identifier), BUILD_MANIFEST_FILE_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_build_times() -> Dict[str, float]:
+    # the seconds of the last successful build of every system that was built from source
+    build_times: Dict[str, float] = {}
+    if not os.path.exists(BUILD_LOGS_PATH):
+        return build_times
+    for system_identifier in os.listdir(BUILD_LOGS_PATH):
+        manifest = load_build_manifest(system_identifier)
+        if manifest is not None and manifest.get('success') and not manifest.get('cached'):
+            build_times[system_identifier] = manifest['build_time']
+    return build_times
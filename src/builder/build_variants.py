@@ -0,0 +1,63 @@
+import os
+import sys
+from typing import Dict, List
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.models import System, BuildVariant
+
+# cmake and most Makefiles read the flags of a new build directory from these variables, so a checkout is cleaned
+# before it is built with other flags
+COMPILE_FLAG_VARIABLES = ['CFLAGS', 'CXXFLAGS']
+LINK_FLAG_VARIABLES = ['LDFLAGS']
+
+
+def add_flags(env: Dict[str, str], flags: List[str], link_flags: List[str]) -> Dict[str, str]:
+    # the flags are appended, so a variant keeps the flags of the build config
+    env = dict(env)
+    for variables, new_flags in [(COMPILE_FLAG_VARIABLES, flags), (LINK_FLAG_VARIABLES, link_flags)]:
+        if not new_flags:
+            continue
+        for variable in variables:
+            env[variable] = ' '.join([env[variable], *new_flags] if env.get(variable) else new_flags)
+    return env
+
+
+def get_variant_env(env: Dict[str, str], variant: BuildVariant) -> Dict[str, str]:
+    flags = list(variant.get('flags', []))
+    link_flags = list(variant.get('link_flags', []))
+    if variant.get('lto', False):
+        flags.append('-flto')
+        link_flags.append('-flto')
+    return add_flags({**env, **variant.get('env', {})}, flags, link_flags)
+
+
+def expand_build_variants(systems: List[System]) -> List[System]:
+    """
+    Replaces every system with build variants by one system per variant. The version of a variant is the version of
+    the system with the name of the variant appended, so every variant gets its own checkout, build and artifact.
+    """
+    expanded: List[System] = []
+    for system in systems:
+        build_config = system.get('build_config')
+        if build_config is None or not build_config.get('variants'):
+            expanded.append(system)
+            continue
+
+        for variant in build_config['variants']:
+            variant_build_config = {key: value for key, value in build_config.items() if key != 'variants'}
+            variant_build_config['env'] = get_variant_env(build_config.get('env', {}), variant)
+            if variant.get('pgo') is not None:
+                # the checkout is cleaned between the instrumented and the optimized build
+                if build_config['location']['location'] != 'github':
+                    raise ValueError(f"Variant {variant['name']} of {system['name']}-{system['version']} uses pgo, "
+                                     f"which is only supported for systems built from github")
+                variant_build_config['pgo'] = variant['pgo']
+            expanded.append({
+                **system,
+                'version': f"{system['version']}-{variant['name']}",
+                'variant': variant['name'],
+                'build_config': variant_build_config,
+            })
+    return expanded
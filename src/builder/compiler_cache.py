@@ -0,0 +1,109 @@
+import os
+import shlex
+import shutil
+import sys
+from typing import Dict, List, Optional, TypedDict
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.utils import SYSTEMS_PATH
+
+logger = get_logger(__name__)
+
+# shared by the checkouts of all systems, which mostly compile the same files
+COMPILER_CACHE_PATH = os.path.join(SYSTEMS_PATH, '.compiler-cache')
+
+# the statistics of ccache's stats log that count as a hit or a miss
+CCACHE_HITS = ('direct_cache_hit', 'preprocessed_cache_hit')
+CCACHE_MISSES = ('cache_miss',)
+
+
+class CompilerCacheStats(TypedDict):
+    launcher: str
+    hits: int
+    misses: int
+    hit_rate: Optional[float]  # None if nothing was compiled
+
+
+def get_compiler_launcher() -> Optional[str]:
+    for launcher in ['ccache', 'sccache']:
+        if shutil.which(launcher) is not None:
+            return launcher
+    return None
+
+
+def get_stats_log_path(system_identifier: str) -> str:
+    return os.path.join(COMPILER_CACHE_PATH, 'stats', f'{system_identifier}.log')
+
+
+def get_compiler_cache_env(system_identifier: str) -> Dict[str, str]:
+    """
+    The environment variables that make cmake compile through ccache or sccache with one cache for all systems. The
+    paths are hashed relative to the systems directory, so a file compiled in one checkout is a hit in all others.
+    """
+    launcher = get_compiler_launcher()
+    if launcher is None:
+        return {}
+
+    env = {
+        'CMAKE_C_COMPILER_LAUNCHER': launcher,
+        'CMAKE_CXX_COMPILER_LAUNCHER': launcher,
+    }
+    if launcher == 'ccache':
+        stats_log_path = get_stats_log_path(system_identifier)
+        os.makedirs(os.path.dirname(stats_log_path), exist_ok=True)
+        # the stats log only counts the compilations of this build, the global stats mix all concurrent builds
+        if os.path.exists(stats_log_path):
+            os.remove(stats_log_path)
+        env.update({
+            'CCACHE_DIR': os.path.join(COMPILER_CACHE_PATH, 'ccache'),
+            'CCACHE_BASEDIR': SYSTEMS_PATH,
+            'CCACHE_NOHASHDIR': '1',
+            'CCACHE_STATSLOG': stats_log_path,
+        })
+    else:
+        env['SCCACHE_DIR'] = os.path.join(COMPILER_CACHE_PATH, 'sccache')
+    return env
+
+
+def get_compiler_launcher_definitions() -> List[str]:
+    # cmake only reads the launcher from the environment when it configures a new build directory
+    launcher = get_compiler_launcher()
+    if launcher is None:
+        return []
+    return [f'-DCMAKE_C_COMPILER_LAUNCHER={launcher}', f'-DCMAKE_CXX_COMPILER_LAUNCHER={launcher}']
+
+
+def get_configure_command(configure_command: str) -> str:
+    # a cmake command gets the launcher as definitions, so a build directory that was configured before uses it too
+    definitions = get_compiler_launcher_definitions()
+    if not definitions or os.path.basename(shlex.split(configure_command)[0]) != 'cmake':
+        return configure_command
+    return ' '.join([configure_command, *definitions])
+
+
+def get_compiler_cache_stats(system_identifier: str) -> Optional[CompilerCacheStats]:
+    # sccache has no statistics per build, its global statistics are shown by sccache --show-stats
+    launcher = get_compiler_launcher()
+    stats_log_path = get_stats_log_path(system_identifier)
+    if launcher != 'ccache' or not os.path.exists(stats_log_path):
+        return None
+
+    hits, misses = 0, 0
+    with open(stats_log_path, 'r') as f:
+        for line in f:
+            statistic = line.strip()
+            if statistic in CCACHE_HITS:
+                hits += 1
+            elif statistic in CCACHE_MISSES:
+                misses += 1
+
+    total = hits + misses
+    return {
+        'launcher': launcher,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total > 0 else None,
+    }
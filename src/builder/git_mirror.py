@@ -0,0 +1,150 @@
+import hashlib
+import os
+import re
+import subprocess
+import sys
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.builder.build_log import BuildLog
+from src.logger import get_logger
+from src.utils import SYSTEMS_PATH
+
+logger = get_logger(__name__)
+
+# one bare repository per upstream repository, the forks of it are remotes of the same mirror
+MIRRORS_PATH = os.path.join(SYSTEMS_PATH, '.mirrors')
+
+# the mirrors fetched in this run, a mirror is fetched at most once per run
+_fetched_mirrors: Set[str] = set()
+_mirror_locks: Dict[str, Lock] = {}
+_mirror_locks_lock = Lock()
+
+
+def get_mirror_lock(mirror_path: str) -> Lock:
+    # fetches and worktree changes of the same mirror cannot run concurrently
+    with _mirror_locks_lock:
+        return _mirror_locks.setdefault(mirror_path, Lock())
+
+
+def run_git(args: List[str], cwd: Optional[str] = None, check: bool = True) -> subprocess.CompletedProcess:
+    result = subprocess.run(['git', *args], cwd=cwd, capture_output=True, text=True)
+    if check and result.returncode != 0:
+        logger.warning(f'git {" ".join(args)} failed with exit code {result.returncode} in {cwd}: '
+                       f'{result.stderr.strip()}')
+    return result
+
+
+def normalize_url(repository_url: str) -> str:
+    # the root url of a repository has no .git suffix, the urls of its commits and branches have one
+    return repository_url.rstrip('/').removesuffix('.git')
+
+
+def get_mirror_and_remote(repository_url: str) -> Tuple[str, str]:
+    """
+    The mirror of a repository and the name of its remote in it. The mirror is named after the repository and the
+    remote after its owner, e.g. https://github.com/gropaul/duckdb.git is the remote gropaul of the mirror duckdb.
+    """
+    parts = normalize_url(repository_url).split('/')
+    repository_name = re.sub(r'[^A-Za-z0-9_.-]', '-', parts[-1])
+    owner = re.sub(r'[^A-Za-z0-9_.-]', '-', parts[-2]) if len(parts) > 1 and parts[-2] else 'origin'
+    return os.path.join(MIRRORS_PATH, f'{repository_name}.git'), owner
+
+
+def get_remote_url(mirror_path: str, remote: str) -> Optional[str]:
+    result = run_git(['remote', 'get-url', remote], cwd=mirror_path, check=False)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def add_remote(repository_url: str) -> Tuple[str, str]:
+    """
+    Creates the mirror of the repository if it does not exist yet and adds the repository as a remote. Nothing is
+    fetched, returns the mirror path and the remote.
+    """
+    mirror_path, remote = get_mirror_and_remote(repository_url)
+    with get_mirror_lock(mirror_path):
+        if not os.path.exists(mirror_path):
+            logger.info(f'Creating the mirror {mirror_path}')
+            os.makedirs(MIRRORS_PATH, exist_ok=True)
+            run_git(['init', '--bare', '--quiet', mirror_path])
+
+        remote_url = get_remote_url(mirror_path, remote)
+        if remote_url is not None and normalize_url(remote_url) != normalize_url(repository_url):
+            # the same owner on another host, or another repository with the same name
+            remote = f'{remote}-{hashlib.sha256(repository_url.encode()).hexdigest()[:8]}'
+            remote_url = get_remote_url(mirror_path, remote)
+        if remote_url is None:
+            run_git(['remote', 'add', remote, repository_url], cwd=mirror_path)
+            # every remote keeps its branches apart, the tags of the forks would overwrite each other
+            run_git(['config', f'remote.{remote}.fetch', f'+refs/heads/*:refs/remotes/{remote}/*'], cwd=mirror_path)
+            run_git(['config', f'remote.{remote}.tagOpt', '--no-tags'], cwd=mirror_path)
+    return mirror_path, remote
+
+
+def fetch_mirror(mirror_path: str, build_log: BuildLog):
+    # fetches all remotes at once, so the forks of a repository only download the objects they do not share
+    with get_mirror_lock(mirror_path):
+        if mirror_path in _fetched_mirrors:
+            return
+        logger.info(f'Fetching all remotes of {mirror_path}')
+        build_log.run('fetch', ['git', 'fetch', '--all', '--prune'], cwd=mirror_path)
+        _fetched_mirrors.add(mirror_path)
+
+
+def fetch_commit(mirror_path: str, remote: str, commit: str, build_log: BuildLog):
+    # commits that are not on a branch, e.g. of a closed pull request, are only fetched by their sha
+    with get_mirror_lock(mirror_path):
+        build_log.run('fetch', ['git', 'fetch', remote, commit], cwd=mirror_path)
+
+
+def resolve_mirror_commit(mirror_path: str, ref: str) -> Optional[str]:
+    result = run_git(['rev-parse', '--verify', '--quiet', f'{ref}^{{commit}}'], cwd=mirror_path, check=False)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def resolve_ref(mirror_path: str, remote: str, kind: Optional[str], ref: Optional[str]) -> Optional[str]:
+    # the commit a url points to in the fetched mirror, for when the remote could not be asked directly
+    if kind == 'commit':
+        return resolve_mirror_commit(mirror_path, ref)
+    if kind == 'branch':
+        return resolve_mirror_commit(mirror_path, f'refs/remotes/{remote}/{ref}')
+    for default_branch in ['HEAD', 'main', 'master']:
+        commit = resolve_mirror_commit(mirror_path, f'refs/remotes/{remote}/{default_branch}')
+        if commit is not None:
+            return commit
+    return None
+
+
+def is_worktree(path: str) -> bool:
+    # a worktree has a .git file that points into the mirror, a full clone a .git directory
+    return os.path.isfile(os.path.join(path, '.git'))
+
+
+def checkout_worktree(mirror_path: str, path: str, commit: str, build_log: BuildLog) -> bool:
+    """
+    Checks out the commit into a worktree of the mirror at path. An existing worktree is moved to the commit, so the
+    files of its last build are reused by the incremental build. Any other directory at path, e.g. a full clone of an
+    older version, is moved to <path>.pre-worktree, as it can contain changes that were never pushed.
+    """
+    if os.path.exists(path) and not is_worktree(path) and os.listdir(path):
+        moved_path = f'{path}.pre-worktree'
+        if os.path.exists(moved_path):
+            logger.error(f'{path} is not a worktree of {mirror_path} and {moved_path} already exists -> move or '
+                         f'delete one of them')
+            return False
+        logger.warning(f'{path} is not a worktree of {mirror_path} -> moving it to {moved_path}')
+        os.rename(path, moved_path)
+    elif os.path.exists(path) and not os.listdir(path):
+        os.rmdir(path)
+
+    if is_worktree(path):
+        return build_log.run('checkout', ['git', '-c', 'advice.detachedHead=false', 'checkout', '--detach', commit],
+                             cwd=path)
+
+    with get_mirror_lock(mirror_path):
+        # worktrees whose directories were deleted are still registered in the mirror
+        run_git(['worktree', 'prune'], cwd=mirror_path)
+        return build_log.run('checkout', ['git', 'worktree', 'add', '--detach', path, commit], cwd=mirror_path)
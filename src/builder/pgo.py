@@ -0,0 +1,126 @@
+import glob
+import os
+import shlex
+import shutil
+import sys
+import time
+from threading import Lock
+from typing import Dict
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.builder.build_cache import register_build
+from src.builder.build_log import BuildLog
+from src.builder.build_variants import add_flags
+from src.builder.compiler_cache import get_configure_command
+from src.logger import get_logger
+from src.models import System, RunConfig
+from src.utils import SYSTEMS_PATH, EXPERIMENT_RUNS_PATH
+
+logger = get_logger(__name__)
+
+# the profiles of the training runs, one directory per system
+PGO_PROFILES_PATH = os.path.join(SYSTEMS_PATH, 'pgo-profiles')
+
+DEFAULT_TRAINING_TIMEOUT = 600
+
+# clang writes raw profiles that have to be merged, gcc writes one .gcda file per object that is used as is
+CLANG_PROFILE_PATTERN = '*.profraw'
+GCC_PROFILE_PATTERN = '**/*.gcda'
+
+# the trainings run one after another, as the runner writes its scripts to the same temporary files in every run
+_training_lock = Lock()
+
+
+def get_profile_path(system_identifier: str) -> str:
+    return os.path.join(PGO_PROFILES_PATH, system_identifier)
+
+
+def get_instrumented_env(env: Dict[str, str], profile_path: str) -> Dict[str, str]:
+    # the counters are updated atomically, as the training queries run on several threads
+    flag = f'-fprofile-generate={profile_path}'
+    return add_flags(env, [flag, '-fprofile-update=atomic'], [flag])
+
+
+def get_optimized_env(env: Dict[str, str], profile_path: str) -> Dict[str, str]:
+    # gcc and clang both read the profiles of a directory, clang from its default.profdata
+    flag = f'-fprofile-use={profile_path}'
+    return add_flags(env, [flag], [flag])
+
+
+def run_training(system: System, build_log: BuildLog, commit: str, build_dir: str):
+    # imported here, as the runner builds its systems with the builder
+    from src.runner.experiment_prepper import create_experiments_from_config
+    from src.runner.experiment_runner import run_experiments
+
+    # the training gets its own version, so its runtimes are not mistaken for the ones of the optimized build
+    training_system: System = {**system, 'version': f"{system['version']}-instrumented"}
+    training_identifier = f"{training_system['name']}-{training_system['version']}"
+    register_build(training_identifier, commit, build_dir)
+
+    pgo = system['build_config']['pgo']
+    config: RunConfig = {
+        'name': f'pgo-training-{training_identifier}',
+        'systems': [training_system],
+        'benchmarks': pgo['benchmark'],
+        'system_settings': pgo.get('system_settings', [{'n_threads': 1}]),
+        'run_settings': {
+            'n_runs': 1,
+            'warmup_runs': 0,
+            'timeout': pgo.get('timeout', DEFAULT_TRAINING_TIMEOUT),
+            'prune_timeouts': False,
+        },
+    }
+    experiments, settings = create_experiments_from_config(config)
+    logger.info(f"Training {training_identifier} with {len(experiments)} experiments")
+
+    with _training_lock:
+        start = time.monotonic()
+        run_experiments(experiments, settings)
+    build_log.add_step('train', f"{config['name']}: {len(experiments)} experiments", True, time.monotonic() - start,
+                       log_path=os.path.join(EXPERIMENT_RUNS_PATH, config['name']))
+
+
+def merge_profiles(profile_path: str, build_log: BuildLog) -> bool:
+    if glob.glob(os.path.join(profile_path, GCC_PROFILE_PATTERN), recursive=True):
+        return True
+    if not glob.glob(os.path.join(profile_path, CLANG_PROFILE_PATTERN)):
+        logger.error(f'The training wrote no profiles to {profile_path}, was the build instrumented?')
+        return False
+    if shutil.which('llvm-profdata') is None:
+        logger.error('The profiles of clang have to be merged with llvm-profdata, which is not installed')
+        return False
+    output_path = os.path.join(profile_path, 'default.profdata')
+    return build_log.run('merge-profiles', f'llvm-profdata merge -output={shlex.quote(output_path)} '
+                                           f'{shlex.quote(profile_path)}/{CLANG_PROFILE_PATTERN}')
+
+
+def train_instrumented_build(system: System, build_log: BuildLog, commit: str, build_dir: str,
+                             env: Dict[str, str]) -> bool:
+    """
+    The first half of a pgo build: compiles the system with instrumentation, runs the training benchmark with it and
+    merges the profiles. The checkout is cleaned before and afterwards, as its build directory keeps the flags it was
+    configured with. The optimized build is then compiled with get_optimized_env.
+    """
+    system_identifier = f"{system['name']}-{system['version']}"
+    build_config = system['build_config']
+    profile_path = get_profile_path(system_identifier)
+    shutil.rmtree(profile_path, ignore_errors=True)
+    os.makedirs(profile_path)
+
+    # the build directory of an earlier build keeps its flags, e.g. of the last optimized build
+    if not build_log.run('clean', ['git', 'clean', '-fdxq'], cwd=build_dir):
+        return False
+    instrumented_env = get_instrumented_env(env, profile_path)
+    if build_config.get('configure_command') and \
+            not build_log.run('configure', get_configure_command(build_config['configure_command']), cwd=build_dir,
+                              env=instrumented_env):
+        return False
+    if not build_log.run('compile-instrumented', build_config['build_command'], cwd=build_dir, env=instrumented_env):
+        return False
+
+    run_training(system, build_log, commit, build_dir)
+    if not merge_profiles(profile_path, build_log):
+        return False
+    return build_log.run('clean', ['git', 'clean', '-fdxq'], cwd=build_dir)
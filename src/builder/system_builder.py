@@ -1,11 +1,28 @@
+import json
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
 import psutil
 
+from src.builder.build_cache import parse_github_url, resolve_local_commit, is_clean_checkout, SHA_PATTERN, \
+    get_artifact_path, has_artifact, store_artifact, register_build, get_resolved_build, load_artifact_manifest, \
+    get_build_key
+from src.builder.binary_registry import find_entry
+from src.builder.build_log import BuildLog
+from src.builder.build_variants import expand_build_variants
+from src.builder.git_mirror import add_remote, fetch_mirror, fetch_commit, resolve_ref, checkout_worktree, \
+    get_mirror_and_remote
+from src.builder.pgo import train_instrumented_build, get_optimized_env, get_profile_path
+from src.builder.compiler_cache import get_compiler_cache_env, get_compiler_cache_stats, CompilerCacheStats, \
+    get_compiler_launcher, get_configure_command
 from src.logger import get_logger
-from src.models import System, SystemBuildConfig
+from src.models import System, SystemBuildConfig, ResourceUsage, BuildStep
+from src.runner.cpu_topology import get_pinned_command
+from src.runner.perf_counters import get_perf_command, get_perf_output_path
+from src.runner.process_runner import run_command
 from src.utils import get_system_path, get_tmp_path
 
 root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
@@ -13,112 +30,281 @@ sys.path.insert(0, root_directory)
 
 import os
 import subprocess
-from typing import Literal, Union, List
+from typing import Literal, Union, List, Optional, Tuple, TypedDict
 
 logger = get_logger(__name__)
 
-def build_systems(systems: Union[System, List[System]]):
-    if isinstance(systems, list):
-        for system in systems:
-            build_system_if_necessary(system)
-    else:
-        build_system_if_necessary(systems)
-
-
-def clone_or_update_repo(repository_url: str, path: str):
-    clone_command = f'git clone "{repository_url}" "{path}"'
-
-    if not os.path.exists(path):
-        logger.info('Directory does not exist yet, cloning repo')
-        os.system(clone_command)
-    else:
-        logger.info('Directory already exists, fetching the latest changes')
-        # get path before changing directory
-        path_before = os.getcwd()
-        # perform a pull
-        os.chdir(path)
-        os.system('git fetch')
-        os.system('git pull')
-        # change back to the original directory
-        os.chdir(path_before)
-
-def clone_repo_and_checkout_commit(github_url: str, version_dir: str):
-
-    # if version dir is empty, remove it
-    if os.path.exists(version_dir) and len(os.listdir(version_dir)) == 0:
-        logger.warning(f'Empty directory found at {version_dir} -> removing it')
-        os.rmdir(version_dir)
-
-    logger.info(f'Getting source code from {github_url} to {version_dir}')
-    if '/commit/' in github_url:
-
-        logger.info('The url points to a commit, checking out the commit')
-        splitted = github_url.split('/commit/')
-        repo = splitted[0] + '.git'
-        commit = splitted[1]
 
-        clone_or_update_repo(repo, version_dir)
-
-        path_before = os.getcwd()
-
-        os.chdir(version_dir)
-        logger.info(f'Checking out commit: {commit}')
-        checkout_command = f'git checkout {commit}'
-        os.system(checkout_command)
-        os.chdir(path_before)
+class BuildReport(TypedDict):
+    system: str
+    commit: Optional[str]  # None if the source is not a git repository
+    success: bool
+    cached: bool  # True if the artifact of the commit already existed
+    build_time: float  # seconds, including the checkout
+    compiler_cache: Optional[CompilerCacheStats]  # None without ccache
+    steps: List[BuildStep]  # empty if the build was cached
+
+
+# builds at the same time if the run settings do not set max_parallel_builds, each gets an equal share of the cores
+# as its compile jobs
+MAX_PARALLEL_BUILDS = 4
+
+
+def check_system_identifiers(systems: List[System]):
+    # the identifier names the checkout, the build and the results, so two systems with it have to be built the same
+    sources = {}
+    for system in systems:
+        system_identifier = get_system_identifier(system)
+        source = (system.get('build_config'), system.get('prebuilt'))
+        if sources.setdefault(system_identifier, source) != source:
+            raise ValueError(f'Two systems named {system_identifier} are built differently -> give them different '
+                             f'versions')
+
+
+def build_systems(systems: Union[System, List[System]], max_parallel_builds: int = MAX_PARALLEL_BUILDS):
+    systems = expand_build_variants(systems if isinstance(systems, list) else [systems])
+    check_system_identifiers(systems)
+    # systems that only differ in their run settings share their checkout and build
+    unique_systems = list({get_system_identifier(system): system for system in systems}.values())
+    to_build = [system for system in unique_systems
+                if system.get('build_config') is not None and system.get('prebuilt') is None]
+    for system in unique_systems:
+        if system.get('prebuilt') is not None:
+            register_prebuilt_binary(system)
+        elif system.get('build_config') is None:
+            logger.info(f'No build config found for system {system["name"]} {system["version"]} -> skipping build')
+    if not to_build:
+        return
 
+    # the forks are added to the mirrors first, so the first fetch of a mirror gets the commits of all of them
+    for system in to_build:
+        if system['build_config']['location']['location'] == 'github':
+            add_remote(parse_github_url(system['build_config']['location']['github_url'])[0])
+
+    n_parallel = max(1, min(max_parallel_builds, len(to_build)))
+    n_jobs = max(1, (os.cpu_count() or 1) // n_parallel)
+    logger.info(f'Building {len(to_build)} systems, {n_parallel} at a time with {n_jobs} jobs each')
+
+    with ThreadPoolExecutor(max_workers=n_parallel) as executor:
+        reports = list(executor.map(lambda system: build_system_if_necessary(system, n_jobs), to_build))
+
+    for report in reports:
+        stats = report['compiler_cache']
+        hit_rate = f"{stats['hit_rate'] * 100:.1f}%" if stats and stats['hit_rate'] is not None else 'n/a'
+        status = 'cached' if report['cached'] else 'ok' if report['success'] else 'FAILED'
+        steps = ', '.join(f"{step['name']} {step['wall_time']:.1f}s" for step in report['steps'])
+        peak_rss = max((step['peak_rss_bytes'] for step in report['steps']), default=0) / 1024 ** 3
+        logger.info(f"Build of {report['system']} at {report['commit']}: {status} in {report['build_time']:.1f}s "
+                    f"({steps or 'no steps'}), peak memory {peak_rss:.2f} GB, compiler cache hit rate {hit_rate}")
+
+
+def register_prebuilt_binary(system: System):
+    system_identifier = get_system_identifier(system)
+    found = find_entry(system)
+    if found is None:
+        logger.error(f'The registry has no binary of {system["name"]} {system["prebuilt"]["version"]} -> import it '
+                     f'with: python -m src.builder.binary_registry import {system["name"]} '
+                     f'{system["prebuilt"]["version"]} <path>')
+        return
+    entry, entry_path = found
+    logger.info(f'{system_identifier} runs the prebuilt {entry["library_version"]} ({entry["source_id"]}) from '
+                f'{entry_path}')
+    register_build(system_identifier, entry['source_id'], entry_path)
+
+
+def fetch_and_resolve_commit(github_url: str, build_log: BuildLog) -> Tuple[str, Optional[str]]:
+    """
+    Fetches the shared mirror of the repository the url points to and returns the mirror and the commit of the url in
+    it, so a branch is resolved to where it points right now without asking the remote a second time.
+    """
+    logger.info(f'Getting source code from {github_url}')
+    repo, kind, ref = parse_github_url(github_url)
+    mirror_path, remote = add_remote(repo)
+    fetch_mirror(mirror_path, build_log)
+
+    #'github_commit_url': 'https://github.com/gropaul/duckdb/commit/446b25a1af4a39cede073f7f3872b49145ec2cd0'
     #'github_commit_url': 'https://github.com/gropaul/duckdb/tree/join-optimization/hash-marker-and-collision-bit'
-    elif '/tree/' in github_url:
-
-        logger.info('The url points to a branch, checking out the branch')
-        splitted = github_url.split('/tree/')
-        repo = splitted[0] + '.git'
-        branch = splitted[1]
-
-        clone_or_update_repo(repo, version_dir)
-        path_before = os.getcwd()
-        os.chdir(version_dir)
-        logger.info(f'Checking out branch: {branch}')
-        checkout_command = f'git checkout "{branch}"'
-
-        os.system(checkout_command)
-        os.system('git fetch')
-        os.system('git pull')
-
-        os.chdir(path_before)
-    else:
-        logger.info('The url points to a repository, cloning the repository')
-        clone_or_update_repo(github_url, version_dir)
+    commit = resolve_ref(mirror_path, remote, kind, ref)
+    if commit is None and kind == 'commit':
+        # commits that are not on a branch, e.g. of a closed pull request
+        fetch_commit(mirror_path, remote, ref, build_log)
+        commit = resolve_ref(mirror_path, remote, kind, ref)
+    if commit is None:
+        logger.error(f'Could not resolve {github_url} in {mirror_path}')
+    return mirror_path, commit
 
 
 def get_system_identifier(system: System) -> str:
     return system['name'] + '-' + system['version']
 
 
-def build_system_if_necessary(system: System):
+def get_build_directory(system: System) -> str:
+    system_location = system['build_config']['location']
+    if system_location['location'] == 'github':
+        return get_system_path(system)
+    return system_location['local_path']
 
-    if ('build_config' not in system) or (system['build_config'] is None):
-        logger.info(f'No build config found for system {system["name"]} {system["version"]} -> skipping build')
-        return
 
+def resolve_commit(system: System) -> Optional[str]:
+    """
+    The commit the system is built from as far as it is known before fetching, None if a url has to be resolved in
+    the mirror. Local directories with uncommitted changes are marked as dirty.
+    """
+    system_location = system['build_config']['location']
+    if system_location['location'] == 'github':
+        _, kind, ref = parse_github_url(system_location['github_url'])
+        return ref if kind == 'commit' and SHA_PATTERN.fullmatch(ref) else None
+    local_path = system_location['local_path']
+    commit = resolve_local_commit(local_path) if local_path and os.path.exists(local_path) else None
+    if commit is not None and not is_clean_checkout(local_path):
+        return commit + '-dirty'
+    return commit
+
+
+def resolve_cached_commit(system: System) -> Optional[str]:
+    """
+    Like resolve_commit, but a url is also resolved in the mirror as of its last fetch, None if the mirror does not
+    know it yet.
+    """
+    commit = resolve_commit(system)
+    system_location = system['build_config']['location']
+    if commit is not None or system_location['location'] != 'github':
+        return commit
+    repository_url, kind, ref = parse_github_url(system_location['github_url'])
+    mirror_path, remote = get_mirror_and_remote(repository_url)
+    if not os.path.exists(mirror_path):
+        return None
+    return resolve_ref(mirror_path, remote, kind, ref)
+
+
+def get_configuration_path(repo_dir: str) -> str:
+    # next to the worktree, so cleaning the worktree keeps it
+    return repo_dir + '.configuration.json'
+
+
+def get_build_configuration(system: System) -> dict:
+    # what cmake only reads from the environment when it configures a new build directory, e.g. CXXFLAGS of the env
+    return {'compiler_launcher': get_compiler_launcher(), 'build_key': get_build_key(system)}
+
+
+def clean_if_configured_differently(system: System, repo_dir: str, build_log: BuildLog) -> bool:
+    """
+    A build directory keeps the configuration of its first configure, even if a build command such as make runs cmake
+    again. A worktree whose last build was configured differently, or of which this is unknown, is therefore cleaned
+    before it is built again.
+    """
+    configuration = get_build_configuration(system)
+    configuration_path = get_configuration_path(repo_dir)
+    if os.path.exists(configuration_path):
+        with open(configuration_path, 'r') as f:
+            if json.load(f) == configuration:
+                return True
+    if not build_log.run('clean', ['git', 'clean', '-fdxq'], cwd=repo_dir):
+        return False
+    with open(configuration_path, 'w') as f:
+        json.dump(configuration, f)
+    return True
+
+
+def is_cacheable(system: System, commit: Optional[str]) -> bool:
+    # only the run file is kept, so it has to be part of the build
+    return commit is not None and not commit.endswith('-dirty') and system['run_config']['run_file_relative_to_build']
+
+
+def get_cached_build_report(system: System, commit: Optional[str], start: float) -> Optional[BuildReport]:
+    system_identifier = get_system_identifier(system)
+    if not is_cacheable(system, commit) or not has_artifact(get_artifact_path(system, commit)):
+        return None
+    logger.info(f'{system_identifier} is already built at {commit} -> skipping the build')
+    register_build(system_identifier, commit, get_artifact_path(system, commit))
+    return {
+        'system': system_identifier,
+        'commit': commit,
+        'success': True,
+        'cached': True,
+        'build_time': time.monotonic() - start,
+        'compiler_cache': None,
+        'steps': [],
+    }
+
+
+def finish_build(system: System, build_log: BuildLog, commit: Optional[str], success: bool, start: float,
+                 artifact_path: Optional[str] = None, cached: bool = False) -> BuildReport:
+    system_identifier = get_system_identifier(system)
+    register_build(system_identifier, commit, artifact_path)
+    report: BuildReport = {
+        'system': system_identifier,
+        'commit': commit,
+        'success': success,
+        'cached': cached,
+        'build_time': time.monotonic() - start,
+        'compiler_cache': None if cached else get_compiler_cache_stats(system_identifier),
+        'steps': build_log.get_steps(),
+    }
+    build_log.write_manifest({
+        **report,
+        'source': system['build_config']['location'],
+        'configure_command': system['build_config'].get('configure_command'),
+        'build_command': system['build_config']['build_command'],
+        'artifact_path': artifact_path,
+        'finished': time.time(),
+    })
+    return report
+
+
+def build_system_if_necessary(system: System, n_jobs: Optional[int] = None) -> BuildReport:
+    system_identifier = get_system_identifier(system)
     build_config: SystemBuildConfig = system['build_config']
     system_location = build_config['location']
+    start = time.monotonic()
+
+    # a build of the same commit with the same build command is never repeated, not even fetched
+    commit = resolve_commit(system)
+    cached_report = get_cached_build_report(system, commit, start)
+    if cached_report is not None:
+        return cached_report
 
+    build_log = BuildLog(system_identifier)
     if system_location['location'] == 'github':
-        github_commit_url = system_location['github_url']
         repo_dir = get_system_path(system)
-        clone_repo_and_checkout_commit(github_commit_url, repo_dir)
-        os.chdir(repo_dir)
-
+        mirror_path, commit = fetch_and_resolve_commit(system_location['github_url'], build_log)
+        if commit is None:
+            return finish_build(system, build_log, commit, False, start)
+        if get_cached_build_report(system, commit, start) is not None:
+            return finish_build(system, build_log, commit, True, start, get_artifact_path(system, commit), cached=True)
+
+        logger.info(f'Checking out commit {commit} to {repo_dir}')
+        if not checkout_worktree(mirror_path, repo_dir, commit, build_log):
+            logger.error(f'Could not check out {commit} to {repo_dir}')
+            return finish_build(system, build_log, commit, False, start)
+        if not clean_if_configured_differently(system, repo_dir, build_log):
+            return finish_build(system, build_log, commit, False, start)
+
+    build_dir = get_build_directory(system)
     build_command = build_config['build_command']
-    logger.info(f'Building system {system["name"]} {system["version"]} with command: {build_command}')
+    logger.info(f'Building system {system["name"]} {system["version"]} at {commit} with command: {build_command}, '
+                f'the logs are in {build_log.path}')
+
+    # the builds run next to each other, so each gets its share of the cores and the shared compiler cache
+    env = {**os.environ, **get_compiler_cache_env(system_identifier), **build_config.get('env', {})}
+    if n_jobs is not None:
+        env['CMAKE_BUILD_PARALLEL_LEVEL'] = str(n_jobs)
+
+    success = True
+    if build_config.get('pgo') is not None:
+        success = train_instrumented_build(system, build_log, commit, build_dir, env)
+        env = get_optimized_env(env, get_profile_path(system_identifier))
+    if success and build_config.get('configure_command'):
+        success = build_log.run('configure', get_configure_command(build_config['configure_command']),
+                                cwd=build_dir, env=env)
+    if success:
+        success = build_log.run('compile', build_command, cwd=build_dir, env=env)
+
+    artifact_path = None
+    if success and is_cacheable(system, commit):
+        artifact_path = store_artifact(system, commit, build_dir, build_log.get_steps())
+    return finish_build(system, build_log, commit, success, start, artifact_path)
 
-    # check if logger level is info or above
-    if logger.getEffectiveLevel() <= logging.INFO:
-        os.system(build_command)
-    else:
-        silent_command = f'{build_command} > /dev/null 2>&1'
-        os.system(silent_command)
 
 def kill(proc_pid):
     process = psutil.Process(proc_pid)
@@ -130,53 +316,85 @@ def kill(proc_pid):
 Status = Literal['success', 'timeout', 'crash']
 
 
-def run_command_with_timeout(command: str, timeout: float, env_vars: dict = None) -> Status:
+def run_command_with_timeout(command: str, timeout: float, env_vars: dict = None,
+                             sample_usage: bool = False) -> Tuple[Status, Optional[ResourceUsage]]:
     logger.info(f'Running command: {command} with timeout {timeout}')
     logger.info(f'For running the command we have the following environment variables: {env_vars}')
 
+    # if not verbose, the output is drained into bounded buffers so the system never blocks on a full pipe
     verbose = logger.getEffectiveLevel() <= logging.INFO
-    if not verbose:
-        command += ' > /dev/null 2>&1'
-    if verbose:
-        proc = subprocess.Popen([command], shell=True, env=env_vars)
-    else:
-        proc = subprocess.Popen([command], shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env_vars)
     try:
-        # Run the command with a timeout and capture output
-        return_code = proc.wait(timeout=timeout)
-        if return_code == 0:
-            return 'success'
-        logger.error(f'Command {command} failed with return code {return_code}')
-
-    except subprocess.TimeoutExpired:
-        kill(proc.pid)
-        logger.error(f'Command {command} timed out after {timeout} seconds')
-        return 'timeout'
-
-    except subprocess.CalledProcessError as e:
-        logger.error(f'Command {command} failed with error: {e}')
-        return 'crash'
+        result = run_command(command, timeout, env_vars=env_vars, capture_output=not verbose,
+                             sample_usage=sample_usage)
     except Exception as e:
         logger.error(f'Command {command} failed with error: {e}')
-        return 'crash'
-
-    return 'crash'
+        return 'crash', None
 
-
-def run_script(system: System, script: str, timeout: float, thread_index: int, env_vars: dict) -> Status:
-    repo_dir = get_system_path(system)
+    if result['timed_out']:
+        logger.error(f'Command {command} timed out after {timeout} seconds')
+        return 'timeout', result['resource_usage']
+    if result['return_code'] == 0:
+        return 'success', result['resource_usage']
+
+    logger.error(f'Command {command} failed with return code {result["return_code"]}')
+    if result['stderr']:
+        logger.error(f'Last output on stderr: {result["stderr"]}')
+    return 'crash', result['resource_usage']
+
+
+def get_system_build(system: System) -> Tuple[Optional[str], Optional[str]]:
+    """
+    The commit of the system and the artifact directory it runs from. A system that was not built in this process,
+    e.g. because the build was cached or the system is prebuilt, is looked up in the manifest of its artifact or in
+    the binary registry.
+    """
+    system_identifier = get_system_identifier(system)
+    commit, artifact_path = get_resolved_build(system_identifier)
+    if commit is not None or artifact_path is not None:
+        return commit, artifact_path
+
+    if system.get('prebuilt') is not None:
+        found = find_entry(system)
+        if found is not None:
+            commit, artifact_path = found[0]['source_id'], found[1]
+    elif system.get('build_config') is not None:
+        commit = resolve_cached_commit(system)
+        if is_cacheable(system, commit) and has_artifact(get_artifact_path(system, commit)):
+            artifact_path = get_artifact_path(system, commit)
+            commit = load_artifact_manifest(artifact_path)['commit']
+    register_build(system_identifier, commit, artifact_path)
+    return commit, artifact_path
+
+
+def get_run_command(system: System) -> str:
+    # a system that was built runs from its immutable artifact, not from the checkout that may have moved on, and a
+    # prebuilt system from its directory in the registry
+    _, artifact_path = get_system_build(system)
+    repo_dir = artifact_path or get_system_path(system)
     run_comfig = system['run_config']
     if run_comfig['run_file_relative_to_build']:
-        run_command = repo_dir + '/' + run_comfig['run_file']
+        return repo_dir + '/' + run_comfig['run_file']
     else:
-        run_command = run_comfig['run_file']
+        return run_comfig['run_file']
+
+
+def run_script(system: System, script: str, timeout: float, thread_index: int, env_vars: dict,
+               cores: Optional[List[int]] = None, sample_usage: bool = False,
+               perf_events: Optional[List[str]] = None) -> Tuple[Status, Optional[ResourceUsage]]:
+    run_command = get_pinned_command(get_run_command(system), cores)
+    if perf_events:
+        # remove the counters of the previous run, so a failed run cannot report them
+        perf_output_path = get_perf_output_path(thread_index)
+        if os.path.exists(perf_output_path):
+            os.remove(perf_output_path)
+        run_command = get_perf_command(run_command, perf_events, perf_output_path)
 
     tmp_script_path = get_tmp_path(f'script-thread-{thread_index}.sql')
     with open(tmp_script_path, 'w') as f:
         f.write(script)
 
     total_command = f'{run_command} {tmp_script_path}'
-    return run_command_with_timeout(total_command, timeout, env_vars=env_vars)
+    return run_command_with_timeout(total_command, timeout, env_vars=env_vars, sample_usage=sample_usage)
 
 
 def cond_print(verbose: bool, message: str):
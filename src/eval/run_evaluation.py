@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 
@@ -7,37 +8,98 @@ sys.path.insert(0, root_directory)
 
 import duckdb
 
+from src.runner.result_verification import CHECKSUM_FILE_NAME
 from src.utils import EXPERIMENT_RUNS_PATH, RESULTS_PATH
 
+RESOURCE_USAGE_METRICS = ['wall_time', 'peak_rss_bytes', 'user_time', 'system_time', 'read_bytes', 'write_bytes',
+                          'voluntary_context_switches', 'involuntary_context_switches', 'cpu_parallelism']
+
+OPERATOR_PROFILE_TYPE = ('STRUCT(operator_id INTEGER, parent_id INTEGER, depth INTEGER, operator_type VARCHAR, '
+                         'operator_name VARCHAR, timing DOUBLE, cardinality BIGINT, extra_info VARCHAR)[][]')
+
 
 def run_evaluation(experiment_path: str = "*"):
     runs_path = EXPERIMENT_RUNS_PATH
     con = duckdb.connect(':memory:')
 
+    # results from before the resource usage have no resource_usage field, so it is read from the json of the row
+    resource_usage_columns = ''.join(
+        f"list_avg(json_extract(to_json(result), '$.resource_usage[*].{metric}')::DOUBLE[]) as avg_{metric},\n"
+        for metric in RESOURCE_USAGE_METRICS
+    )
+
+    # every system setting, e.g. n_threads or memory_limit, also gets its own setting_<name> column
+    results_path = f'{runs_path}/{experiment_path}/*/*.json'
+    setting_names = con.execute(f"""
+        SELECT DISTINCT unnest(json_keys(to_json(experiment.system_setting))) as name
+        FROM read_json_auto('{results_path}', union_by_name = true) ORDER BY name
+    """).fetchdf()['name']
+    setting_columns = ''.join(
+        f'experiment.system_setting."{name}" as "setting_{name}",\n' for name in setting_names
+    )
+
     view_query = f"""
         CREATE OR REPLACE VIEW intermediate AS (
             SELECT 
                 experiment.run_name as run_name,
                 experiment.run_date as run_date,
+                experiment.name as experiment_name,
                 experiment.data.config as data_config,
                 experiment.query.name as query,
                 experiment.query.index as query_index,
                 experiment.system.name as system_name,
                 experiment.system.version as system_version,
                 {{'name': system_name, 'version': system_version}} as system,
+                -- the systems expanded from build variants, the version of a variant ends with its name
+                json_extract_string(to_json(experiment), '$.system.variant') as variant,
+                {{'name': system_name, 'version': CASE WHEN variant IS NULL THEN system_version
+                    ELSE left(system_version, length(system_version) - length(variant) - 1) END}} as base_system,
+                {{'variant': coalesce(variant, 'default')}} as build_variant,
                 experiment.system_setting as system_setting,
+                {setting_columns}                -- results from before the cache modes have no cache_mode field
+                {{'cache_mode': coalesce(json_extract_string(to_json(experiment), '$.cache_mode'), 'none')}} as cache_mode,
+                -- results from before the host fingerprint belong to an unknown host
+                coalesce(json_extract_string(to_json(result), '$.host.id'), 'unknown') as host_id,
+                coalesce(json_extract_string(to_json(result), '$.host.hostname'), 'unknown') as host_name,
+                json_extract_string(to_json(result), '$.source_commit') as source_commit,
+                {resource_usage_columns}
+                TRY_CAST(json_extract_string(to_json(experiment), '$.query.config.expected_cardinality') AS DOUBLE) as expected_cardinality,
+                json_extract(to_json(result), '$.perf_counters') as perf_counters,
+                CAST(json_extract(to_json(result), '$.operator_profiles') AS {OPERATOR_PROFILE_TYPE}) as operator_profiles,
+                -- runs that started although the machine was busy, results without noise levels count as quiet
+                list_count(list_filter(json_extract(to_json(result), '$.noise_levels[*].quiet')::BOOLEAN[], q -> NOT q)) as n_noisy_runs,
+                list_min(list_transform(
+                    list_filter(list_zip(runtimes, json_extract(to_json(result), '$.noise_levels[*].quiet')::BOOLEAN[]), r -> coalesce(r[2], true)),
+                    r -> r[1]
+                )) as min_quiet_runtime,
                 list_min(runtimes) as min_runtime
-            FROM '{runs_path}/{experiment_path}/*/*.json'
+            -- runs of older versions have fewer settings, so the files are read by name instead of by position
+            FROM read_json_auto('{results_path}', union_by_name = true) result
         );"""
     con.execute(view_query)
 
+    # one row per operator of every run, the columnar store of the operator profiles
+    operators_query = """
+        CREATE OR REPLACE VIEW operators AS (
+            WITH runs AS (
+                SELECT
+                    * EXCLUDE (operator_profiles),
+                    unnest(operator_profiles) as operators,
+                    generate_subscripts(operator_profiles, 1) - 1 as run_index
+                FROM intermediate
+            )
+            SELECT * EXCLUDE (operators), unnest(operators, recursive := true)
+            FROM runs
+        );"""
+    con.execute(operators_query)
+
     unique_names = con.execute('SELECT DISTINCT run_name FROM intermediate').fetchdf()
     for run_name in unique_names['run_name']:
         evaluate_run(run_name, con)
 
 
 def evaluate_run(run_name: str, con: duckdb.DuckDBPyConnection):
-    query = f"SELECT * FROM intermediate WHERE run_name = '{run_name}'"
+    query = f"SELECT * EXCLUDE (operator_profiles) FROM intermediate WHERE run_name = '{run_name}'"
 
     # save total run data
     path = os.path.join(RESULTS_PATH, run_name)
@@ -69,7 +131,15 @@ def system_dict_to_string(system_dict: dict[str, str]) -> str:
     return f"{name} ({version})"
 
 def dict_to_string(d: dict[str, str]) -> str:
-    return str(d).replace('{', '').replace('}', '').replace("'", "").replace(': ', '=').replace(':', '=').replace(',', ', ')
+    text = str(d).replace('{', '').replace('}', '').replace("'", "").replace(': ', '=').replace(':', '=').replace(',', ', ')
+    # the system settings of all runs share one struct, so the options a run did not set are NULL
+    return ','.join(part for part in text.split(',') if not part.strip().endswith(('=NULL', '=None'))).strip()
+
+
+def struct_label_sql(column: str) -> str:
+    # the label of a struct column without its NULL fields, e.g. "n_threads: 4, memory_limit: 1GB"
+    label = f"replace(CAST({column} AS STRING)[2:-2], '''', '')"
+    return f"trim(regexp_replace({label}, '(^|, )[^,]*: NULL', '', 'g'), ', ')"
 
 def eval_system_tuple(system_tuple: tuple[dict[str, str], dict[str, str]], con: duckdb.DuckDBPyConnection, from_query: str) -> str:
     system_name_0 = system_dict_to_string(system_tuple[0])
@@ -80,6 +150,8 @@ def eval_system_tuple(system_tuple: tuple[dict[str, str], dict[str, str]], con:
                                           group_string_label='System Setting')
     total_text += eval_system_tuple_group(system_tuple, con, from_query, group_string='data_config',
                                           group_string_label='Data Configuration')
+    total_text += eval_system_tuple_group(system_tuple, con, from_query, group_string='cache_mode',
+                                          group_string_label='Cache Mode')
 
     return total_text
 
@@ -166,18 +238,279 @@ def query_index_to_name_table(con: duckdb.DuckDBPyConnection, from_query: str) -
     return text
 
 
+def resource_usage_table(con: duckdb.DuckDBPyConnection, from_query: str) -> str:
+    query = f"""
+        SELECT
+            system,
+            CAST(system_setting AS STRING) as system_setting_str,
+            CAST(data_config AS STRING) as data_config_str,
+            CAST(cache_mode AS STRING) as cache_mode_str,
+            AVG(min_runtime) as avg_runtime,
+            AVG(avg_wall_time) as wall_time,
+            AVG(avg_peak_rss_bytes) / (1024 * 1024) as peak_rss_mib,
+            AVG(avg_user_time + avg_system_time) as cpu_time,
+            AVG(avg_cpu_parallelism) as cpu_parallelism,
+            AVG(avg_read_bytes) / (1024 * 1024) as read_mib,
+            AVG(avg_write_bytes) / (1024 * 1024) as write_mib,
+            AVG(avg_voluntary_context_switches) as voluntary_context_switches,
+            AVG(avg_involuntary_context_switches) as involuntary_context_switches
+        {from_query}
+        GROUP BY system, system_setting, data_config, cache_mode
+        HAVING COUNT(avg_wall_time) > 0
+        ORDER BY system, system_setting, data_config, cache_mode;
+    """
+    df = con.execute(query).fetchdf()
+    if df.empty:
+        return ""
+
+    df['system'] = df['system'].map(system_dict_to_string)
+    for column in ['system_setting_str', 'data_config_str', 'cache_mode_str']:
+        df[column] = df[column].map(dict_to_string)
+    df.columns = ['System', 'System Setting', 'Data Configuration', 'Cache Mode', 'Runtime (s)', 'Wall Time (s)',
+                  'Peak RSS (MiB)', 'CPU Time (s)', 'CPU Parallelism', 'Read (MiB)', 'Written (MiB)',
+                  'Voluntary Context Switches', 'Involuntary Context Switches']
+
+    # the usage covers the whole system process, so it includes loading the data and the warm-up runs
+    text = "\n## Resource Usage per System, System Setting and Data Configuration\n"
+    text += "Averaged over the queries, measured for the whole system process of a run.\n\n"
+    text += df.to_markdown(index=False, floatfmt=".2f")
+    text += "\n\n"
+    return text
+
+
+def average_perf_counters(perf_counters: str) -> dict[str, float]:
+    # events perf could not count in a run are left out of the average
+    values: dict[str, list[float]] = {}
+    for counters in json.loads(perf_counters):
+        for event, value in counters.items():
+            if value is not None:
+                values.setdefault(event, []).append(value)
+    return {event: sum(v) / len(v) for event, v in values.items()}
+
+
+def perf_counters_table(con: duckdb.DuckDBPyConnection, from_query: str) -> str:
+    query = f"""
+        SELECT
+            system,
+            CAST(system_setting AS STRING) as system_setting_str,
+            CAST(data_config AS STRING) as data_config_str,
+            CAST(cache_mode AS STRING) as cache_mode_str,
+            query,
+            expected_cardinality,
+            CAST(perf_counters AS STRING) as perf_counters
+        {from_query}
+        AND coalesce(json_array_length(perf_counters), 0) > 0
+        ORDER BY system, system_setting, data_config, cache_mode, query_index;
+    """
+    df = con.execute(query).fetchdf()
+    if df.empty:
+        return ""
+
+    averages = df['perf_counters'].map(average_perf_counters)
+    events = list(dict.fromkeys(event for counters in averages for event in counters))
+    # without the expected cardinality of the queries, the absolute counts are reported
+    per_tuple = df['expected_cardinality'].notna().any()
+
+    table = pd.DataFrame({
+        'System': df['system'].map(system_dict_to_string),
+        'System Setting': df['system_setting_str'].map(dict_to_string),
+        'Data Configuration': df['data_config_str'].map(dict_to_string),
+        'Cache Mode': df['cache_mode_str'].map(dict_to_string),
+        'Query': df['query'],
+    })
+    if 'instructions' in events and 'cycles' in events:
+        table['IPC'] = [c.get('instructions', np.nan) / c['cycles'] if c.get('cycles') else np.nan for c in averages]
+    for event in events:
+        if event in ('instructions', 'cycles'):
+            continue
+        values = averages.map(lambda c: c.get(event, np.nan))
+        if per_tuple:
+            table[f'{event} per Tuple'] = values / df['expected_cardinality']
+        else:
+            table[event] = values
+
+    # the counters of the baseline run, i.e. loading the data and the warm-up runs, are already subtracted
+    text = "\n## Hardware Counters per Query\n"
+    text += ("Measured with perf stat for the whole system process of a run, minus a baseline run of the same "
+             "script without the measured query.\n\n")
+    text += table.to_markdown(index=False, floatfmt=".2f")
+    text += "\n\n"
+    return text
+
+
+def result_verification_table(run_name: str, run_date: str) -> str:
+    path = os.path.join(EXPERIMENT_RUNS_PATH, run_name, run_date, CHECKSUM_FILE_NAME)
+    if not os.path.exists(path):
+        return ""
+
+    df = pd.read_json(path, lines=True, dtype={'checksum': str})
+    # a resumed run appends the checksums of its remaining queries, the last checksum per system and query counts
+    df = df.drop_duplicates(subset=['system_name', 'system_version', 'data_name', 'query_name'], keep='last')
+    df['system'] = [system_dict_to_string({'name': n, 'version': v})
+                    for n, v in zip(df['system_name'], df['system_version'])]
+    df['data_config'] = df['data_config'].map(dict_to_string)
+    df['result'] = [f"{int(count)} rows, {checksum}" if status == 'success' else status
+                    for status, count, checksum in zip(df['status'], df['row_count'], df['checksum'])]
+
+    rows = []
+    n_queries = 0
+    for (query_index, query, data_config), group in df.groupby(['query_index', 'query_name', 'data_config']):
+        n_queries += 1
+        # systems without a checksum command are not part of the comparison
+        verified = group[group['status'] == 'success']
+        if verified['result'].nunique() > 1:
+            verdict = 'MISMATCH'
+        elif group['status'].isin(['timeout', 'crash']).any():
+            verdict = 'not verified'
+        else:
+            continue
+        row = {'Query': query, 'Data Configuration': data_config, 'Verdict': verdict}
+        row.update(dict(zip(group['system'], group['result'])))
+        rows.append(row)
+
+    n_mismatches = sum(1 for row in rows if row['Verdict'] == 'MISMATCH')
+    text = "\n## Result Verification\n"
+    text += (f"{n_queries - len(rows)} of {n_queries} queries returned the same result on all systems, "
+             f"{n_mismatches} returned different results.\n\n")
+    if rows:
+        text += pd.DataFrame(rows).fillna('').to_markdown(index=False)
+        text += "\n\n"
+    return text
+
+
+def noisy_runs_table(con: duckdb.DuckDBPyConnection, from_query: str) -> str:
+    query = f"""
+        SELECT
+            system,
+            CAST(system_setting AS STRING) as system_setting_str,
+            CAST(data_config AS STRING) as data_config_str,
+            CAST(cache_mode AS STRING) as cache_mode_str,
+            query,
+            n_noisy_runs,
+            min_runtime,
+            min_quiet_runtime
+        {from_query}
+        AND n_noisy_runs > 0
+        ORDER BY system, system_setting, data_config, cache_mode, query_index;
+    """
+    df = con.execute(query).fetchdf()
+    if df.empty:
+        return ""
+
+    df['system'] = df['system'].map(system_dict_to_string)
+    for column in ['system_setting_str', 'data_config_str', 'cache_mode_str']:
+        df[column] = df[column].map(dict_to_string)
+    df.columns = ['System', 'System Setting', 'Data Configuration', 'Cache Mode', 'Query', 'Noisy Runs',
+                  'Min Runtime (s)', 'Min Quiet Runtime (s)']
+
+    text = "\n## Noisy Runs\n"
+    text += "Experiments with runs that started after the noise gate gave up waiting for a quiet machine.\n\n"
+    text += df.to_markdown(index=False, floatfmt=".4f")
+    text += "\n\n"
+    return text
+
+
+def save_operators(con: duckdb.DuckDBPyConnection, from_query: str, path: str) -> bool:
+    n_operators = con.execute(f"SELECT COUNT(*) {from_query}").fetchone()[0]
+    if n_operators == 0:
+        return False
+    operators_path = os.path.join(path, 'operators.parquet')
+    con.execute(f"COPY (SELECT * {from_query}) TO '{operators_path}' (FORMAT PARQUET)")
+    return True
+
+
+def operator_time_table(con: duckdb.DuckDBPyConnection, from_query: str) -> str:
+    # the time of an operator type is averaged over the runs of an experiment and summed over the experiments
+    query = f"""
+        WITH per_run AS (
+            SELECT system, experiment_name, run_index, operator_type, SUM(timing) as timing
+            {from_query}
+            GROUP BY system, experiment_name, run_index, operator_type
+        ), per_experiment AS (
+            SELECT system, experiment_name, operator_type, AVG(timing) as timing
+            FROM per_run
+            GROUP BY system, experiment_name, operator_type
+        )
+        SELECT system, operator_type, SUM(timing) as timing
+        FROM per_experiment
+        GROUP BY system, operator_type;
+    """
+    df = con.execute(query).fetchdf()
+    df['system'] = df['system'].map(system_dict_to_string)
+    table = df.pivot(index='operator_type', columns='system', values='timing')
+    table = table.loc[table.sum(axis=1).sort_values(ascending=False).index]
+    table = table.map(lambda x: f"{x:.4f}s" if pd.notna(x) else '')
+    table.index.name = 'Operator Type'
+
+    text = "\n## Time per Operator Type\n"
+    text += "Summed over all experiments, averaged over their runs. The rows of all operators are in `operators.parquet`.\n\n"
+    text += table.reset_index().to_markdown(index=False)
+    text += "\n\n"
+    return text
+
+
 def evaluate_run_date(run_name: str, run_date: str, con: duckdb.DuckDBPyConnection):
+    run_filter = f"run_name = '{run_name}' AND run_date = '{run_date}'"
+    path = os.path.join(RESULTS_PATH, run_name, run_date)
+
+    # runtimes of different machines are never compared, so a distributed run is evaluated per host
+    hosts = con.execute(f"SELECT DISTINCT host_id, host_name FROM intermediate WHERE {run_filter} ORDER BY ALL").fetchall()
+    if len(hosts) <= 1:
+        evaluate_results(run_name, run_date, con, run_filter, path)
+        return
+
+    for host_id, host_name in hosts:
+        host_filter = f"{run_filter} AND host_id = '{host_id}'"
+        evaluate_results(run_name, run_date, con, host_filter, os.path.join(path, f'{host_name}-{host_id}'),
+                         title_suffix=f' - {host_name} ({host_id})')
+
+
+def build_variants_table(con: duckdb.DuckDBPyConnection, from_query: str) -> str:
+    query = f"""
+        SELECT
+            base_system,
+            coalesce(variant, 'default') as variant,
+            -- the geometric mean, so every query counts the same regardless of its runtime
+            exp(avg(ln(min_runtime))) as geomean_runtime,
+            count(*) as n_experiments
+        {from_query}
+        AND min_runtime > 0
+        GROUP BY ALL
+        ORDER BY ALL;
+    """
+    df = con.execute(query).fetchdf()
+    if df.empty or (df['variant'] == 'default').all():
+        return ""
+
+    df['base_system'] = df['base_system'].map(system_dict_to_string)
+    table = df.pivot(index='variant', columns='base_system', values='geomean_runtime')
+    # the speedup of every variant over the default build of the same system
+    if 'default' in table.index:
+        for column in list(table.columns):
+            table[f'{column} Speedup'] = table.loc['default', column] / table[column]
+
+    text = "\n## Build Variants\n"
+    text += "Geometric mean of the minimum runtime (s) of all experiments, per system and build variant.\n\n"
+    text += table.reset_index().rename(columns={'variant': 'Variant'}).to_markdown(index=False, floatfmt=".4f")
+    text += "\n\n"
+    return text
+
+
+def evaluate_results(run_name: str, run_date: str, con: duckdb.DuckDBPyConnection, where: str, path: str,
+                     title_suffix: str = ''):
     # Step 1: Fetch initial data
-    from_query = f"FROM intermediate WHERE run_name = '{run_name}' AND run_date = '{run_date}'"
-    df = con.execute(f"SELECT * {from_query}").fetchdf()
+    from_query = f"FROM intermediate WHERE {where}"
+    df = con.execute(f"SELECT * EXCLUDE (operator_profiles) {from_query}").fetchdf()
 
     # Step 2: Save initial data to CSV
-    path = os.path.join(RESULTS_PATH, run_name, run_date)
     plots_path = os.path.join(path, 'plots')
     if not os.path.exists(plots_path):
         os.makedirs(plots_path)
     df.to_csv(os.path.join(path, 'run.csv'), index=False)
 
+    operators_from_query = f"FROM operators WHERE {where}"
+    has_operators = save_operators(con, operators_from_query, path)
+
     system_plot_grouped = plot_aggregation('system', con, from_query, plots_path, per_query=True)
     system_plot_grouped_data_config = plot_aggregation('system', con, from_query, plots_path, per_query=True,
                                                        subplot_group='data_config')
@@ -190,6 +523,12 @@ def evaluate_run_date(run_name: str, run_date: str, con: duckdb.DuckDBPyConnecti
     system_setting_plot = plot_aggregation('system_name', con, from_query, plots_path)
     data_plot_grouped = plot_aggregation('data_config', con, from_query, plots_path, per_query=True)
     data_plot = plot_aggregation('query', con, from_query, plots_path)
+    cache_mode_plot_grouped_by_system = plot_aggregation('cache_mode', con, from_query, plots_path, per_query=True,
+                                                         subplot_group='system')
+    has_variants = con.execute(f"SELECT count(variant) > 0 {from_query}").fetchone()[0]
+    if has_variants:
+        base_system_plot_grouped_by_variant = plot_aggregation('base_system', con, from_query, plots_path,
+                                                               per_query=True, subplot_group='build_variant')
 
     s2s_text = system_to_system_evaluation(con, from_query)
 
@@ -197,12 +536,25 @@ def evaluate_run_date(run_name: str, run_date: str, con: duckdb.DuckDBPyConnecti
 
     # create little markdown file with embedded plots, we can create md images as ![name](path)
     md = f"""
-# {run_name} - {run_date}
+# {run_name} - {run_date}{title_suffix}
 """
     md += s2s_text
 
     md += query_index_to_name_table(con, from_query)
 
+    md += result_verification_table(run_name, run_date)
+
+    md += resource_usage_table(con, from_query)
+
+    md += noisy_runs_table(con, from_query)
+
+    md += build_variants_table(con, from_query)
+
+    md += perf_counters_table(con, from_query)
+
+    if has_operators:
+        md += operator_time_table(con, operators_from_query)
+
     plots_md = f"""
 ## Performance per System and Data Configuration
 ![System](plots/{os.path.basename(system_plot_grouped_data_config)})
@@ -212,6 +564,12 @@ def evaluate_run_date(run_name: str, run_date: str, con: duckdb.DuckDBPyConnecti
 ![System Setting](plots/{os.path.basename(system_setting_plot_grouped)})
 ## Performance per Data Configuration
 ![Data Configuration](plots/{os.path.basename(data_plot_grouped)})
+## Performance per System and Cache Mode
+![Cache Mode](plots/{os.path.basename(cache_mode_plot_grouped_by_system)})
+"""
+    if has_variants:
+        plots_md += f"""## Performance per System and Build Variant
+![Build Variant](plots/{os.path.basename(base_system_plot_grouped_by_variant)})
 """
     # add the plots to the markdown
     md += plots_md
@@ -246,10 +604,10 @@ def plot_aggregation(group_column: str,
     # Build the query, optionally including query_index and subplot_group in SELECT, GROUP BY, ORDER BY
     aggregated_query = f"""
         SELECT 
-            replace(CAST({group_column} AS STRING)[2:-2], '''', '') as group_column_string
+            {struct_label_sql(group_column)} as group_column_string
             {', (query_index + 1) as query_index' if per_query else ''},
             AVG(min_runtime) as avg_runtime
-            {', replace(CAST(' + subplot_group + " AS STRING)[2:-2], '''', '') as " + subplot_group + '_str' if subplot_group else ''} 
+            {', ' + struct_label_sql(subplot_group) + ' as ' + subplot_group + '_str' if subplot_group else ''} 
         {from_query}
         GROUP BY {group_column} 
                  {', query_index' if per_query else ''} 
@@ -1,8 +1,65 @@
+import math
 import os
 import sys
+from typing import List
+
 root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
 sys.path.insert(0, root_directory)
 
 
 def speedup_factor(a: float, b: float) -> float:
-    return a / b
\ No newline at end of file
+    return a / b
+
+# two-sided 95% quantiles of the t-distribution for 1 to 30 degrees of freedom
+T_QUANTILES_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def mean(values: List[float]) -> float:
+    return sum(values) / len(values)
+
+
+def standard_deviation(values: List[float]) -> float:
+    # sample standard deviation
+    if len(values) < 2:
+        return 0.0
+    m = mean(values)
+    return math.sqrt(sum((v - m) ** 2 for v in values) / (len(values) - 1))
+
+
+def coefficient_of_variation(values: List[float]) -> float:
+    m = mean(values)
+    if m == 0:
+        return 0.0
+    return standard_deviation(values) / m
+
+
+def relative_confidence_interval_width(values: List[float]) -> float:
+    # width of the 95% confidence interval of the mean relative to the mean
+    if len(values) < 2:
+        return math.inf
+    m = mean(values)
+    if m == 0:
+        return 0.0
+    degrees_of_freedom = len(values) - 1
+    t = T_QUANTILES_95[degrees_of_freedom - 1] if degrees_of_freedom <= len(T_QUANTILES_95) else 1.96
+    half_width = t * standard_deviation(values) / math.sqrt(len(values))
+    return 2 * half_width / m
+
+
+def is_significantly_different(a: List[float], b: List[float]) -> bool:
+    # two-sided Welch's t-test at the 95% level, which does not assume that both samples have the same variance
+    if len(a) < 2 or len(b) < 2:
+        return False
+    variance_a = standard_deviation(a) ** 2 / len(a)
+    variance_b = standard_deviation(b) ** 2 / len(b)
+    if variance_a + variance_b == 0:
+        return mean(a) != mean(b)
+    t = abs(mean(a) - mean(b)) / math.sqrt(variance_a + variance_b)
+    degrees_of_freedom = (variance_a + variance_b) ** 2 / (
+            variance_a ** 2 / (len(a) - 1) + variance_b ** 2 / (len(b) - 1))
+    index = max(1, math.floor(degrees_of_freedom))
+    return t > (T_QUANTILES_95[index - 1] if index <= len(T_QUANTILES_95) else 1.96)
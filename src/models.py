@@ -18,11 +18,83 @@ class Script(TypedDict):
     duckdb: str
 
 
-class AdaptiveParameters(TypedDict):
-    n_runs: int
-    n_chains: int
-    timestamp: int
-    join_index: int
+# stops the repetitions of an experiment once the runtimes are stable, all given targets have to be met
+class AdaptiveParameters(TypedDict, total=False):
+    min_runs: int
+    max_runs: int
+    target_relative_ci_width: Optional[float]  # width of the 95% confidence interval of the mean, relative to the mean
+    target_cv: Optional[float]  # coefficient of variation
+
+
+def adaptive_parameters_fill_defaults(parameters: AdaptiveParameters) -> AdaptiveParameters:
+    return {
+        'min_runs': 3,
+        'max_runs': 20,
+        'target_relative_ci_width': 0.05,
+        'target_cv': None,
+        **parameters
+    }
+
+
+# defers a run until the machine is quiet, a None threshold is not checked
+class NoiseGateParameters(TypedDict, total=False):
+    max_load: Optional[float]  # 1 minute load average per logical cpu, includes the previous runs of the benchmarker
+    max_cpu_utilization: Optional[float]  # percent of all cpus used by other processes than the benchmarker
+    max_iowait: Optional[float]  # percent
+    max_memory_pressure: Optional[float]  # share of time tasks stalled on memory over the last 10s, in percent
+    sample_interval: float  # seconds over which the cpu utilization and iowait are measured
+    initial_backoff: float  # seconds
+    max_backoff: float  # seconds
+    max_wait: float  # seconds after which the run starts anyway
+
+
+def noise_gate_parameters_fill_defaults(parameters: NoiseGateParameters) -> NoiseGateParameters:
+    return {
+        'max_load': None,
+        'max_cpu_utilization': 10.0,
+        'max_iowait': 5.0,
+        'max_memory_pressure': 5.0,
+        'sample_interval': 0.2,
+        'initial_backoff': 1.0,
+        'max_backoff': 30.0,
+        'max_wait': 300.0,
+        **parameters
+    }
+
+
+# sets the timeout of an experiment from the runs of the same experiment in earlier results
+class TimeoutPredictionParameters(TypedDict, total=False):
+    multiplier: float  # times the longest earlier run
+    min_timeout: float  # seconds
+    max_timeout: Optional[float]  # seconds, defaults to max_timeout_multiplier times the global timeout
+    max_timeout_multiplier: float  # times the global timeout, only used if max_timeout is not set
+
+
+def timeout_prediction_parameters_fill_defaults(parameters: TimeoutPredictionParameters) -> TimeoutPredictionParameters:
+    return {
+        'multiplier': 5.0,
+        'min_timeout': 1.0,
+        'max_timeout': None,
+        'max_timeout_multiplier': 3.0,
+        **parameters
+    }
+
+
+class NoiseLevels(TypedDict):
+    load: float  # 1 minute load average per logical cpu
+    cpu_utilization: float
+    iowait: float
+    memory_pressure: Optional[float]  # None if the kernel has no pressure stall information
+    cpu_pressure: Optional[float]
+    io_pressure: Optional[float]
+    waited: float  # seconds the run was deferred
+    quiet: bool  # False if the run started after max_wait although the machine was still busy
+
+
+# n_runs: the fixed number of runs is reached, converged and max_runs: the adaptive repetitions stopped,
+# error: the system crashed or no metrics could be retrieved, timeout: the system timed out,
+# skipped-dominated: not run, as an experiment with less data or more threads already timed out
+StopReason = Literal['n_runs', 'converged', 'max_runs', 'error', 'timeout', 'skipped-dominated']
 
 
 class SystemSourceCodeLocation(TypedDict):
@@ -30,36 +102,122 @@ class SystemSourceCodeLocation(TypedDict):
     github_url: Optional[str] # can be to a repo, a branch or a commit
     local_path: Optional[str]
 
-class SystemBuildConfig(TypedDict):
+class PgoConfig(TypedDict, total=False):
+    benchmark: 'Benchmark'  # the training workload, run once with the instrumented build
+    system_settings: List['SystemSettings']  # default: one thread
+    timeout: float  # seconds per training query, the instrumented build is slower, default: 600
+
+
+class BuildVariant(TypedDict, total=False):
+    name: str  # appended to the version of the system, e.g. 'native' for duckdb v1.0.0-native
+    flags: List[str]  # compiler flags, e.g. ['-march=native']
+    link_flags: List[str]
+    lto: bool  # link time optimization, default: False
+    env: Dict[str, str]  # further variables of the build, e.g. for the Makefile
+    pgo: PgoConfig  # profile guided optimization with a training run, default: None
+
+
+class _SystemBuildConfig(TypedDict):
     location: SystemSourceCodeLocation
     build_command: str
 
+
+class SystemBuildConfig(_SystemBuildConfig, total=False):
+    configure_command: str  # runs before the build command as its own step, e.g. cmake
+    env: Dict[str, str]  # the environment variables of the configure and build commands, e.g. CXXFLAGS
+    variants: List[BuildVariant]  # every variant becomes a system of its own
+    pgo: PgoConfig  # set by the expansion of a variant with pgo
+
+
+# the pgo builds first compile an instrumented build, train it and clean the checkout before they compile again
+BuildStepName = Literal['fetch', 'checkout', 'configure', 'compile-instrumented', 'train', 'merge-profiles', 'clean',
+                        'compile']
+
+
+class BuildStep(TypedDict):
+    name: BuildStepName
+    commands: List[str]
+    success: bool
+    wall_time: float  # seconds of all commands of the step
+    cpu_time: float  # user and system seconds of all processes of the step
+    peak_rss_bytes: int  # the largest memory of a single process of the step
+    log_path: str
+
 class SystemRunConfig(TypedDict):
     run_file: str
     run_file_relative_to_build: bool
 
-# takes the thread index as argument, gets the command as a string
-GetStartProfilerCommand = Callable[[int], str]
+# takes the thread index and optionally the position of the query in a batch as argument, gets the command as a string
+GetStartProfilerCommand = Callable[[int, Optional[int]], str]
+
+# callback function that returns a runtime (float) and cardinality (int), gets thread index and optionally the
+# position of the query in a batch as argument
+GetMetricsFunction = Callable[[int, Optional[int]], Optional[Tuple[float, int]]]
+
+# takes the path of a marker file, gets a command that creates the file once all previous statements finished
+GetSessionMarkerCommand = Callable[[str], str]
 
-# callback function that returns a runtime (float) and cardinality (int), gets thread index as argument
-GetMetricsFunction = Callable[[int], Optional[Tuple[float, int]]]
+
+class OperatorProfile(TypedDict):
+    operator_id: int  # position of the operator in a pre-order traversal of the plan
+    parent_id: Optional[int]
+    depth: int
+    operator_type: str
+    operator_name: Optional[str]
+    timing: Optional[float]
+    cardinality: Optional[int]
+    extra_info: str  # json of the extra info of the system
+
+
+# takes the query and the output path, returns a command that writes the row count and checksum of the result as csv
+GetChecksumCommand = Callable[[str, str], Optional[str]]  # None if the query cannot be checksummed
+
+# takes the name and value of a system setting, returns the statement that applies it
+SetOptionCommand = Callable[[str, any], str]
+
+# takes the thread index and the batch index, returns the flattened operator tree of the last query
+GetOperatorProfileFunction = Callable[[int, Optional[int]], Optional[List[OperatorProfile]]]
+
+
+class PrebuiltBinary(TypedDict, total=False):
+    version: str  # the version the binary was imported as, e.g. 'v1.1.3' or 'nightly'
+    sha256: str  # a prefix of the hash of the binary, if not given the newest import of the version is used
+
+
+class RegistryEntry(TypedDict):
+    name: SystemName
+    version: str
+    sha256: str  # of the executable
+    library_version: str  # as reported by the binary itself, e.g. 'v1.1.3'
+    source_id: str  # the commit the binary was built from, as reported by the binary
+    executable: str  # the file name of the executable in the directory of the entry
+    source: str  # the path the binary was imported from
+    imported: float  # unix time
 
 
 class System(TypedDict):
     name: SystemName
     version: str
     build_config: Optional[SystemBuildConfig]
+    prebuilt: Optional[PrebuiltBinary]  # runs a binary of the registry instead of building one, see binary_registry
+    variant: Optional[str]  # the name of the build variant the system was expanded from
     run_config: SystemRunConfig
     setup_script: str
     set_threads_command: Callable[[int], str]  # takes the number of threads as argument
     get_start_profiler_command: GetStartProfilerCommand
     get_metrics: GetMetricsFunction  # callback function that returns a float, gets thread index as argument
+    get_session_marker_command: Optional[GetSessionMarkerCommand]  # only needed for the session execution mode
+    get_operator_profile: Optional[GetOperatorProfileFunction]  # called before get_metrics, which may delete the profile
+    get_checksum_command: Optional[GetChecksumCommand]  # only needed to verify the results
+    set_option_command: Optional[SetOptionCommand]  # only needed for system settings other than n_threads
 
 
 class DataSet(TypedDict):
     name: str
     setup_script: Script
+    files: Optional[List[str]]  # the files the dataset is read from, needed to control the page cache
     config: Dict[str, any]
+    generate: Optional[Callable[[], None]]  # creates the missing files, called once before the first run
 
 
 class Query(TypedDict):
@@ -73,6 +231,17 @@ ExperimentMode = Literal['train', 'test', 'all']
 DataSource = Literal['tables', 'parquet']
 SchemaType = Literal['without', 'along']
 
+# process: one new system process per run, session: one long-living process per system, dataset and setting,
+# batch: one script with all queries per system, dataset and setting
+ExecutionMode = Literal['process', 'session', 'batch']
+
+# none: no control over the caches, hot: discarded warm-up runs in the same process before each measured run,
+# os-warm: the dataset files are read into the page cache, cold: the dataset files are evicted from the page cache
+CacheMode = Literal['none', 'hot', 'os-warm', 'cold']
+
+# fixed: n_parallel workers, packed: as many experiments as their threads fit onto the free cores
+SchedulingMode = Literal['fixed', 'packed']
+
 
 class RunSettings(TypedDict, total=False):
     seed: Optional[float]
@@ -83,6 +252,22 @@ class RunSettings(TypedDict, total=False):
     offset: Optional[int]
     max_n_experiments: Optional[int]
 
+    execution_mode: Optional[ExecutionMode]
+    pin_cores: Optional[bool]
+    scheduling: Optional[SchedulingMode]
+    max_cores: Optional[int]
+    exclusive_threads: Optional[int]
+    adaptive: Optional[AdaptiveParameters]
+    warmup_runs: Optional[int]
+    resume: Optional[Union[bool, str]]
+    prune_timeouts: Optional[bool]
+    perf_events: Optional[Union[bool, List[str]]]
+    sample_peak_rss: Optional[bool]
+    verify_results: Optional[bool]
+    noise_gate: Optional[NoiseGateParameters]
+    timeout_prediction: Optional[TimeoutPredictionParameters]
+    max_parallel_builds: Optional[int]
+
 class RunSettingsInternal(TypedDict):
     seed: float
     n_parallel: int
@@ -92,7 +277,30 @@ class RunSettingsInternal(TypedDict):
     offset: int
     max_n_experiments: Optional[int]
 
+    execution_mode: ExecutionMode
+    pin_cores: bool
+    scheduling: SchedulingMode
+    max_cores: Optional[int]  # defaults to the number of physical cores
+    exclusive_threads: Optional[int]  # experiments with at least this many threads run alone
+    adaptive: Optional[AdaptiveParameters]  # replaces n_runs if set
+    warmup_runs: int  # number of warm-up runs of the hot cache mode
+    resume: Union[bool, str]  # True for the latest run, or the run date to resume
+    prune_timeouts: bool  # skip experiments that are dominated by a timed out experiment
+    perf_events: Optional[List[str]]  # hardware counters collected with perf stat, None to disable
+    sample_peak_rss: bool  # poll the rss of a session process during every run to get its peak
+    verify_results: bool  # compare checksums of the query results across the systems after the timed runs
+    noise_gate: Optional[NoiseGateParameters]  # runs start without waiting if not set
+    timeout_prediction: Optional[TimeoutPredictionParameters]  # every experiment gets the global timeout if not set
+    max_parallel_builds: int  # systems that are built at the same time, each with its share of the cores
+
 def run_settings_fill_defaults(settings: RunSettings) -> RunSettingsInternal:
+    if settings.get('adaptive') is not None:
+        settings = {**settings, 'adaptive': adaptive_parameters_fill_defaults(settings['adaptive'])}
+    if settings.get('noise_gate') is not None:
+        settings = {**settings, 'noise_gate': noise_gate_parameters_fill_defaults(settings['noise_gate'])}
+    if settings.get('timeout_prediction') is not None:
+        settings = {**settings, 'timeout_prediction': timeout_prediction_parameters_fill_defaults(
+            settings['timeout_prediction'])}
     return {
         'seed': 0.42,
         'n_parallel': 1,
@@ -100,12 +308,44 @@ def run_settings_fill_defaults(settings: RunSettings) -> RunSettingsInternal:
         'timeout': 60,
         'offset': 0,
         'max_n_experiments': None,
+        'execution_mode': 'process',
+        'pin_cores': False,
+        'scheduling': 'fixed',
+        'max_cores': None,
+        'exclusive_threads': None,
+        'adaptive': None,
+        'warmup_runs': 1,
+        'resume': False,
+        'prune_timeouts': False,
+        'perf_events': None,
+        'sample_peak_rss': False,
+        'verify_results': False,
+        'noise_gate': None,
+        'timeout_prediction': None,
+        'max_parallel_builds': 4,
         **settings
     }
 
-class SystemSettings(TypedDict):
+# every key other than n_threads is a system option, e.g. memory_limit, applied with the set_option_command
+class SystemSettings(TypedDict, total=False):
     n_threads: int
 
+
+def system_settings_fill_defaults(settings: SystemSettings) -> SystemSettings:
+    return {
+        'n_threads': 1,
+        **settings
+    }
+
+
+SystemSettingsGridMode = Literal['product', 'zip']
+
+
+# expands into one system setting per combination of the values
+class SystemSettingsGrid(TypedDict, total=False):
+    grid: Dict[str, List[any]]
+    mode: SystemSettingsGridMode  # product: every combination, zip: the i-th values of all lists, defaults to product
+
 # All queries will be run on all datasets
 class Benchmark(TypedDict):
     name: str
@@ -117,10 +357,36 @@ class RunConfig(TypedDict, total=False):
     run_settings: RunSettings
 
     # we can test over multiple system settings
-    system_settings: Union[SystemSettings, List[SystemSettings]]
+    system_settings: Union[SystemSettings, SystemSettingsGrid, List[Union[SystemSettings, SystemSettingsGrid]]]
     systems: Union[System, List[System]]
     benchmarks: Union[Benchmark, List[Benchmark]]
 
+    # every experiment is run with each cache mode, defaults to 'none'
+    cache_modes: Union[CacheMode, List[CacheMode]]
+
+
+# searches the first commit between a good and a bad commit whose queries are slower than the ones of the good commit
+class BisectConfig(TypedDict, total=False):
+    name: str
+    system: System  # built from github, the commits are the ones of its repository
+    good_commit: str
+    bad_commit: str
+    queries: List[Query]
+    dataset: DataSet
+    threshold: float  # the slowdown of a query that counts as a regression, e.g. 0.05 for 5%, default: 0.05
+    system_setting: SystemSettings  # default: one thread
+    run_settings: RunSettings  # default: adaptive repetitions until the confidence interval is below the threshold
+
+
+class BisectStep(TypedDict):
+    commit: str
+    subject: str
+    status: Literal['good', 'bad', 'skip']  # skip: the commit could not be built or run
+    slowdowns: Dict[str, float]  # mean runtime relative to the good commit, per query
+    regressed_queries: List[str]  # the queries that are significantly slower by more than the threshold
+    runtimes: Dict[str, List[float]]
+
+
 # consists of one system with one setting and one benchmark
 class Experiment(TypedDict):
     name: str
@@ -131,9 +397,54 @@ class Experiment(TypedDict):
     query: Query
     system_setting: SystemSettings
     system: System
+    cache_mode: CacheMode
+    timeout: float  # seconds per run, the global timeout or the one predicted from earlier results
+
+
+class HostFingerprint(TypedDict):
+    id: str  # hash of all other fields, runtimes are only compared between runs with the same id
+    hostname: str
+    cpu_model: Optional[str]
+    n_cpus: int  # logical cpus
+    n_physical_cpus: Optional[int]
+    memory_bytes: int
+    kernel: str
+
+
+class ResourceUsage(TypedDict):
+    wall_time: float  # seconds from the start to the end of the run, including loading the data
+    peak_rss_bytes: Optional[int]  # of the largest process, None in a session without sample_peak_rss
+    user_time: float
+    system_time: float
+    read_bytes: int
+    write_bytes: int
+    voluntary_context_switches: int
+    involuntary_context_switches: int
+    cpu_parallelism: float  # cpu time / wall time
+
+
+class ResultChecksum(TypedDict):
+    system_name: str
+    system_version: str
+    data_name: str
+    data_config: Dict[str, any]
+    query_name: str
+    query_index: int
+    status: Literal['success', 'timeout', 'crash', 'unsupported']
+    row_count: Optional[int]
+    checksum: Optional[str]  # order independent, so it can be compared across systems
 
 
 class ExperimentResult(TypedDict):
     runtimes: List[float]
     cardinalities: List[int]
     experiment: Experiment
+    cores: Optional[List[int]]  # the logical cpus the system was pinned to, None if not pinned
+    stop_reason: Optional[StopReason]  # why no further runs were made
+    resource_usage: List[ResourceUsage]  # one entry per run in runtimes, of the whole script in the batch execution mode
+    perf_counters: List[Dict[str, Optional[float]]]  # the value per perf event of the measured query for each run
+    perf_baseline: Optional[Dict[str, Optional[float]]]  # the value per perf event of the run without the query
+    operator_profiles: List[List[OperatorProfile]]  # the operators of each run in runtimes, if the system has them
+    noise_levels: List[NoiseLevels]  # the noise before each run in runtimes, empty without the noise gate
+    host: HostFingerprint  # the machine the runs were measured on
+    source_commit: Optional[str]  # the commit the system was built from, None if it was not built from git
@@ -0,0 +1,43 @@
+import os
+import sys
+from typing import List, Optional
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.metrics import coefficient_of_variation, relative_confidence_interval_width
+from src.models import RunSettingsInternal, StopReason, AdaptiveParameters
+
+
+def get_max_runs(settings: RunSettingsInternal) -> int:
+    adaptive = settings['adaptive']
+    if adaptive is None:
+        return settings['n_runs']
+    return adaptive['max_runs']
+
+
+def has_converged(runtimes: List[float], adaptive: AdaptiveParameters) -> bool:
+    target_ci_width = adaptive['target_relative_ci_width']
+    if target_ci_width is not None and relative_confidence_interval_width(runtimes) > target_ci_width:
+        return False
+
+    target_cv = adaptive['target_cv']
+    if target_cv is not None and coefficient_of_variation(runtimes) > target_cv:
+        return False
+
+    return True
+
+
+def get_stop_reason(runtimes: List[float], settings: RunSettingsInternal) -> Optional[StopReason]:
+    # returns None as long as another run is needed
+    adaptive = settings['adaptive']
+    if adaptive is None:
+        return 'n_runs' if len(runtimes) >= settings['n_runs'] else None
+
+    if len(runtimes) < adaptive['min_runs']:
+        return None
+    if has_converged(runtimes, adaptive):
+        return 'converged'
+    if len(runtimes) >= adaptive['max_runs']:
+        return 'max_runs'
+    return None
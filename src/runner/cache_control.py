@@ -0,0 +1,60 @@
+import os
+import sys
+from typing import List
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import DataSet, CacheMode
+
+logger = get_logger(__name__)
+
+READ_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def get_dataset_files(data: DataSet) -> List[str]:
+    files = data.get('files') or []
+    return [path for path in files if os.path.exists(path)]
+
+
+def warm_os_cache(paths: List[str]):
+    # read the whole file once so all its pages are in the page cache
+    for path in paths:
+        with open(path, 'rb', buffering=0) as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            while f.read(READ_CHUNK_SIZE):
+                pass
+
+
+def evict_os_cache(paths: List[str]):
+    # only clean pages are dropped, the datasets are attached read only, so all their pages are clean
+    if not hasattr(os, 'posix_fadvise'):
+        logger.warning('posix_fadvise is not available on this platform -> cannot evict the dataset from the page cache')
+        return
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def prepare_os_cache(data: DataSet, cache_mode: CacheMode):
+    """
+    Brings the page cache into the state of the cache mode before a run. The hot mode is handled inside the system
+    process with warm-up runs, so it only warms the page cache here as well.
+    """
+    if cache_mode == 'none':
+        return
+
+    paths = get_dataset_files(data)
+    if not paths:
+        logger.warning(f"Dataset {data['name']} has no files -> cannot control the page cache for mode {cache_mode}")
+        return
+
+    if cache_mode == 'cold':
+        evict_os_cache(paths)
+    else:
+        warm_os_cache(paths)
@@ -0,0 +1,35 @@
+import os
+import sys
+from typing import Callable, Optional
+
+import pytest
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.models import Experiment, CacheMode, ExecutionMode
+
+RUN_DATE = '2025-01-01-00-00-00'
+
+
+def create_experiment(query: str = 'q1', sf: Optional[float] = 1, n_threads: int = 1, name: Optional[str] = None,
+                      cache_mode: CacheMode = 'none', execution_mode: ExecutionMode = 'process',
+                      timeout: float = 60.0, run_date: str = RUN_DATE) -> Experiment:
+    # a dataset without a scale factor gets no sf in its config
+    return {
+        'name': name or f'experiment-{query}-{sf}-{n_threads}',
+        'run_name': 'test',
+        'run_date': run_date,
+        'data': {'name': 'tpch', 'setup_script': {}, 'files': None, 'config': {'sf': sf} if sf is not None else {}},
+        'settings': {'execution_mode': execution_mode, 'warmup_runs': 1},
+        'query': {'name': query, 'index': 0, 'run_script': {'duckdb': f'SELECT {query};'}, 'config': None},
+        'system_setting': {'n_threads': n_threads},
+        'system': {'name': 'duckdb', 'version': 'v1.2.0'},
+        'cache_mode': cache_mode,
+        'timeout': timeout,
+    }
+
+
+@pytest.fixture
+def get_experiment() -> Callable[..., Experiment]:
+    return create_experiment
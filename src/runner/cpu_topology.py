@@ -0,0 +1,176 @@
+import os
+import sys
+import glob
+import shutil
+from typing import TypedDict, List, Dict, Optional, Tuple
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+CPU_SYSFS_PATH = '/sys/devices/system/cpu'
+NODE_SYSFS_PATH = '/sys/devices/system/node'
+
+
+class LogicalCpu(TypedDict):
+    cpu: int
+    package: int
+    core: int  # the physical core id within the package, SMT siblings share it
+    node: int  # the NUMA node
+
+
+def parse_cpu_list(cpu_list: str) -> List[int]:
+    # parses the sysfs list format, e.g. "0-3,8,10-11"
+    cpus = []
+    for part in cpu_list.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def __read_int(path: str, default: int) -> int:
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return default
+
+
+def __get_allowed_cpus() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def get_cpu_topology() -> List[LogicalCpu]:
+    """
+    Reads the CPU layout from sysfs. If sysfs is not available (e.g. on macOS), every logical CPU is treated as its
+    own physical core on a single NUMA node.
+    """
+    cpu_to_node: Dict[int, int] = {}
+    for node_path in glob.glob(os.path.join(NODE_SYSFS_PATH, 'node[0-9]*')):
+        node = int(os.path.basename(node_path)[len('node'):])
+        try:
+            with open(os.path.join(node_path, 'cpulist'), 'r') as f:
+                for cpu in parse_cpu_list(f.read()):
+                    cpu_to_node[cpu] = node
+        except OSError:
+            continue
+
+    topology: List[LogicalCpu] = []
+    for cpu in __get_allowed_cpus():
+        topology_path = os.path.join(CPU_SYSFS_PATH, f'cpu{cpu}', 'topology')
+        topology.append({
+            'cpu': cpu,
+            'package': __read_int(os.path.join(topology_path, 'physical_package_id'), 0),
+            'core': __read_int(os.path.join(topology_path, 'core_id'), cpu),
+            'node': cpu_to_node.get(cpu, 0),
+        })
+    return topology
+
+
+def __split_physical_cores(topology: List[LogicalCpu]) -> Tuple[Dict[int, List[int]], List[int]]:
+    # group the logical cpus by physical core, the first sibling of each core is its primary
+    physical_cores: Dict[Tuple[int, int, int], List[int]] = {}
+    for cpu in topology:
+        physical_cores.setdefault((cpu['node'], cpu['package'], cpu['core']), []).append(cpu['cpu'])
+
+    primaries: Dict[int, List[int]] = {}
+    siblings: List[int] = []
+    for (node, _, _), cpus in sorted(physical_cores.items()):
+        cpus = sorted(cpus)
+        primaries.setdefault(node, []).append(cpus[0])
+        siblings.extend(cpus[1:])
+    return primaries, siblings
+
+
+def get_ordered_cpus(topology: Optional[List[LogicalCpu]] = None) -> Tuple[List[int], int]:
+    """
+    Returns all logical CPUs ordered by preference (one per physical core grouped by NUMA node, then the SMT
+    siblings) together with the number of physical cores.
+    """
+    topology = topology if topology is not None else get_cpu_topology()
+    primaries, siblings = __split_physical_cores(topology)
+    primary_cpus = [cpu for node in sorted(primaries) for cpu in primaries[node]]
+    return primary_cpus + siblings, len(primary_cpus)
+
+
+def assign_cores(n_workers: int, n_threads: int, topology: Optional[List[LogicalCpu]] = None) -> List[List[int]]:
+    """
+    Assigns each worker a disjoint set of n_threads logical CPUs. Workers get one logical CPU per physical core and
+    are kept on a single NUMA node where possible. SMT siblings are only used once all physical cores are taken.
+    If the machine is still too small, the remaining workers share CPUs and a warning is logged.
+    """
+    topology = topology if topology is not None else get_cpu_topology()
+    primaries, siblings = __split_physical_cores(topology)
+
+    assignments: List[List[int]] = []
+    for worker in range(n_workers):
+        # prefer a node that can host the whole worker on distinct physical cores
+        node = next((node for node, cpus in primaries.items() if len(cpus) >= n_threads), None)
+        if node is not None:
+            assignment = primaries[node][:n_threads]
+            primaries[node] = primaries[node][n_threads:]
+        else:
+            free = [cpu for cpus in primaries.values() for cpu in cpus] + siblings
+            assignment = free[:n_threads]
+            taken = set(assignment)
+            primaries = {node: [cpu for cpu in cpus if cpu not in taken] for node, cpus in primaries.items()}
+            siblings = [cpu for cpu in siblings if cpu not in taken]
+
+        if len(assignment) < n_threads:
+            logger.warning(f'Not enough free cores for worker {worker}, it will share cores with other workers')
+            # rotate the shared cpus per worker to spread the oversubscription
+            all_cpus = [cpu['cpu'] for cpu in topology]
+            offset = (worker * n_threads) % len(all_cpus)
+            shared = [cpu for cpu in all_cpus[offset:] + all_cpus[:offset] if cpu not in assignment]
+            assignment += shared[:n_threads - len(assignment)]
+
+        assignments.append(assignment)
+
+    return assignments
+
+
+def get_pinned_command(command: str, cores: Optional[List[int]]) -> str:
+    if not cores:
+        return command
+    cpu_list = ','.join(str(core) for core in cores)
+    return f'taskset -c {cpu_list} {command}'
+
+
+# the cores of each worker thread, set once before the experiments start
+_worker_cores: Dict[int, List[int]] = {}
+
+
+def pin_workers(n_workers: int, max_threads: int):
+    if shutil.which('taskset') is None:
+        logger.warning('taskset is not available on this machine -> running the experiments without core pinning')
+        return
+
+    assignments = assign_cores(n_workers, max_threads)
+    _worker_cores.clear()
+    for worker, cores in enumerate(assignments):
+        logger.info(f'Worker {worker} is pinned to cores {cores}')
+        _worker_cores[worker] = cores
+
+
+def set_worker_cores(thread_index: int, cores: Optional[List[int]]):
+    if cores is None:
+        _worker_cores.pop(thread_index, None)
+    else:
+        _worker_cores[thread_index] = cores
+
+
+def get_worker_cores(thread_index: int, n_threads: int) -> Optional[List[int]]:
+    # the cpus are ordered with distinct physical cores first, so smaller settings use the best cores of the worker
+    if thread_index not in _worker_cores:
+        return None
+    return _worker_cores[thread_index][:n_threads]
@@ -0,0 +1,319 @@
+import hmac
+import json
+import os
+import secrets
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Deque, Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.builder.system_builder import build_systems
+from src.eval.run_evaluation import run_evaluation
+from src.logger import get_logger
+from src.models import RunConfig, Experiment, RunSettingsInternal, ResultChecksum
+from src.runner.adaptive_repetitions import get_max_runs
+from src.runner.experiment_journal import get_experiment_hash, record_experiment_result
+from src.runner.experiment_prepper import create_experiments_from_config
+from src.runner.experiment_runner import run_experiments
+from src.runner.host_fingerprint import get_host_fingerprint
+from src.runner.result_verification import compute_checksums, save_checksums
+from src.utils import get_experiment_output_path_json, SafeEncoder, set_tmp_directory
+
+logger = get_logger(__name__)
+
+DEFAULT_PORT = 8765
+
+# only the local machine can reach the coordinator unless the bind address says otherwise
+DEFAULT_BIND_ADDRESS = '127.0.0.1'
+
+TOKEN_HEADER = 'X-Benchmarker-Token'
+
+# seconds a worker waits before asking again while the last units are still running on other workers
+WAIT_INTERVAL = 5.0
+
+# seconds on top of the worst case runtime of a unit before it is handed to another worker
+LEASE_SLACK = 600.0
+
+# the coordinator and the workers run the same experiment script, these variables decide the role
+COORDINATOR_PORT_VARIABLE = 'BENCHMARKER_COORDINATOR_PORT'
+COORDINATOR_URL_VARIABLE = 'BENCHMARKER_COORDINATOR_URL'
+COORDINATOR_BIND_VARIABLE = 'BENCHMARKER_COORDINATOR_BIND'
+# the shared secret every request of a worker has to carry
+COORDINATOR_TOKEN_VARIABLE = 'BENCHMARKER_COORDINATOR_TOKEN'
+
+
+def get_unit_key(experiment: Experiment) -> Tuple[str, str, str]:
+    # all systems and queries of a dataset and setting run on the same host, so their runtimes stay comparable
+    return experiment['data']['name'], str(experiment['system_setting']), experiment['cache_mode']
+
+
+def get_lease_timeout(experiments: List[Experiment], settings: RunSettingsInternal) -> float:
+    # the worst case of every experiment is that all its runs and warm-up runs take until the timeout
+    runs = get_max_runs(settings) * (1 + settings['warmup_runs'])
+    return sum(experiment['timeout'] * runs for experiment in experiments) + LEASE_SLACK
+
+
+class Coordinator:
+    """
+    Hands out units of experiments to the workers and collects their results. A unit that is not completed within its
+    lease timeout, e.g. because its worker died, is handed out again.
+    """
+
+    def __init__(self, experiments: List[Experiment], settings: RunSettingsInternal):
+        self.settings = settings
+        self.run_name = experiments[0]['run_name'] if experiments else None
+        self.run_date = experiments[0]['run_date'] if experiments else None
+
+        groups: Dict[Tuple[str, str, str], List[Experiment]] = {}
+        for experiment in experiments:
+            groups.setdefault(get_unit_key(experiment), []).append(experiment)
+        self.units: Dict[int, List[Experiment]] = dict(enumerate(groups.values()))
+        # the results are stored under the experiment of the coordinator, never under the paths a worker sends
+        self.experiments_by_unit: Dict[int, Dict[str, Experiment]] = {
+            unit_id: {get_experiment_hash(e): e for e in unit} for unit_id, unit in self.units.items()}
+
+        self.pending: Deque[int] = deque(self.units.keys())
+        self.leases: Dict[int, Tuple[str, float]] = {}  # unit id -> hostname and deadline
+        self.assigned = set()  # every unit that was handed out at least once
+        self.completed = set()
+        self.lock = Lock()
+
+    def lease(self, host: dict) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            for unit_id, (hostname, deadline) in list(self.leases.items()):
+                if deadline < now:
+                    logger.warning(f"Unit {unit_id} on {hostname} did not complete in time -> handing it out again")
+                    del self.leases[unit_id]
+                    self.pending.appendleft(unit_id)
+
+            if not self.pending:
+                return {'wait': True} if self.leases else {'done': True}
+
+            unit_id = self.pending.popleft()
+            experiments = self.units[unit_id]
+            deadline = now + get_lease_timeout(experiments, self.settings)
+            self.leases[unit_id] = (host.get('hostname', 'unknown'), deadline)
+            self.assigned.add(unit_id)
+
+        logger.info(f"Unit {unit_id} with {len(experiments)} experiments -> {host.get('hostname')}")
+        return {
+            'unit_id': unit_id,
+            'run_date': self.run_date,
+            'experiments': [{'hash': get_experiment_hash(e), 'name': e['name']} for e in experiments],
+        }
+
+    def complete(self, unit_id: int) -> bool:
+        with self.lock:
+            if unit_id not in self.assigned:
+                return False
+            self.leases.pop(unit_id, None)
+            if unit_id in self.pending:
+                self.pending.remove(unit_id)
+            self.completed.add(unit_id)
+            return True
+
+    def get_assigned_experiment(self, unit_id: int, experiment_hash: str) -> Optional[Experiment]:
+        with self.lock:
+            if unit_id not in self.assigned:
+                return None
+        return self.experiments_by_unit.get(unit_id, {}).get(experiment_hash)
+
+    def add_result(self, unit_id: int, experiment_hash: str, experiment_result: dict) -> bool:
+        experiment = self.get_assigned_experiment(unit_id, experiment_hash)
+        if experiment is None:
+            logger.warning(f"Rejecting a result for experiment {experiment_hash} of unit {unit_id}, it was never "
+                           f"handed out")
+            return False
+
+        # the worker decides the measured values, the coordinator where they are stored
+        paths = {'name': experiment['name'], 'run_name': experiment['run_name'], 'run_date': experiment['run_date']}
+        experiment_result = {**experiment_result, 'experiment': {**experiment_result['experiment'], **paths}}
+        # a late result of a unit that was handed out again overwrites the same file
+        path = get_experiment_output_path_json(experiment)
+        with open(path, 'w') as f:
+            json.dump(experiment_result, f, indent=4, cls=SafeEncoder)
+        record_experiment_result(experiment_result)
+        return True
+
+    def add_checksums(self, checksums: List[ResultChecksum]):
+        save_checksums(checksums, self.run_name, self.run_date)
+
+    def is_done(self) -> bool:
+        with self.lock:
+            return len(self.completed) == len(self.units)
+
+
+def get_request_handler(coordinator: Coordinator, token: str):
+    class RequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not hmac.compare_digest(self.headers.get(TOKEN_HEADER, '').encode(), token.encode()):
+                self.send_error(401, 'Invalid token')
+                return
+
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                body = json.loads(self.rfile.read(length)) if length else {}
+            except json.JSONDecodeError:
+                self.send_error(400, 'Invalid JSON')
+                return
+
+            response = {}
+            try:
+                if self.path == '/lease':
+                    response = coordinator.lease(body.get('host', {}))
+                elif self.path == '/result':
+                    if not coordinator.add_result(body['unit_id'], body['hash'], body['result']):
+                        self.send_error(403, 'The experiment was not handed out')
+                        return
+                elif self.path == '/checksums':
+                    coordinator.add_checksums(body)
+                elif self.path == '/complete':
+                    if not coordinator.complete(body['unit_id']):
+                        self.send_error(403, 'The unit was not handed out')
+                        return
+                else:
+                    self.send_error(404, f'Unknown path {self.path}')
+                    return
+            except (KeyError, TypeError) as e:
+                self.send_error(400, f'Invalid request: {e}')
+                return
+
+            encoded = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, format: str, *args):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    return RequestHandler
+
+
+def get_coordinator_token() -> str:
+    token = os.getenv(COORDINATOR_TOKEN_VARIABLE)
+    if not token:
+        token = secrets.token_urlsafe(24)
+        logger.warning(f"{COORDINATOR_TOKEN_VARIABLE} is not set -> the workers have to use the generated token "
+                       f"{token}")
+    return token
+
+
+def run_coordinator(config: RunConfig, port: int = DEFAULT_PORT, bind_address: str = DEFAULT_BIND_ADDRESS):
+    """
+    Serves the experiments of the config to the workers instead of running them. The results are stored and evaluated
+    on the coordinator as if they were run locally.
+    """
+    experiments, settings = create_experiments_from_config(config)
+    coordinator = Coordinator(experiments, settings)
+    token = get_coordinator_token()
+
+    server = ThreadingHTTPServer((bind_address, port), get_request_handler(coordinator, token))
+    Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Coordinating {len(experiments)} experiments in {len(coordinator.units)} units on "
+                f"{bind_address}:{port}")
+
+    with tqdm(total=len(coordinator.units), desc="Completed units") as progress_bar:
+        while not coordinator.is_done():
+            time.sleep(1)
+            progress_bar.update(len(coordinator.completed) - progress_bar.n)
+
+    # the waiting workers ask once more before they stop
+    time.sleep(2 * WAIT_INTERVAL)
+    server.shutdown()
+    server.server_close()
+
+    run_evaluation(config['name'])
+
+
+def post(coordinator_url: str, path: str, payload, token: str, retries: int = 5) -> dict:
+    data = json.dumps(payload, cls=SafeEncoder).encode()
+    request = urllib.request.Request(coordinator_url.rstrip('/') + path, data=data,
+                                     headers={'Content-Type': 'application/json', TOKEN_HEADER: token})
+    for attempt in range(retries):
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return json.loads(response.read())
+        except (urllib.error.URLError, ConnectionError) as e:
+            # a rejected request fails the same way again
+            if attempt == retries - 1 or (isinstance(e, urllib.error.HTTPError) and e.code < 500):
+                raise
+            logger.warning(f"Request to {coordinator_url}{path} failed, retrying: {e}")
+            time.sleep(2 ** attempt)
+
+
+def run_worker(config: RunConfig, coordinator_url: str, token: str):
+    """
+    Runs the units of experiments the coordinator hands out and sends back their results. The worker builds the systems
+    and generates the datasets of the config itself, so it needs the same config as the coordinator.
+    """
+    # the coordinator decides what is left to run, so the worker knows every experiment of the config
+    config = {**config, 'run_settings': {**config.get('run_settings', {}), 'resume': False}}
+    experiments, settings = create_experiments_from_config(config)
+    experiments_by_hash = {get_experiment_hash(experiment): experiment for experiment in experiments}
+    build_systems(config['systems'], settings['max_parallel_builds'])
+
+    # several workers can share a machine, e.g. to test the distribution on localhost
+    set_tmp_directory(f'worker-{os.getpid()}')
+
+    host = get_host_fingerprint()
+    while True:
+        unit = post(coordinator_url, '/lease', {'host': host}, token)
+        if unit.get('done'):
+            break
+        if unit.get('wait'):
+            time.sleep(WAIT_INTERVAL)
+            continue
+
+        unit_experiments: List[Experiment] = []
+        hashes: List[str] = []
+        for entry in unit['experiments']:
+            experiment: Optional[Experiment] = experiments_by_hash.get(entry['hash'])
+            if experiment is None:
+                logger.error(f"Experiment {entry['name']} is not part of the config of this worker -> skipping it")
+                continue
+            unit_experiments.append({**experiment, 'name': entry['name'], 'run_date': unit['run_date']})
+            hashes.append(entry['hash'])
+
+        logger.info(f"Running unit {unit['unit_id']} with {len(unit_experiments)} experiments")
+        run_experiments(unit_experiments, settings)
+        for experiment_hash, experiment in zip(hashes, unit_experiments):
+            path = get_experiment_output_path_json(experiment)
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r') as f:
+                result = {'unit_id': unit['unit_id'], 'hash': experiment_hash, 'result': json.load(f)}
+            post(coordinator_url, '/result', result, token)
+
+        if settings['verify_results'] and unit_experiments:
+            post(coordinator_url, '/checksums', compute_checksums(unit_experiments), token)
+        post(coordinator_url, '/complete', {'unit_id': unit['unit_id']}, token)
+
+    logger.info(f"All experiments of {config['name']} are done")
+
+
+def is_distributed() -> bool:
+    return COORDINATOR_URL_VARIABLE in os.environ or COORDINATOR_PORT_VARIABLE in os.environ
+
+
+def run_distributed(config: RunConfig):
+    coordinator_url = os.getenv(COORDINATOR_URL_VARIABLE)
+    if coordinator_url:
+        token = os.getenv(COORDINATOR_TOKEN_VARIABLE)
+        if not token:
+            raise ValueError(f"A worker needs the token of the coordinator in {COORDINATOR_TOKEN_VARIABLE}")
+        run_worker(config, coordinator_url, token)
+    else:
+        run_coordinator(config, int(os.getenv(COORDINATOR_PORT_VARIABLE, DEFAULT_PORT)),
+                        os.getenv(COORDINATOR_BIND_VARIABLE, DEFAULT_BIND_ADDRESS))
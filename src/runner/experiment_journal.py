@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Literal
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import Experiment, ExperimentResult
+from src.utils import EXPERIMENT_RUNS_PATH
+
+logger = get_logger(__name__)
+
+JOURNAL_FILE_NAME = 'journal.jsonl'
+
+JournalStatus = Literal['started', 'completed', 'failed', 'skipped']
+
+_journal_lock = Lock()
+
+
+def get_experiment_hash(experiment: Experiment) -> str:
+    """
+    Identifies an experiment by its content instead of its position in the experiment list, so the hash stays the
+    same when the config changes.
+    """
+    system = experiment['system']
+    content = {
+        'system': system['name'] + '-' + system['version'],
+        'data': {'name': experiment['data']['name'], 'config': experiment['data']['config']},
+        'query': {'name': experiment['query']['name'], 'run_script': experiment['query']['run_script']},
+        'system_setting': experiment['system_setting'],
+        'cache_mode': experiment['cache_mode'],
+    }
+    encoded = json.dumps(content, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_journal_path(run_name: str, run_date: str) -> str:
+    path = os.path.join(EXPERIMENT_RUNS_PATH, run_name, run_date)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return os.path.join(path, JOURNAL_FILE_NAME)
+
+
+def append_journal_entry(experiment: Experiment, status: JournalStatus):
+    entry = {
+        'hash': get_experiment_hash(experiment),
+        'name': experiment['name'],
+        'status': status,
+        'timestamp': time.time(),
+    }
+    path = get_journal_path(experiment['run_name'], experiment['run_date'])
+    with _journal_lock:
+        with open(path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def record_experiment_result(experiment_result: ExperimentResult):
+    stop_reason = experiment_result.get('stop_reason')
+    if stop_reason == 'skipped-dominated':
+        status = 'skipped'
+    elif stop_reason in ('error', 'timeout') or len(experiment_result['runtimes']) == 0:
+        status = 'failed'
+    else:
+        status = 'completed'
+    append_journal_entry(experiment_result['experiment'], status)
+
+
+def read_journal(run_name: str, run_date: str) -> Dict[str, dict]:
+    # the last entry per hash is the current state, a half written last line from a crash is skipped
+    path = os.path.join(EXPERIMENT_RUNS_PATH, run_name, run_date, JOURNAL_FILE_NAME)
+    entries: Dict[str, dict] = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f'Skipping corrupt journal line in {path}: {line.strip()}')
+                continue
+            entries[entry['hash']] = entry
+    return entries
+
+
+def find_latest_run_date(run_name: str) -> Optional[str]:
+    path = os.path.join(EXPERIMENT_RUNS_PATH, run_name)
+    if not os.path.exists(path):
+        return None
+    run_dates = [d for d in os.listdir(path) if os.path.exists(os.path.join(path, d, JOURNAL_FILE_NAME))]
+    # the run dates are formatted so that they sort chronologically
+    return max(run_dates) if run_dates else None
+
+
+def filter_completed_experiments(experiments: List[Experiment], run_name: str, run_date: str) -> List[Experiment]:
+    """
+    Drops the experiments that already completed or were skipped in the given run. Experiments that were not
+    completed get the run date of the resumed run, and a new name if their old name belongs to a completed experiment.
+    """
+    journal = read_journal(run_name, run_date)
+    completed = {h: entry for h, entry in journal.items() if entry['status'] in ('completed', 'skipped')}
+    taken_names = {entry['name'] for entry in completed.values()}
+
+    remaining = []
+    for experiment in experiments:
+        experiment_hash = get_experiment_hash(experiment)
+        if experiment_hash in completed:
+            continue
+        experiment = {**experiment, 'run_date': run_date}
+        if experiment['name'] in taken_names:
+            experiment['name'] = experiment['name'] + '-' + experiment_hash[:8]
+        remaining.append(experiment)
+
+    logger.info(f"Resuming run {run_name}/{run_date}: {len(experiments) - len(remaining)} experiments already completed, {len(remaining)} remaining")
+    return remaining
@@ -1,15 +1,23 @@
 from datetime import datetime
+import itertools
 import os
 import sys
-from typing import List, Tuple
+from threading import Lock
+from typing import List, Tuple, Dict
 
+from src.builder.build_variants import expand_build_variants
+from src.builder.system_builder import get_system_build
 from src.logger import get_logger
+from src.runner.experiment_journal import find_latest_run_date, filter_completed_experiments
+from src.runner.host_fingerprint import get_host_fingerprint
+from src.runner.perf_counters import is_perf_available, DEFAULT_PERF_EVENTS
+from src.runner.timeout_prediction import predict_timeouts
 
 root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
 sys.path.insert(0, root_directory)
 
 from src.models import RunConfig, Experiment, run_settings_fill_defaults, Benchmark, System, SystemSettings, \
-    RunSettingsInternal, ExperimentResult, DataSet, Query
+    RunSettingsInternal, ExperimentResult, DataSet, Query, CacheMode, SystemSettingsGrid, system_settings_fill_defaults
 
 logger = get_logger(__name__)
 
@@ -20,9 +28,31 @@ def create_experiments_from_config(
 
     # if benchmarks is a list of benchmarks, use that, else create a list of one benchmark
     benchmarks: List[Benchmark] = config['benchmarks'] if isinstance(config['benchmarks'], list) else [config['benchmarks']]
-    systems: List[System] = config['systems'] if isinstance(config['systems'], list) else [config['systems']]
-    system_settings: List[SystemSettings] = config['system_settings'] if isinstance(config['system_settings'], list) else [config['system_settings']]
+    systems: List[System] = expand_build_variants(
+        config['systems'] if isinstance(config['systems'], list) else [config['systems']])
+    system_settings: List[SystemSettings] = expand_system_settings(config['system_settings'])
     run_settings = run_settings_fill_defaults(config['run_settings'])
+    cache_modes_config = config.get('cache_modes', 'none')
+    cache_modes: List[CacheMode] = cache_modes_config if isinstance(cache_modes_config, list) else [cache_modes_config]
+
+    if 'cold' in cache_modes and run_settings['execution_mode'] == 'session':
+        # evicting the page cache does not reach the buffers of the session process, which stay warm between the runs
+        raise ValueError("The cold cache mode cannot be used in the session execution mode, the buffers of the "
+                         "session process stay warm -> use the process execution mode for cold runs")
+
+    if run_settings['perf_events'] is True:
+        run_settings['perf_events'] = DEFAULT_PERF_EVENTS
+    if run_settings['perf_events'] and run_settings['execution_mode'] != 'process':
+        logger.warning("perf counters are only collected in the process execution mode -> disabling them")
+        run_settings['perf_events'] = None
+    if run_settings['perf_events'] and not is_perf_available():
+        logger.warning("perf is not installed -> the hardware counters are not collected")
+        run_settings['perf_events'] = None
+
+    for system in systems:
+        options = {option for setting in system_settings for option in get_system_options(setting)}
+        if options and system.get('set_option_command') is None:
+            raise ValueError(f"System {system['name']}-{system['version']} cannot apply the system settings {sorted(options)}, it has no set_option_command")
 
     max_threads = max([s['n_threads'] for s in system_settings])
 
@@ -32,7 +62,9 @@ def create_experiments_from_config(
     number_of_cores = os.cpu_count()
     logger.info(f"Number of cores available: {number_of_cores}")
 
-    if cores_required > number_of_cores:
+    if run_settings['scheduling'] == 'packed':
+        logger.info(f"Experiments are packed onto the available cores, n_parallel is ignored")
+    elif cores_required > number_of_cores:
         logger.warning(f"Number of cores required ({cores_required}) is greater than the number of cores available ({number_of_cores})")
     else:
         logger.info(f"Number of cores required ({cores_required}) is less than the number of cores available ({number_of_cores})")
@@ -46,28 +78,32 @@ def create_experiments_from_config(
             for data in benchmark['datasets']:
                 for system in systems:
                     for system_setting in system_settings:
-                        name = benchmark['name'] + '-experiment-' + str(index)
-                        experiment: Experiment = {
-                            'name': name,
-                            'run_name': config['name'],
-                            'run_date': run_date,
-                            'data': data,
-                            'settings': run_settings,
-                            'query': query,
-                            'system_setting': system_setting,
-                            'system': system
-                        }
-                        experiments.append(experiment)
-                        index += 1
+                        for cache_mode in cache_modes:
+                            name = benchmark['name'] + '-experiment-' + str(index)
+                            experiment: Experiment = {
+                                'name': name,
+                                'run_name': config['name'],
+                                'run_date': run_date,
+                                'data': data,
+                                'settings': run_settings,
+                                'query': query,
+                                'system_setting': system_setting,
+                                'system': system,
+                                'cache_mode': cache_mode,
+                                'timeout': run_settings['timeout'],
+                            }
+                            experiments.append(experiment)
+                            index += 1
 
     n_benchmarks = len(benchmarks)
     n_datasets = len(benchmarks[0]['datasets']) if benchmarks else 0
     n_queries = len(benchmarks[0]['queries']) if benchmarks else 0
     n_systems = len(systems)
     n_system_settings = len(system_settings)
+    n_cache_modes = len(cache_modes)
     n_experiments = len(experiments)
 
-    logger.info(f"Created {n_benchmarks} benchmarks, {n_datasets} datasets, {n_queries} queries, {n_systems} systems, and {n_system_settings} system settings")
+    logger.info(f"Created {n_benchmarks} benchmarks, {n_datasets} datasets, {n_queries} queries, {n_systems} systems, {n_system_settings} system settings, and {n_cache_modes} cache modes")
     logger.info(f"Total number of experiments: {n_experiments}")
 
 
@@ -80,23 +116,148 @@ def create_experiments_from_config(
     else:
         experiments = experiments[offset:]
 
+    resume = run_settings['resume']
+    if resume:
+        resume_date = resume if isinstance(resume, str) else find_latest_run_date(config['name'])
+        if resume_date is None:
+            logger.warning(f"No previous run of {config['name']} found to resume -> starting a new run")
+        else:
+            experiments = filter_completed_experiments(experiments, config['name'], resume_date)
+
+    if run_settings['timeout_prediction']:
+        experiments = predict_timeouts(experiments, run_settings['timeout'], run_settings['timeout_prediction'])
+
     logger.info(f"Created {len(experiments)} experiments from {len(benchmarks)} benchmarks, {len(systems)} systems, and {len(system_settings)} system settings")
 
     return experiments, run_settings
 
 
-def get_experiment_script(system: System, data: DataSet, query: Query, settings: SystemSettings, run_thread_index: int) -> str:
+# e.g. two pgo trainings in parallel builds must not generate the same dataset at the same time
+_generate_lock = Lock()
+
+
+def generate_datasets(experiments: List[Experiment]):
+    """
+    Creates the files of every dataset of the experiments. The configs only describe their datasets, so expanding a
+    config, e.g. for a plan, does not generate anything.
+    """
+    datasets = {experiment['data']['name']: experiment['data'] for experiment in experiments}
+    with _generate_lock:
+        for dataset in datasets.values():
+            if dataset.get('generate') is not None:
+                dataset['generate']()
+
+
+def expand_system_settings_grid(grid: SystemSettingsGrid) -> List[SystemSettings]:
+    names = list(grid['grid'].keys())
+    values = list(grid['grid'].values())
+    if grid.get('mode', 'product') == 'zip':
+        if len(set(len(v) for v in values)) > 1:
+            raise ValueError(f"All values of a zipped system settings grid need the same length: {grid['grid']}")
+        combinations = zip(*values)
+    else:
+        combinations = itertools.product(*values)
+    return [dict(zip(names, combination)) for combination in combinations]
+
+
+def expand_system_settings(config_settings) -> List[SystemSettings]:
+    # a single setting, a grid, or a list of both
+    config_settings = config_settings if isinstance(config_settings, list) else [config_settings]
+    system_settings = []
+    for settings in config_settings:
+        expanded = expand_system_settings_grid(settings) if 'grid' in settings else [settings]
+        system_settings.extend(system_settings_fill_defaults(s) for s in expanded)
+    return system_settings
+
+
+def get_system_options(settings: SystemSettings) -> Dict[str, any]:
+    return {name: value for name, value in settings.items() if name != 'n_threads'}
+
+
+def get_system_options_script(system: System, settings: SystemSettings) -> str:
+    # the options are applied before the data is loaded, as some of them, e.g. memory_limit, also affect the loading
+    options = get_system_options(settings)
+    return ''.join(system['set_option_command'](name, value) + '\n' for name, value in options.items())
+
+
+def get_experiment_script(system: System, data: DataSet, query: Query, settings: SystemSettings, run_thread_index: int,
+                          warmup_runs: int = 0) -> str:
+    script = get_experiment_baseline_script(system, data, query, settings, run_thread_index, warmup_runs)
+    script += query['run_script'][system['name']] + '\n'
+    return script
+
+
+def get_experiment_baseline_script(system: System, data: DataSet, query: Query, settings: SystemSettings,
+                                   run_thread_index: int, warmup_runs: int = 0) -> str:
+    # the experiment script without the measured query, the difference of both is the cost of the query alone
     script: str = ''
     system_name = system['name']
     system_threads = settings['n_threads']
     script += system['setup_script'] + '\n'
+    script += get_system_options_script(system, settings)
     script += data['setup_script'][system_name] + '\n'
+    # like in the session and batch scripts, the warm-up runs already use the threads of the measured run
+    script += system['set_threads_command'](system_threads) + '\n'
+
+    # the warm-up runs happen before the profiler is started, so only the last run is measured
+    script += get_warmup_script(system, query, warmup_runs)
 
     script += system['get_start_profiler_command'](run_thread_index) + '\n'
-    script += system['set_threads_command'](system_threads) + '\n'
 
-    script += query['run_script'][system_name] + '\n'
+    return script
+
+
+def get_warmup_script(system: System, query: Query, warmup_runs: int) -> str:
+    return (query['run_script'][system['name']] + '\n') * warmup_runs
+
+
+def get_batch_script(system: System, data: DataSet, queries: List[Query], settings: SystemSettings, run_thread_index: int,
+                     warmup_runs: int = 0) -> str:
+    # one script for all queries, every query writes its profile to the file of its position in the batch
+    script: str = get_session_setup_script(system, data, settings)
+    system_name = system['name']
+    for batch_index, query in enumerate(queries):
+        script += system['get_start_profiler_command'](run_thread_index, batch_index) + '\n'
+        # every run overwrites the profile of its position, so only the last run is measured
+        script += get_warmup_script(system, query, warmup_runs)
+        script += query['run_script'][system_name] + '\n'
+
+    return script
+
+
+def get_experiment_group_key(experiment: Experiment) -> Tuple[str, str, str]:
+    # experiments with the same key only differ in their query
+    system = experiment['system']
+    system_identifier = system['name'] + '-' + system['version']
+    setting = str(experiment['system_setting']) + '-' + experiment['cache_mode']
+    return system_identifier, experiment['data']['name'], setting
+
+
+def group_experiments(experiments: List[Experiment]) -> List[List[Experiment]]:
+    groups: Dict[Tuple[str, str, str], List[Experiment]] = {}
+    for experiment in experiments:
+        groups.setdefault(get_experiment_group_key(experiment), []).append(experiment)
+    return list(groups.values())
 
+
+def get_session_setup_script(system: System, data: DataSet, settings: SystemSettings) -> str:
+    # everything of the experiment script that only has to run once per session
+    script: str = ''
+    system_name = system['name']
+    script += system['setup_script'] + '\n'
+    script += get_system_options_script(system, settings)
+    script += data['setup_script'][system_name] + '\n'
+    script += system['set_threads_command'](settings['n_threads']) + '\n'
+    return script
+
+
+def get_session_run_script(system: System, query: Query, run_thread_index: int, marker_path: str) -> str:
+    # everything of the experiment script that has to run for every repetition, the marker signals completion
+    script: str = ''
+    system_name = system['name']
+    script += system['get_start_profiler_command'](run_thread_index) + '\n'
+    script += query['run_script'][system_name] + '\n'
+    script += system['get_session_marker_command'](marker_path) + '\n'
     return script
 
 
@@ -106,5 +267,14 @@ def get_empty_result(experiment: Experiment) -> ExperimentResult:
     return {
         'experiment': experiment,
         'runtimes': [],
-        'cardinalities': []
+        'cardinalities': [],
+        'cores': None,
+        'stop_reason': None,
+        'resource_usage': [],
+        'perf_counters': [],
+        'perf_baseline': None,
+        'operator_profiles': [],
+        'noise_levels': [],
+        'host': get_host_fingerprint(),
+        'source_commit': get_system_build(experiment['system'])[0],
     }
\ No newline at end of file
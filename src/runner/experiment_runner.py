@@ -1,7 +1,7 @@
 import json
 import os
 import sys
-from asyncio import sleep
+from time import sleep
 from queue import Queue
 from threading import Lock, Thread
 
@@ -11,38 +11,99 @@ from src.builder.system_builder import build_systems, get_system_identifier, Sta
     run_script
 from src.eval.run_evaluation import run_evaluation
 from src.logger import get_logger
-from src.models import RunConfig, Experiment, RunSettingsInternal, System, ExperimentResult, DataSet, Query
-from src.runner.experiment_prepper import create_experiments_from_config, get_empty_result, get_experiment_script
+from src.models import RunConfig, Experiment, RunSettingsInternal, System, ExperimentResult, DataSet, Query, \
+    OperatorProfile
+from src.runner.experiment_prepper import create_experiments_from_config, get_empty_result, get_experiment_script, \
+    get_batch_script, get_experiment_group_key, group_experiments, get_experiment_baseline_script, generate_datasets
+from src.runner.system_session import get_session, close_sessions
+from src.runner.cpu_topology import pin_workers, get_worker_cores
+from src.runner.scheduler import run_experiment_packed
+from src.runner.adaptive_repetitions import get_max_runs, get_stop_reason
+from src.runner.cache_control import prepare_os_cache
+from src.runner.experiment_journal import append_journal_entry, record_experiment_result
+from src.runner.noise_gate import wait_until_quiet
+from src.runner.perf_counters import get_perf_output_path, parse_perf_output, subtract_perf_baseline
+from src.runner.planner import is_plan, plan
+from src.runner.result_verification import verify_results
+from src.runner.timeout_pruning import is_dominated, record_timeout, sort_for_pruning
 from src.utils import get_experiment_output_path_json, SafeEncoder
 
 root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
 sys.path.insert(0, root_directory)
 
-from typing import List
+from typing import List, Callable, Any, Optional
 logger = get_logger(__name__)
 
 def run(config: RunConfig):
+    # imported here, as the distribution itself runs the experiments with this module
+    from src.runner.distribution import is_distributed, run_distributed
+    if is_plan():
+        print(plan(config))
+        return
+
+    # the same experiment script runs as the coordinator or a worker of a distributed run
+    if is_distributed():
+        run_distributed(config)
+        return
 
     experiments, run_settings = create_experiments_from_config(config)
-    build_systems(config['systems'])
+    build_systems(config['systems'], run_settings['max_parallel_builds'])
 
     run_experiments(experiments, run_settings)
 
+    # after the timed runs, so the verification cannot influence the measurements
+    if run_settings['verify_results']:
+        verify_results(experiments)
+
     run_evaluation(config['name'])
 
 
 def run_experiments(experiments: List[Experiment], settings: RunSettingsInternal):
     n_parallel = settings['n_parallel']
+    generate_datasets(experiments)
+
+    # a work item is either a single experiment or, in batch mode, a group of experiments sharing one script
+    work_items: List[Any] = experiments
+    run_function: Callable[[Any, int], None] = run_experiment
+    if settings['execution_mode'] == 'session':
+        # group the experiments so that each session process is started only once
+        work_items = sorted(experiments, key=get_experiment_group_key)
+    elif settings['execution_mode'] == 'batch':
+        work_items = group_experiments(experiments)
+        run_function = run_experiment_batch
+        logger.info(f"Grouped {len(experiments)} experiments into {len(work_items)} batches")
+
+    if settings['prune_timeouts']:
+        # the sort is stable and a session group or batch shares its dataset and system setting, so it stays together
+        work_items = sort_for_pruning(work_items)
+
+    if settings['scheduling'] == 'packed':
+        if settings['execution_mode'] == 'session':
+            # the sessions are kept per slot, so a whole group runs in one slot and starts its session only once
+            work_items = group_experiments(work_items)
+            run_function = run_experiment_group
+        logger.info("Running experiments packed onto the free cores...")
+        run_experiment_packed(work_items, settings, run_function)
+        close_sessions()
+        return
+
+    if settings['pin_cores'] and experiments:
+        max_threads = max(experiment['system_setting']['n_threads'] for experiment in experiments)
+        pin_workers(n_parallel, max_threads)
 
     if n_parallel > 1:
         logger.info(f"Running experiments in parallel with {n_parallel} threads...")
-        run_experiment_parallel(experiments, settings)
+        run_experiment_parallel(work_items, settings, run_function)
     else:
         logger.info("Running experiments sequentially...")
-        run_experiment_sequential(experiments)
+        run_experiment_sequential(work_items, run_function)
+
+    close_sessions()
 
 
-def run_experiment_parallel(experiments: List[Experiment], settings: RunSettingsInternal):
+def run_experiment_parallel(experiments: List[Any], settings: RunSettingsInternal,
+                            run_function: Callable[[Any, int], None] = None):
+    run_function = run_function or run_experiment
     n_parallel = settings['n_parallel']
     experiment_queue = Queue()
     progress_lock = Lock()  # Lock for updating the tqdm bar safely
@@ -63,7 +124,7 @@ def run_experiment_parallel(experiments: List[Experiment], settings: RunSettings
         while not experiment_queue.empty():
             try:
                 experiment = experiment_queue.get_nowait()  # Get an experiment from the queue
-                run_experiment(experiment, thread_index)
+                run_function(experiment, thread_index)
                 experiment_queue.task_done()
 
                 # Update the progress bar safely
@@ -89,61 +150,256 @@ def run_experiment_parallel(experiments: List[Experiment], settings: RunSettings
     progress_bar.close()
 
 
-def run_experiment_sequential(experiments: List[Experiment]):
+def run_experiment_sequential(experiments: List[Any], run_function: Callable[[Any, int], None] = None):
+    run_function = run_function or run_experiment
     for (index, experiment) in tqdm(enumerate(experiments), desc="Running experiments", position=0, leave=True):
-        run_experiment(experiment, 0)
+        run_function(experiment, 0)
+
+def run_experiment_group(experiments: List[Experiment], thread_index: int):
+    for experiment in experiments:
+        run_experiment(experiment, thread_index)
+
 
 def run_experiment(experiment: Experiment, thread_index: int):
     experiment_result: ExperimentResult = get_empty_result(experiment)
 
+    if experiment['settings']['prune_timeouts'] and is_dominated(experiment):
+        logger.warning(f"Skipping experiment {experiment['name']}, it is dominated by an experiment that timed out")
+        experiment_result['stop_reason'] = 'skipped-dominated'
+        save_experiment_result(experiment_result)
+        return
+
+    append_journal_entry(experiment, 'started')
+
     logger.info(f"Running experiment {experiment['name']} with system {experiment['system']['name']}-{experiment['system']['version']}")
     settings = experiment['settings']
     system: System = experiment['system']
     system_settings = experiment['system_setting']
 
     system_identifier = get_system_identifier(system)
-    timeout = settings['timeout']
+    timeout = experiment['timeout']
 
     data: DataSet = experiment['data']
     query: Query = experiment['query']
-    n_runs: int = settings['n_runs']
+    max_runs: int = get_max_runs(settings)
 
     # always set the home variable to the current home
     env_vars = {
         'HOME': os.environ['HOME']
     }
 
-    script = get_experiment_script(system, data, query, system_settings, thread_index)
+    cache_mode = experiment['cache_mode']
+    warmup_runs = settings['warmup_runs'] if cache_mode == 'hot' else 0
+
+    script = get_experiment_script(system, data, query, system_settings, thread_index, warmup_runs)
+    cores = get_worker_cores(thread_index, system_settings['n_threads'])
+    experiment_result['cores'] = cores
 
     runtimes = []
     cardinalities = []
-
-    for i in range(n_runs):
-
-        status: Status = run_script(system, script, timeout, thread_index, env_vars)
+    resource_usages = []
+    perf_counters = []
+    operator_profiles = []
+    noise_levels = []
+    stop_reason = None
+
+    perf_baseline = None
+    if settings['perf_events']:
+        # perf counts the whole process, a run without the measured query is subtracted from every run
+        baseline_script = get_experiment_baseline_script(system, data, query, system_settings, thread_index,
+                                                         warmup_runs)
+        status, _ = run_script(system, baseline_script, timeout * (1 + warmup_runs), thread_index, env_vars, cores,
+                               perf_events=settings['perf_events'])
+        perf_baseline = parse_perf_output(get_perf_output_path(thread_index)) if status == 'success' else None
+        if perf_baseline is None:
+            logger.error(f"Error in the perf baseline run of {system['name']}-{system['version']}")
+            stop_reason = 'error'
+        experiment_result['perf_baseline'] = perf_baseline
+
+    for i in range(max_runs if stop_reason is None else 0):
+        noise = wait_until_quiet(settings['noise_gate']) if settings['noise_gate'] else None
+        prepare_os_cache(data, cache_mode)
+
+        session = None
+        if settings['execution_mode'] == 'session':
+            session = get_session(experiment, thread_index, env_vars)
+            # in a session, the buffers stay warm, so the warm-up is only needed once
+            if warmup_runs > 0 and i == 0:
+                session.warmup(query, warmup_runs, timeout)
+            status, resource_usage = session.run(query, timeout)
+        else:
+            # the warm-up runs are part of the script, so they also get their own timeout
+            status, resource_usage = run_script(system, script, timeout * (1 + warmup_runs), thread_index, env_vars,
+                                                cores, sample_usage=True, perf_events=settings['perf_events'])
 
         if status != 'success':
             logger.error(f"Error in running {system['name']}-{system['version']}")
-            # log the run script
-            logger.error(script)
+            # log the scripts that actually ran, a session got its setup once and only the query per run
+            if session is not None:
+                logger.error(f"Session setup script:\n{session.setup_script}")
+                logger.error(f"Session run script:\n{session.last_script}")
+            else:
+                logger.error(script)
             sleep(0.2)  # wait for process to finish to release db locks
             if status == 'crash' or status == 'timeout':  # if timeout or crash, break
+                stop_reason = 'timeout' if status == 'timeout' else 'error'
+                if stop_reason == 'timeout' and settings['prune_timeouts']:
+                    record_timeout(experiment)
                 break
 
+        operators = get_operator_profile(system, thread_index)
         metrics_retrieved = system['get_metrics'](thread_index)
         if metrics_retrieved is None:
             logger.error(f"Error in retrieving metrics for {system['name']}-{system['version']}: {metrics_retrieved}")
+            stop_reason = 'error'
             break
         else:
             duration, result_cardinality = metrics_retrieved
 
+        if settings['perf_events']:
+            counters = parse_perf_output(get_perf_output_path(thread_index))
+            if counters is None:
+                stop_reason = 'error'
+                break
+            perf_counters.append(subtract_perf_baseline(counters, perf_baseline))
+
         runtimes.append(duration)
         cardinalities.append(result_cardinality)
+        resource_usages.append(resource_usage)
+        if operators is not None:
+            operator_profiles.append(operators)
+        if noise is not None:
+            noise_levels.append(noise)
+
+        stop_reason = get_stop_reason(runtimes, settings)
+        if stop_reason is not None:
+            break
 
     experiment_result['runtimes'] = runtimes
     experiment_result['cardinalities'] = cardinalities
+    experiment_result['resource_usage'] = resource_usages
+    experiment_result['perf_counters'] = perf_counters
+    experiment_result['operator_profiles'] = operator_profiles
+    experiment_result['noise_levels'] = noise_levels
+    experiment_result['stop_reason'] = stop_reason
+
+    save_experiment_result(experiment_result)
+
+
+# the timeout of a batch script is at most the timeout of this many of its queries
+MAX_BATCH_TIMEOUT_QUERIES = 3
+
+
+def run_experiment_batch(experiments: List[Experiment], thread_index: int):
+    # all experiments share the system, dataset and system setting, so they can run in one script
+    first = experiments[0]
+    logger.info(f"Running batch of {len(experiments)} experiments with system {first['system']['name']}-{first['system']['version']}")
+    settings = first['settings']
+    system: System = first['system']
 
+    env_vars = {
+        'HOME': os.environ['HOME']
+    }
+
+    # the batch shares one script, so all experiments of the batch have to share the cache mode
+    cache_mode = first['cache_mode']
+    warmup_runs = settings['warmup_runs'] if cache_mode == 'hot' else 0
+
+    cores = get_worker_cores(thread_index, first['system_setting']['n_threads'])
+    results = [get_empty_result(experiment) for experiment in experiments]
+    for experiment, experiment_result in zip(experiments, results):
+        experiment_result['cores'] = cores
+        if settings['prune_timeouts'] and is_dominated(experiment):
+            logger.warning(f"Skipping experiment {experiment['name']}, it is dominated by an experiment that timed out")
+            experiment_result['stop_reason'] = 'skipped-dominated'
+        else:
+            append_journal_entry(experiment, 'started')
+
+    # once a query failed, timed out or converged, it is dropped from the script of the next run
+    while True:
+        active = [index for index, experiment_result in enumerate(results) if experiment_result['stop_reason'] is None]
+        if not active:
+            break
+
+        # each query gets its timeout for itself and its warm-up runs, but the script only gets the budget of a few
+        # queries, so a hanging query is caught early
+        budgets = [experiments[index]['timeout'] * (1 + warmup_runs) for index in active]
+        timeout = min(sum(budgets), MAX_BATCH_TIMEOUT_QUERIES * max(budgets))
+        queries = [experiments[index]['query'] for index in active]
+        script = get_batch_script(system, first['data'], queries, first['system_setting'], thread_index, warmup_runs)
+
+        noise = wait_until_quiet(settings['noise_gate']) if settings['noise_gate'] else None
+        prepare_os_cache(first['data'], cache_mode)
+        # the usage of the whole script is recorded for every query that ran in it
+        status, resource_usage = run_script(system, script, timeout, thread_index, env_vars, cores,
+                                            sample_usage=True)
+        if status != 'success':
+            logger.error(f"Batch {'timed out' if status == 'timeout' else 'failed'} for {system['name']}-{system['version']}")
+            logger.error(script)
+
+        # the queries run in order, so after a timeout or crash the first query without a profile is the one that
+        # timed out or crashed, and the queries after it did not run and stay in the batch
+        timed_out = status == 'timeout'
+        used_time = 0.0
+        for batch_index, index in enumerate(active):
+            experiment_result = results[index]
+            operators = get_operator_profile(system, thread_index, batch_index)
+            metrics_retrieved = system['get_metrics'](thread_index, batch_index)
+            if metrics_retrieved is None:
+                if status == 'success':
+                    logger.error(f"Error in retrieving metrics for {experiments[index]['name']} of {system['name']}-{system['version']}")
+                    experiment_result['stop_reason'] = 'error'
+                    continue
+                if not timed_out:
+                    experiment_result['stop_reason'] = 'error'
+                elif timeout - used_time >= budgets[batch_index]:
+                    experiment_result['stop_reason'] = 'timeout'
+                    if settings['prune_timeouts']:
+                        record_timeout(experiments[index])
+                # otherwise the script ran out of time before the query had its own timeout, and it runs first in the
+                # next script
+                break
+
+            duration, result_cardinality = metrics_retrieved
+            used_time += duration * (1 + warmup_runs)
+            if duration > experiments[index]['timeout']:
+                # like in the process mode, where the run would have been killed
+                logger.error(f"{experiments[index]['name']} took {duration:.2f}s, longer than its timeout")
+                experiment_result['stop_reason'] = 'timeout'
+                if settings['prune_timeouts']:
+                    record_timeout(experiments[index])
+                continue
+            experiment_result['runtimes'].append(duration)
+            experiment_result['cardinalities'].append(result_cardinality)
+            experiment_result['resource_usage'].append(resource_usage)
+            if operators is not None:
+                experiment_result['operator_profiles'].append(operators)
+            if noise is not None:
+                experiment_result['noise_levels'].append(noise)
+            experiment_result['stop_reason'] = get_stop_reason(experiment_result['runtimes'], settings)
+        else:
+            if timed_out:
+                # every query finished, so the time went into something else, e.g. loading the data
+                for index in active:
+                    if results[index]['stop_reason'] is None:
+                        results[index]['stop_reason'] = 'timeout'
+
+    for experiment_result in results:
+        save_experiment_result(experiment_result)
+
+
+def get_operator_profile(system: System, thread_index: int,
+                         batch_index: Optional[int] = None) -> Optional[List[OperatorProfile]]:
+    # has to be read before get_metrics, which may delete the profile
+    get_profile = system.get('get_operator_profile')
+    return get_profile(thread_index, batch_index) if get_profile else None
+
+
+def save_experiment_result(experiment_result: ExperimentResult):
     # save the results as a json file
-    path = get_experiment_output_path_json(experiment)
+    path = get_experiment_output_path_json(experiment_result['experiment'])
     with open(path, 'w') as f:
         json.dump(experiment_result, f, indent=4, cls=SafeEncoder)
+
+    # only journal the result once it is on disk, so a crash in between re-runs the experiment
+    record_experiment_result(experiment_result)
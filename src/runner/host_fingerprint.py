@@ -0,0 +1,47 @@
+import hashlib
+import json
+import os
+import platform
+import socket
+import sys
+from functools import lru_cache
+from typing import Optional
+
+import psutil
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.models import HostFingerprint
+
+
+def get_cpu_model() -> Optional[str]:
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    # e.g. on macOS, where there is no /proc
+    return platform.processor() or None
+
+
+@lru_cache(maxsize=None)
+def get_host_fingerprint() -> HostFingerprint:
+    """
+    Describes the machine the runs are measured on. Two hosts with the same id have the same hardware and kernel, and
+    the same hostname, so their runtimes can be compared.
+    """
+    fingerprint: HostFingerprint = {
+        'id': '',
+        'hostname': socket.gethostname(),
+        'cpu_model': get_cpu_model(),
+        'n_cpus': os.cpu_count(),
+        'n_physical_cpus': psutil.cpu_count(logical=False),
+        'memory_bytes': psutil.virtual_memory().total,
+        'kernel': platform.release(),
+    }
+    encoded = json.dumps(fingerprint, sort_keys=True).encode()
+    fingerprint['id'] = hashlib.sha256(encoded).hexdigest()[:12]
+    return fingerprint
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+from typing import Optional
+
+import psutil
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import NoiseGateParameters, NoiseLevels
+
+logger = get_logger(__name__)
+
+PRESSURE_PATH = '/proc/pressure'
+
+
+def read_pressure(resource: str) -> Optional[float]:
+    # the share of the last 10 seconds in which at least one task stalled on the resource, None without psi support
+    try:
+        with open(os.path.join(PRESSURE_PATH, resource), 'r') as f:
+            for line in f:
+                if line.startswith('some'):
+                    fields = dict(field.split('=') for field in line.split()[1:])
+                    return float(fields['avg10'])
+    except (OSError, ValueError, KeyError):
+        return None
+    return None
+
+
+def __get_own_cpu_time() -> float:
+    process = psutil.Process()
+    cpu_time = 0.0
+    for p in [process] + process.children(recursive=True):
+        try:
+            times = p.cpu_times()
+            cpu_time += times.user + times.system
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return cpu_time
+
+
+def measure_noise(sample_interval: float) -> NoiseLevels:
+    n_cpus = psutil.cpu_count() or 1
+    own_cpu_time = __get_own_cpu_time()
+    cpu_times = psutil.cpu_times_percent(interval=sample_interval)
+    # the runs of parallel workers are not noise, so the cpu time of the benchmarker and its children is subtracted
+    own_utilization = (__get_own_cpu_time() - own_cpu_time) / (sample_interval * n_cpus) * 100
+    iowait = getattr(cpu_times, 'iowait', 0.0)
+    busy = 100 - cpu_times.idle - iowait
+
+    return {
+        'load': os.getloadavg()[0] / n_cpus,
+        'cpu_utilization': max(0.0, busy - own_utilization),
+        'iowait': iowait,
+        'memory_pressure': read_pressure('memory'),
+        'cpu_pressure': read_pressure('cpu'),
+        'io_pressure': read_pressure('io'),
+        'waited': 0.0,
+        'quiet': True,
+    }
+
+
+def is_quiet(noise: NoiseLevels, parameters: NoiseGateParameters) -> bool:
+    thresholds = [
+        (parameters['max_load'], noise['load']),
+        (parameters['max_cpu_utilization'], noise['cpu_utilization']),
+        (parameters['max_iowait'], noise['iowait']),
+        (parameters['max_memory_pressure'], noise['memory_pressure']),
+    ]
+    return all(threshold is None or level is None or level <= threshold for threshold, level in thresholds)
+
+
+def wait_until_quiet(parameters: NoiseGateParameters) -> NoiseLevels:
+    """
+    Blocks until the machine is quiet, backing off exponentially between the checks. After max_wait, the run starts
+    anyway and its noise levels are marked as not quiet.
+    """
+    start = time.monotonic()
+    backoff = parameters['initial_backoff']
+    while True:
+        noise = measure_noise(parameters['sample_interval'])
+        noise['waited'] = time.monotonic() - start
+        noise['quiet'] = is_quiet(noise, parameters)
+        if noise['quiet']:
+            return noise
+
+        remaining = parameters['max_wait'] - noise['waited']
+        if remaining <= 0:
+            logger.warning(f"Machine is still busy after {noise['waited']:.1f}s -> starting the run anyway: {noise}")
+            return noise
+
+        logger.info(f"Machine is busy, waiting {min(backoff, remaining):.1f}s: {noise}")
+        time.sleep(min(backoff, remaining))
+        backoff = min(backoff * 2, parameters['max_backoff'])
@@ -0,0 +1,70 @@
+import os
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.utils import get_tmp_path
+
+logger = get_logger(__name__)
+
+# the events collected if perf_events is True
+DEFAULT_PERF_EVENTS = ['cycles', 'instructions', 'LLC-load-misses', 'branch-misses', 'dTLB-load-misses']
+
+# the values perf stat reports for an event that could not be measured
+PERF_NOT_COUNTED = ('<not counted>', '<not supported>')
+
+
+def is_perf_available() -> bool:
+    return shutil.which('perf') is not None
+
+
+def get_perf_output_path(thread_index: int) -> str:
+    return get_tmp_path(f'perf-thread-{thread_index}.csv')
+
+
+def get_perf_command(command: str, events: Optional[List[str]], output_path: str) -> str:
+    # perf follows the forks of the command, so the counters cover all processes and threads of the system
+    if not events:
+        return command
+    return f"perf stat -x, -o {output_path} -e {','.join(events)} -- {command}"
+
+
+def parse_perf_output(path: str) -> Optional[Dict[str, Optional[float]]]:
+    """
+    Parses the csv output of perf stat -x, into the value per event. Events that perf could not count, e.g. because
+    the cpu has no such counter, are None.
+    """
+    if not os.path.exists(path):
+        logger.error(f'No perf output found at {path}')
+        return None
+
+    counters: Dict[str, Optional[float]] = {}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            # the fields are value, unit, event, run time, percentage of the run time the event was counted, ...
+            fields = line.split(',')
+            if len(fields) < 3:
+                continue
+            value, event = fields[0], fields[2]
+            if value in PERF_NOT_COUNTED:
+                counters[event] = None
+                continue
+            try:
+                counters[event] = float(value)
+            except ValueError:
+                logger.warning(f'Cannot parse perf output line: {line}')
+    return counters
+
+
+def subtract_perf_baseline(counters: Dict[str, Optional[float]],
+                           baseline: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+    # perf counts the whole process, without the counters of the baseline run only the measured query remains
+    return {event: value - baseline[event] if value is not None and baseline.get(event) is not None else None
+            for event, value in counters.items()}
@@ -0,0 +1,249 @@
+import json
+import math
+import os
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.builder.build_cache import parse_github_url, get_resolved_build
+from src.builder.build_log import BuildLog
+from src.builder.git_mirror import add_remote, fetch_mirror, fetch_commit, resolve_mirror_commit, resolve_ref, \
+    run_git, normalize_url
+from src.builder.system_builder import build_systems, get_system_identifier
+from src.logger import get_logger
+from src.metrics import mean, is_significantly_different
+from src.models import BisectConfig, BisectStep, System, RunConfig, RunSettings
+from src.runner.experiment_prepper import create_experiments_from_config
+from src.runner.experiment_runner import run_experiments
+from src.utils import get_experiment_output_path_json, RESULTS_PATH
+
+logger = get_logger(__name__)
+
+DEFAULT_THRESHOLD = 0.05
+
+
+def get_bisect_run_settings(config: BisectConfig) -> RunSettings:
+    # the runs repeat until the mean is known more precisely than the slowdown that is searched for
+    threshold = config.get('threshold', DEFAULT_THRESHOLD)
+    return config.get('run_settings', {
+        'adaptive': {'min_runs': 5, 'max_runs': 30, 'target_relative_ci_width': threshold},
+        'warmup_runs': 1,
+    })
+
+
+def get_commit_system(system: System, commit: str) -> System:
+    # all commits share one version and therefore one worktree, which is moved from commit to commit and built
+    # incrementally, the artifacts and the benchmark names keep the commits apart
+    repository_url = normalize_url(parse_github_url(system['build_config']['location']['github_url'])[0])
+    return {
+        **system,
+        'version': f"{system['version']}-bisect",
+        'build_config': {
+            **system['build_config'],
+            'location': {'location': 'github', 'github_url': f'{repository_url}/commit/{commit}', 'local_path': None},
+        },
+    }
+
+
+def get_mirror_path(config: BisectConfig) -> str:
+    return add_remote(parse_github_url(config['system']['build_config']['location']['github_url'])[0])[0]
+
+
+def get_commits(config: BisectConfig, build_log: BuildLog) -> Tuple[str, List[str]]:
+    """
+    The good commit, and the commits after it up to and including the bad commit, oldest first. Only the first parents
+    are followed, so the commits of a merged branch are skipped and the merge commit is tested instead.
+    """
+    repository_url = parse_github_url(config['system']['build_config']['location']['github_url'])[0]
+    mirror_path, remote = add_remote(repository_url)
+    fetch_mirror(mirror_path, build_log)
+
+    commits = []
+    for ref in [config['good_commit'], config['bad_commit']]:
+        # a ref is either a branch of the repository or a commit
+        commit = resolve_ref(mirror_path, remote, 'branch', ref) or resolve_mirror_commit(mirror_path, ref)
+        if commit is None:
+            fetch_commit(mirror_path, remote, ref, build_log)
+            commit = resolve_mirror_commit(mirror_path, ref)
+        if commit is None:
+            raise ValueError(f'Commit {ref} does not exist in {repository_url}')
+        commits.append(commit)
+    good, bad = commits
+
+    if run_git(['merge-base', '--is-ancestor', good, bad], cwd=mirror_path, check=False).returncode != 0:
+        raise ValueError(f'The good commit {good} is not an ancestor of the bad commit {bad}')
+    result = run_git(['rev-list', '--first-parent', '--reverse', f'{good}..{bad}'], cwd=mirror_path)
+    return good, result.stdout.split()
+
+
+def get_subject(config: BisectConfig, commit: str) -> str:
+    return run_git(['log', '-1', '--format=%s', commit], cwd=get_mirror_path(config), check=False).stdout.strip()
+
+
+def measure_commit(config: BisectConfig, commit: str) -> Optional[Dict[str, List[float]]]:
+    # the runtimes of every query at the commit, None if the commit could not be built or a query failed
+    system = get_commit_system(config['system'], commit)
+    build_systems([system])
+    if get_resolved_build(get_system_identifier(system))[1] is None:
+        logger.warning(f'Commit {commit} could not be built')
+        return None
+
+    run_config: RunConfig = {
+        'name': f"bisect-{config['name']}",
+        'systems': [system],
+        # the experiments of every commit get their own names, so two commits measured within a second are kept apart
+        'benchmarks': {
+            'name': f"{config['name']}-{commit[:10]}",
+            'datasets': [config['dataset']],
+            'queries': config['queries'],
+        },
+        'system_settings': [config.get('system_setting', {'n_threads': 1})],
+        'run_settings': get_bisect_run_settings(config),
+    }
+    experiments, settings = create_experiments_from_config(run_config)
+    run_experiments(experiments, settings)
+
+    runtimes: Dict[str, List[float]] = {}
+    for experiment in experiments:
+        path = get_experiment_output_path_json(experiment)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            result = json.load(f)
+        if not result['runtimes'] or result['stop_reason'] in ('error', 'timeout'):
+            logger.warning(f"Query {experiment['query']['name']} failed at commit {commit}")
+            return None
+        runtimes[experiment['query']['name']] = result['runtimes']
+    return runtimes
+
+
+def classify(config: BisectConfig, commit: str, good_runtimes: Dict[str, List[float]],
+             runtimes: Optional[Dict[str, List[float]]]) -> BisectStep:
+    step: BisectStep = {
+        'commit': commit,
+        'subject': get_subject(config, commit),
+        'status': 'skip',
+        'slowdowns': {},
+        'regressed_queries': [],
+        'runtimes': runtimes or {},
+    }
+    if runtimes is None:
+        return step
+
+    threshold = config.get('threshold', DEFAULT_THRESHOLD)
+    for query, query_runtimes in runtimes.items():
+        slowdown = mean(query_runtimes) / mean(good_runtimes[query])
+        step['slowdowns'][query] = slowdown
+        # a slowdown only counts if it is larger than the noise of both commits
+        if slowdown > 1 + threshold and is_significantly_different(query_runtimes, good_runtimes[query]):
+            step['regressed_queries'].append(query)
+    step['status'] = 'bad' if step['regressed_queries'] else 'good'
+    logger.info(f"Commit {commit[:10]} is {step['status']}, regressed queries: {step['regressed_queries']}")
+    return step
+
+
+def get_candidates(low: int, high: int) -> List[int]:
+    # the midpoint first, then its neighbours, for when the midpoint cannot be built
+    middle = (low + high) // 2
+    candidates = [middle]
+    for distance in range(1, high - low):
+        candidates += [index for index in [middle + distance, middle - distance] if low < index < high]
+    return candidates
+
+
+# the runtimes of every query at a commit, None if it could not be built or run
+MeasureFunction = Callable[[BisectConfig, str], Optional[Dict[str, List[float]]]]
+
+
+def bisect(config: BisectConfig) -> str:
+    """
+    Searches the first commit between the good and the bad commit that makes a query slower by more than the
+    threshold. Every tested commit is built with the builder, so builds of earlier bisections are reused, and its
+    queries are run with the runner until their runtimes are significant. Returns the report, which is also saved.
+    """
+    build_log = BuildLog(f"bisect-{config['name']}")
+    good_commit, commits = get_commits(config, build_log)
+    return bisect_commits(config, good_commit, commits, measure_commit)
+
+
+def bisect_commits(config: BisectConfig, good_commit: str, commits: List[str], measure: MeasureFunction) -> str:
+    # commits are the commits after the good commit up to the bad commit, oldest first
+    if not commits:
+        raise ValueError('There are no commits between the good and the bad commit')
+    logger.info(f'Bisecting {len(commits)} commits, about {math.ceil(math.log2(len(commits) + 1))} steps')
+
+    good_runtimes = measure(config, good_commit)
+    if good_runtimes is None:
+        raise ValueError(f'The good commit {good_commit} could not be built or run')
+    steps: List[BisectStep] = [classify(config, good_commit, good_runtimes, good_runtimes)]
+
+    # the bad commit has to be bad, otherwise the regression is not reproducible with these queries
+    bad_step = classify(config, commits[-1], good_runtimes, measure(config, commits[-1]))
+    steps.append(bad_step)
+    if bad_step['status'] != 'bad':
+        return write_report(config, steps, None, None)
+
+    # commits[low] is the last known good commit (-1 is the good commit), commits[high] the first known bad one
+    low, high = -1, len(commits) - 1
+    while high - low > 1:
+        step = None
+        for index in get_candidates(low, high):
+            step = classify(config, commits[index], good_runtimes, measure(config, commits[index]))
+            steps.append(step)
+            if step['status'] != 'skip':
+                break
+        if step is None or step['status'] == 'skip':
+            # every commit in between is broken, the regression is somewhere in them
+            break
+        if step['status'] == 'bad':
+            high = index
+        else:
+            low = index
+
+    first_bad = next(s for s in steps if s['commit'] == commits[high] and s['status'] == 'bad')
+    last_good_commit = commits[low] if low >= 0 else good_commit
+    last_good = next(s for s in steps if s['commit'] == last_good_commit and s['status'] == 'good')
+    return write_report(config, steps, first_bad, last_good, ambiguous=high - low > 1)
+
+
+def format_runtimes(runtimes: List[float]) -> str:
+    return f"{mean(runtimes):.4f}s ({len(runtimes)} runs)" if runtimes else ''
+
+
+def write_report(config: BisectConfig, steps: List[BisectStep], first_bad: Optional[BisectStep],
+                 last_good: Optional[BisectStep], ambiguous: bool = False) -> str:
+    threshold = config.get('threshold', DEFAULT_THRESHOLD)
+    text = f"# Bisection of {config['name']}\n\n"
+    text += f"Threshold: {threshold * 100:.1f}% slowdown of a query\n\n"
+
+    if first_bad is None:
+        text += "The bad commit is not slower than the good commit, there is nothing to bisect.\n\n"
+    else:
+        text += f"First bad commit: {first_bad['commit']} {first_bad['subject']}\n"
+        text += f"Last good commit: {last_good['commit']} {last_good['subject']}\n\n"
+        if ambiguous:
+            text += "The commits in between could not be built or run, the regression is one of them or the first bad commit.\n\n"
+        text += "| Query | Last Good | First Bad | Slowdown over Good Commit | Regressed |\n|:--|--:|--:|--:|:--|\n"
+        for query in first_bad['runtimes']:
+            text += (f"| {query} | {format_runtimes(last_good['runtimes'].get(query, []))} "
+                     f"| {format_runtimes(first_bad['runtimes'][query])} "
+                     f"| {(first_bad['slowdowns'][query] - 1) * 100:+.1f}% "
+                     f"| {'yes' if query in first_bad['regressed_queries'] else 'no'} |\n")
+        text += "\n"
+
+    text += "## Tested Commits\n\n| Commit | Subject | Status | Max Slowdown |\n|:--|:--|:--|--:|\n"
+    for step in steps:
+        max_slowdown = f"{(max(step['slowdowns'].values()) - 1) * 100:+.1f}%" if step['slowdowns'] else ''
+        text += f"| {step['commit'][:10]} | {step['subject']} | {step['status']} | {max_slowdown} |\n"
+
+    path = os.path.join(RESULTS_PATH, 'bisect', config['name'], datetime.now().strftime("%Y-%m-%d-%H-%M-%S"))
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'Bisect.md'), 'w') as f:
+        f.write(text)
+    with open(os.path.join(path, 'steps.json'), 'w') as f:
+        json.dump(steps, f, indent=4)
+    logger.info(f'The report of the bisection is in {path}')
+    return text
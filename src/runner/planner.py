@@ -0,0 +1,192 @@
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.builder.binary_registry import find_entry
+from src.builder.build_log import load_build_times
+from src.builder.build_cache import get_artifact_path, has_artifact
+from src.builder.system_builder import get_run_command, get_system_identifier, resolve_cached_commit, is_cacheable
+from src.logger import get_logger
+from src.models import RunConfig, Experiment, RunSettingsInternal, System, DataSet
+from src.runner.adaptive_repetitions import get_max_runs
+from src.runner.experiment_journal import get_experiment_hash
+from src.runner.experiment_prepper import create_experiments_from_config
+from src.runner.host_fingerprint import get_host_fingerprint
+from src.runner.scheduler import get_max_cores
+from src.runner.timeout_prediction import load_duration_history
+
+logger = get_logger(__name__)
+
+# a full DuckDB build, used for the systems that were never built before
+DEFAULT_BUILD_TIME = 30 * 60
+
+PLAN_VARIABLE = 'BENCHMARKER_PLAN'
+
+
+def is_plan() -> bool:
+    return os.getenv(PLAN_VARIABLE, '').lower() in ('1', 'true', 'yes')
+
+
+def get_benchmark_name(experiment: Experiment) -> str:
+    # the experiment names are <benchmark name>-experiment-<index>
+    return experiment['name'].split('-experiment-')[0]
+
+
+def get_runs_per_experiment(experiment: Experiment, settings: RunSettingsInternal) -> int:
+    # in the process execution mode, the warm-up runs are part of every run
+    warmup_runs = settings['warmup_runs'] if experiment['cache_mode'] == 'hot' else 0
+    if settings['execution_mode'] != 'process':
+        return get_max_runs(settings) + warmup_runs
+    return get_max_runs(settings) * (1 + warmup_runs)
+
+
+def estimate_experiment_time(experiment: Experiment, settings: RunSettingsInternal,
+                             history: Dict[str, float]) -> Tuple[float, float, bool]:
+    """
+    Returns the expected and the worst case seconds of an experiment, and whether it ran before. The expected time
+    assumes every run takes as long as the longest earlier run, the worst case that every run hits the timeout.
+    """
+    runs = get_runs_per_experiment(experiment, settings)
+    worst_case = experiment['timeout'] * runs
+    longest_run = history.get(get_experiment_hash(experiment))
+    if longest_run is None:
+        return worst_case, worst_case, False
+    return min(longest_run * runs, worst_case), worst_case, True
+
+
+def get_concurrency(experiment: Experiment, settings: RunSettingsInternal, max_cores: int) -> int:
+    # how many experiments of the same size run at the same time
+    if settings['scheduling'] == 'fixed':
+        return settings['n_parallel']
+    n_threads = experiment['system_setting']['n_threads']
+    if settings['exclusive_threads'] is not None and n_threads >= settings['exclusive_threads']:
+        return 1
+    return max(1, max_cores // min(n_threads, max_cores))
+
+
+def is_system_built(system: System) -> bool:
+    # a plan does not touch the network, a branch is resolved as of the last fetch of the mirror
+    if system.get('prebuilt') is not None:
+        return find_entry(system) is not None
+    if system.get('build_config') is None:
+        return True
+    commit = resolve_cached_commit(system)
+    if is_cacheable(system, commit):
+        return has_artifact(get_artifact_path(system, commit))
+    run_file = get_run_command(system).split()[0]
+    return os.path.exists(run_file)
+
+
+def get_files_size(files: Optional[List[str]]) -> Tuple[int, int]:
+    # the bytes of the existing files and the number of missing ones
+    size, n_missing = 0, 0
+    for file in files or []:
+        if os.path.exists(file):
+            size += os.path.getsize(file)
+        else:
+            n_missing += 1
+    return size, n_missing
+
+
+def estimate_missing_data_size(datasets: List[DataSet]) -> Dict[str, Optional[int]]:
+    """
+    Estimates the bytes of the datasets whose files do not exist yet. The size is extrapolated linearly from the
+    existing datasets with a scale factor, datasets without one cannot be estimated and are None.
+    """
+    existing_bytes, existing_sf = 0, 0.0
+    for dataset in datasets:
+        size, n_missing = get_files_size(dataset.get('files'))
+        sf = dataset['config'].get('sf')
+        if n_missing == 0 and size > 0 and sf:
+            existing_bytes += size
+            existing_sf += sf
+
+    estimates: Dict[str, Optional[int]] = {}
+    for dataset in datasets:
+        _, n_missing = get_files_size(dataset.get('files'))
+        if n_missing == 0:
+            continue
+        sf = dataset['config'].get('sf')
+        estimates[dataset['name']] = int(existing_bytes / existing_sf * sf) if existing_sf > 0 and sf else None
+    return estimates
+
+
+def format_duration(seconds: float) -> str:
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s"
+
+
+def format_bytes(n_bytes: Optional[int]) -> str:
+    if n_bytes is None:
+        return 'unknown'
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n_bytes < 1024:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} TB"
+
+
+def plan(config: RunConfig) -> str:
+    """
+    Expands the config like a run would, but only estimates how long the run takes and what it needs, without
+    building or running anything.
+    """
+    experiments, settings = create_experiments_from_config(config)
+    # like the timeout prediction, only the earlier runs on this host are a good estimate
+    history = load_duration_history(get_host_fingerprint()['id'])
+    max_cores = get_max_cores(settings)
+
+    rows: Dict[Tuple[str, str], dict] = {}
+    total_expected, total_worst_case = 0.0, 0.0
+    for experiment in experiments:
+        key = (get_system_identifier(experiment['system']), get_benchmark_name(experiment))
+        expected, worst_case, has_history = estimate_experiment_time(experiment, settings, history)
+        row = rows.setdefault(key, {'experiments': 0, 'with_history': 0, 'expected': 0.0, 'worst_case': 0.0})
+        row['experiments'] += 1
+        row['with_history'] += int(has_history)
+        row['expected'] += expected
+        row['worst_case'] += worst_case
+        # the packed scheduling runs as many experiments at the same time as their threads fit onto the cores
+        concurrency = get_concurrency(experiment, settings, max_cores)
+        total_expected += expected / concurrency
+        total_worst_case += worst_case / concurrency
+
+    df = pd.DataFrame([
+        [system, benchmark, row['experiments'], row['with_history'], format_duration(row['expected']),
+         format_duration(row['worst_case'])]
+        for (system, benchmark), row in rows.items()
+    ], columns=['System', 'Benchmark', 'Experiments', 'Ran Before', 'Expected Time', 'Worst Case Time'])
+
+    sequential_expected = sum(row['expected'] for row in rows.values())
+    parallelism = sequential_expected / total_expected if total_expected > 0 else 1.0
+
+    systems = {get_system_identifier(e['system']): e['system'] for e in experiments}
+    unbuilt_systems = [name for name, system in systems.items()
+                       if system.get('prebuilt') is None and not is_system_built(system)]
+    missing_binaries = [name for name, system in systems.items()
+                        if system.get('prebuilt') is not None and not is_system_built(system)]
+    # a system that was built before, e.g. at an older commit, takes about as long as its last build
+    build_times = load_build_times()
+    build_time = sum(build_times.get(name, DEFAULT_BUILD_TIME) for name in unbuilt_systems)
+
+    datasets = {e['data']['name']: e['data'] for e in experiments}
+    missing_data = estimate_missing_data_size(list(datasets.values()))
+    missing_bytes = None if None in missing_data.values() else sum(missing_data.values())
+
+    text = f"# Plan of {config['name']}\n\n"
+    text += df.to_markdown(index=False) + "\n\n"
+    text += f"Experiments: {len(experiments)}, {parallelism:.1f} in parallel on average\n"
+    text += f"Expected run time: {format_duration(total_expected)}\n"
+    text += f"Worst case run time: {format_duration(total_worst_case)}\n"
+    text += f"Systems to build: {len(unbuilt_systems)} {unbuilt_systems}, about {format_duration(build_time)}\n"
+    if missing_binaries:
+        text += f"Prebuilt binaries missing in the registry: {missing_binaries}\n"
+    text += (f"Datasets to generate: {len(missing_data)} {sorted(missing_data)}, "
+             f"about {format_bytes(missing_bytes)} of disk space\n")
+    return text
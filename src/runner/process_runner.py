@@ -0,0 +1,182 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+from threading import Lock, Thread
+from typing import Deque, Optional, TypedDict
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import ResourceUsage
+from src.runner.resource_usage import get_rusage_usage
+
+logger = get_logger(__name__)
+
+OUTPUT_BUFFER_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+# seconds between two checks whether a process exited, where the exit cannot be awaited with a pidfd
+EXIT_POLL_INTERVAL = 0.005
+
+
+class OutputBuffer:
+    """
+    Keeps only the last bytes of a stream, so a process printing large results neither blocks on a full pipe nor
+    fills up the memory.
+    """
+
+    def __init__(self, max_bytes: int = OUTPUT_BUFFER_SIZE):
+        self.max_bytes = max_bytes
+        self.chunks: Deque[bytes] = deque()
+        self.size = 0
+        self.total_bytes = 0
+
+    def append(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        self.total_bytes += len(chunk)
+        while self.size - len(self.chunks[0]) >= self.max_bytes:
+            self.size -= len(self.chunks.popleft())
+
+    def get_text(self) -> str:
+        data = b''.join(self.chunks)[-self.max_bytes:]
+        return data.decode(errors='replace')
+
+
+class ProcessResult(TypedDict):
+    return_code: Optional[int]  # None if the process timed out
+    timed_out: bool
+    stdout: str  # the tail of the output, empty if the output was not captured
+    stderr: str
+    resource_usage: Optional[ResourceUsage]  # None if the usage was not requested
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    # one loop runs all child processes, the experiment threads only wait for the results
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, name='process-runner', daemon=True).start()
+        return _loop
+
+
+async def _drain(pipe, buffer: OutputBuffer):
+    if pipe is None:
+        return
+    loop = asyncio.get_running_loop()
+    stream = asyncio.StreamReader(loop=loop)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stream, loop=loop), pipe)
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.append(chunk)
+
+
+def _wait_for_exit(pid: int) -> asyncio.Future:
+    """
+    Reaps the process on the loop with os.wait4 once it exited, without blocking a thread. Linux signals the exit
+    through a pidfd, other systems are polled.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def reap() -> bool:
+        try:
+            result = os.wait4(pid, os.WNOHANG)
+        except OSError as e:
+            future.set_exception(e)
+            return True
+        if result[0] == 0:
+            return False
+        future.set_result(result)
+        return True
+
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+
+    if pidfd is not None:
+        def on_exit():
+            if reap():
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+
+        loop.add_reader(pidfd, on_exit)
+    else:
+        def poll():
+            if not reap():
+                loop.call_later(EXIT_POLL_INTERVAL, poll)
+
+        poll()
+    return future
+
+
+def kill_process_group(pid: int):
+    # the command runs in a shell, so the system itself is a child that has to be killed as well
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_command_async(command: str, timeout: Optional[float], env_vars: dict = None,
+                            capture_output: bool = True, sample_usage: bool = False, cwd: Optional[str] = None,
+                            output_path: Optional[str] = None) -> ProcessResult:
+    # with an output path, stdout and stderr are appended to the file instead of being captured
+    output_file = open(output_path, 'ab') if output_path else None
+    pipe = subprocess.PIPE if capture_output and output_file is None else None
+    start_time = time.perf_counter()
+    try:
+        proc = subprocess.Popen(command, shell=True, stdout=output_file or pipe,
+                                stderr=subprocess.STDOUT if output_file else pipe,
+                                env=env_vars, cwd=cwd, start_new_session=True)
+    finally:
+        if output_file:
+            output_file.close()
+    stdout, stderr = OutputBuffer(), OutputBuffer()
+    drain = asyncio.gather(_drain(proc.stdout, stdout), _drain(proc.stderr, stderr))
+    # we reap the process ourselves, the rusage of wait4 has the exact totals of the process and the children it
+    # waited for, even of the ones that only lived for a few milliseconds
+    wait = _wait_for_exit(proc.pid)
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(asyncio.shield(wait), timeout=timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        kill_process_group(proc.pid)
+    _, wait_status, rusage = await wait
+    wall_time = time.perf_counter() - start_time
+    # the process is already reaped, popen must not wait for its pid again
+    proc.returncode = os.waitstatus_to_exitcode(wait_status)
+    # stray children of the shell must not outlive the run
+    kill_process_group(proc.pid)
+    await drain
+
+    return {
+        'return_code': None if timed_out else proc.returncode,
+        'timed_out': timed_out,
+        'stdout': stdout.get_text(),
+        'stderr': stderr.get_text(),
+        'resource_usage': get_rusage_usage(rusage, wall_time) if sample_usage else None,
+    }
+
+
+def run_command(command: str, timeout: Optional[float], env_vars: dict = None, capture_output: bool = True,
+                sample_usage: bool = False, cwd: Optional[str] = None,
+                output_path: Optional[str] = None) -> ProcessResult:
+    future = asyncio.run_coroutine_threadsafe(
+        run_command_async(command, timeout, env_vars, capture_output, sample_usage, cwd, output_path),
+        get_event_loop())
+    return future.result()
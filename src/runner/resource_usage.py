@@ -0,0 +1,124 @@
+import os
+import resource
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import psutil
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import ResourceUsage
+
+logger = get_logger(__name__)
+
+SAMPLE_INTERVAL = 0.01
+
+# the size of a block in the io counters of rusage
+RUSAGE_BLOCK_SIZE = 512
+
+
+class ProcessCounters(NamedTuple):
+    user_time: float
+    system_time: float
+    read_bytes: int
+    write_bytes: int
+    voluntary_context_switches: int
+    involuntary_context_switches: int
+
+
+def get_process_tree(pid: int) -> List[psutil.Process]:
+    try:
+        root = psutil.Process(pid)
+        return [root] + root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+
+
+def get_process_counters(process: psutil.Process) -> ProcessCounters:
+    with process.oneshot():
+        cpu_times = process.cpu_times()
+        ctx_switches = process.num_ctx_switches()
+        # not every platform reports the io counters
+        io = process.io_counters() if hasattr(process, 'io_counters') else None
+    return ProcessCounters(
+        user_time=cpu_times.user,
+        system_time=cpu_times.system,
+        read_bytes=io.read_bytes if io else 0,
+        write_bytes=io.write_bytes if io else 0,
+        voluntary_context_switches=ctx_switches.voluntary,
+        involuntary_context_switches=ctx_switches.involuntary,
+    )
+
+
+def get_usage_from_counters(total: ProcessCounters, wall_time: float, peak_rss_bytes: Optional[int]) -> ResourceUsage:
+    cpu_time = total.user_time + total.system_time
+    return {
+        'wall_time': wall_time,
+        'peak_rss_bytes': peak_rss_bytes,
+        'user_time': total.user_time,
+        'system_time': total.system_time,
+        'read_bytes': total.read_bytes,
+        'write_bytes': total.write_bytes,
+        'voluntary_context_switches': total.voluntary_context_switches,
+        'involuntary_context_switches': total.involuntary_context_switches,
+        'cpu_parallelism': cpu_time / wall_time if wall_time > 0 else 0.0,
+    }
+
+
+def get_rusage_usage(rusage: resource.struct_rusage, wall_time: float) -> ResourceUsage:
+    """
+    The exact usage of a process that was reaped with os.wait4, it includes all children the process waited for.
+    The peak RSS is the one of the largest single process.
+    """
+    # linux reports the max rss in kilobytes, macOS in bytes
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    total = ProcessCounters(
+        user_time=rusage.ru_utime,
+        system_time=rusage.ru_stime,
+        read_bytes=rusage.ru_inblock * RUSAGE_BLOCK_SIZE,
+        write_bytes=rusage.ru_oublock * RUSAGE_BLOCK_SIZE,
+        voluntary_context_switches=rusage.ru_nvcsw,
+        involuntary_context_switches=rusage.ru_nivcsw,
+    )
+    return get_usage_from_counters(total, wall_time, rusage.ru_maxrss * rss_unit)
+
+
+class ResourceSampler:
+    """
+    Samples the counters of a long-lived process and all its children, like a session, that cannot be reaped after
+    every run. Only what happens after the sampler was created is counted. The peak RSS is only known if the caller
+    polls sample() during the run, otherwise it is None.
+    """
+
+    def __init__(self, pid: int, track_peak_rss: bool = False):
+        self.pid = pid
+        self.track_peak_rss = track_peak_rss
+        self.start_time = time.perf_counter()
+        self.counters: Dict[int, ProcessCounters] = {}
+        self.peak_rss_bytes = 0
+        self.sample()
+        self.baseline: Dict[int, ProcessCounters] = dict(self.counters)
+
+    def sample(self):
+        rss_bytes = 0
+        for process in get_process_tree(self.pid):
+            try:
+                self.counters[process.pid] = get_process_counters(process)
+                if self.track_peak_rss:
+                    rss_bytes += process.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss_bytes)
+
+    def get_usage(self) -> ResourceUsage:
+        wall_time = time.perf_counter() - self.start_time
+        totals = [0] * len(ProcessCounters._fields)
+        for pid, counters in self.counters.items():
+            baseline = self.baseline.get(pid)
+            for i, value in enumerate(counters):
+                totals[i] += value - (baseline[i] if baseline else 0)
+        peak_rss_bytes = self.peak_rss_bytes if self.track_peak_rss else None
+        return get_usage_from_counters(ProcessCounters(*totals), wall_time, peak_rss_bytes)
@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+from typing import List, Optional, Tuple, Dict
+
+from tqdm import tqdm
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.builder.system_builder import run_script
+from src.logger import get_logger
+from src.models import Experiment, ResultChecksum
+from src.runner.experiment_prepper import get_session_setup_script
+from src.utils import EXPERIMENT_RUNS_PATH, get_tmp_path
+
+logger = get_logger(__name__)
+
+CHECKSUM_FILE_NAME = 'checksums.jsonl'
+
+
+def get_checksum_output_path() -> str:
+    return get_tmp_path('result-checksum.csv')
+
+
+def get_checksums_path(run_name: str, run_date: str) -> str:
+    path = os.path.join(EXPERIMENT_RUNS_PATH, run_name, run_date)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return os.path.join(path, CHECKSUM_FILE_NAME)
+
+
+def read_checksum_output(path: str) -> Optional[Tuple[int, str]]:
+    # the checksum command writes a single line with the number of rows and the checksum
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        fields = f.readline().strip().split(',')
+    os.remove(path)
+    if len(fields) != 2:
+        return None
+    row_count, checksum = fields
+    return int(row_count), checksum
+
+
+def get_verification_experiments(experiments: List[Experiment]) -> List[Experiment]:
+    # the result does not depend on the system setting or cache mode, so each query is verified once per system and data
+    verification_experiments: Dict[Tuple[str, str, str], Experiment] = {}
+    for experiment in experiments:
+        system = experiment['system']
+        key = (system['name'] + '-' + system['version'], experiment['data']['name'], experiment['query']['name'])
+        verification_experiments.setdefault(key, experiment)
+    return list(verification_experiments.values())
+
+
+def verify_experiment(experiment: Experiment) -> ResultChecksum:
+    system = experiment['system']
+    query = experiment['query']
+    checksum: ResultChecksum = {
+        'system_name': system['name'],
+        'system_version': system['version'],
+        'data_name': experiment['data']['name'],
+        'data_config': experiment['data']['config'],
+        'query_name': query['name'],
+        'query_index': query['index'],
+        'status': 'unsupported',
+        'row_count': None,
+        'checksum': None,
+    }
+    if system.get('get_checksum_command') is None:
+        return checksum
+
+    output_path = get_checksum_output_path()
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    checksum_command = system['get_checksum_command'](query['run_script'][system['name']], output_path)
+    if checksum_command is None:
+        # the system cannot compute a checksum of this query
+        return checksum
+    script = get_session_setup_script(system, experiment['data'], experiment['system_setting'])
+    script += checksum_command + '\n'
+
+    env_vars = {
+        'HOME': os.environ['HOME']
+    }
+    status, _ = run_script(system, script, experiment['timeout'], 0, env_vars)
+    checksum['status'] = status
+
+    result = read_checksum_output(output_path)
+    if status == 'success' and result is None:
+        logger.error(f"No checksum written for {query['name']} on {system['name']}-{system['version']}")
+        checksum['status'] = 'crash'
+    elif result is not None:
+        checksum['row_count'], checksum['checksum'] = result
+    return checksum
+
+
+def compute_checksums(experiments: List[Experiment]) -> List[ResultChecksum]:
+    verification_experiments = get_verification_experiments(experiments)
+    logger.info(f"Verifying the results of {len(verification_experiments)} queries...")
+    return [verify_experiment(experiment) for experiment in tqdm(verification_experiments, desc="Verifying results")]
+
+
+def save_checksums(checksums: List[ResultChecksum], run_name: str, run_date: str):
+    path = get_checksums_path(run_name, run_date)
+    with open(path, 'a') as f:
+        for checksum in checksums:
+            f.write(json.dumps(checksum) + '\n')
+
+
+def verify_results(experiments: List[Experiment]):
+    """
+    Runs every query once more, outside the timed runs, and stores an order independent checksum of its result. The
+    evaluation compares the checksums of all systems.
+    """
+    if not experiments:
+        return
+
+    checksums = compute_checksums(experiments)
+    save_checksums(checksums, experiments[0]['run_name'], experiments[0]['run_date'])
@@ -0,0 +1,140 @@
+import os
+import sys
+import shutil
+from threading import Condition, Thread
+from typing import List, Any, Callable, Optional
+
+from tqdm import tqdm
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import Experiment, RunSettingsInternal
+from src.runner.cpu_topology import get_ordered_cpus, set_worker_cores
+
+logger = get_logger(__name__)
+
+
+def get_core_demand(work_item: Any) -> int:
+    # a work item is either one experiment, or a batch or session group of experiments with the same system setting
+    experiment: Experiment = work_item[0] if isinstance(work_item, list) else work_item
+    return experiment['system_setting']['n_threads']
+
+
+def get_max_cores(settings: RunSettingsInternal) -> int:
+    ordered_cpus, n_physical_cores = get_ordered_cpus()
+    max_cores = settings['max_cores'] if settings['max_cores'] is not None else n_physical_cores
+    return min(max_cores, len(ordered_cpus))
+
+
+class CorePool:
+    """
+    A fixed budget of cores that experiments acquire according to their number of threads. Exclusive experiments
+    only start once the whole pool is free and block all other experiments while they run.
+    """
+
+    def __init__(self, cpus: List[int]):
+        self.free: List[int] = list(cpus)
+        self.rank = {cpu: index for index, cpu in enumerate(cpus)}
+        self.size = len(cpus)
+        self.exclusive_running = False
+        self.condition = Condition()
+
+    def fits(self, demand: int, exclusive: bool) -> bool:
+        if self.exclusive_running:
+            return False
+        if exclusive:
+            return len(self.free) == self.size
+        return len(self.free) >= demand
+
+    def acquire(self, demand: int, exclusive: bool) -> List[int]:
+        # the free cpus keep the preference order, so every experiment gets the best cores available
+        cores = self.free[:demand]
+        self.free = self.free[demand:]
+        self.exclusive_running = exclusive
+        return cores
+
+    def release(self, cores: List[int], exclusive: bool):
+        with self.condition:
+            self.free = sorted(self.free + cores, key=self.rank.get)
+            if exclusive:
+                self.exclusive_running = False
+            self.condition.notify_all()
+
+
+def run_experiment_packed(work_items: List[Any], settings: RunSettingsInternal,
+                          run_function: Callable[[Any, int], None]):
+    """
+    Runs the experiments concurrently as long as their threads fit into the core budget. The largest experiments are
+    started first, smaller ones fill the remaining cores. A group of experiments runs as a whole in one slot. Once an
+    exclusive experiment is the next pending one, nothing else is started until it has run, as the experiments after
+    it would otherwise keep the pool busy, e.g. in the order of the timeout pruning.
+    """
+    ordered_cpus, _ = get_ordered_cpus()
+    max_cores = get_max_cores(settings)
+    exclusive_threads = settings['exclusive_threads']
+
+    pool = CorePool(ordered_cpus[:max_cores])
+    pin = settings['pin_cores'] and shutil.which('taskset') is not None
+    logger.info(f"Packing experiments onto {max_cores} cores{' with core pinning' if pin else ''}...")
+
+    if settings['prune_timeouts']:
+        # the order of the pruning puts more threads first within a scale factor, the first fit keeps it
+        pending = list(work_items)
+    else:
+        # first fit decreasing, the sort is stable so the order within a thread count is kept
+        pending = sorted(work_items, key=get_core_demand, reverse=True)
+    free_slots = list(range(len(pool.free)))
+    threads: List[Thread] = []
+
+    progress_bar = tqdm(
+        total=len(work_items),
+        desc="Running experiments",
+        leave=True,
+        dynamic_ncols=True,
+        file=sys.stdout,
+    )
+
+    def worker(work_item: Any, slot: int, cores: List[int], exclusive: bool):
+        try:
+            run_function(work_item, slot)
+        except Exception as e:
+            logger.error(f"Error in slot {slot}: {e}")
+        finally:
+            set_worker_cores(slot, None)
+            with pool.condition:
+                free_slots.append(slot)
+                progress_bar.update(1)
+            pool.release(cores, exclusive)
+
+    while pending:
+        with pool.condition:
+            next_index: Optional[int] = None
+            while next_index is None:
+                for index, item in enumerate(pending):
+                    demand = min(get_core_demand(item), max_cores)
+                    exclusive = exclusive_threads is not None and get_core_demand(item) >= exclusive_threads
+                    if pool.fits(demand, exclusive):
+                        next_index = index
+                        break
+                    if index == 0 and exclusive:
+                        # the pool drains for the exclusive experiment
+                        break
+                if next_index is None:
+                    pool.condition.wait()
+
+            next_item = pending.pop(next_index)
+            cores = pool.acquire(demand, exclusive)
+            slot = free_slots.pop(0)
+
+        # the slot doubles as thread index, so temporary files of concurrently running experiments do not collide
+        set_worker_cores(slot, cores if pin else None)
+        thread = Thread(target=worker, args=(next_item, slot, cores, exclusive))
+        threads.append(thread)
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    progress_bar.close()
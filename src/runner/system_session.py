@@ -0,0 +1,168 @@
+import os
+import sys
+import subprocess
+import time
+import logging
+from typing import Dict, Optional, Tuple, List
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.builder.system_builder import get_run_command, kill, Status
+from src.logger import get_logger
+from src.models import System, DataSet, SystemSettings, Query, Experiment, ResourceUsage
+from src.runner.cpu_topology import get_pinned_command, get_worker_cores
+from src.runner.experiment_prepper import get_session_setup_script, get_session_run_script, get_experiment_group_key, \
+    get_warmup_script
+from src.runner.resource_usage import ResourceSampler, SAMPLE_INTERVAL
+from src.utils import get_tmp_path
+
+logger = get_logger(__name__)
+
+# how often we check whether the running script has finished
+SESSION_POLL_INTERVAL = 0.001
+
+SessionKey = Tuple[str, str, str]
+
+
+def get_session_marker_path(thread_index: int) -> str:
+    return get_tmp_path(f'session-marker-thread-{thread_index}.csv')
+
+
+class SystemSession:
+    """
+    A long-living system process that receives its scripts over stdin. The setup (attaching the dataset, setting
+    the threads) only runs once, every repetition afterward only sends the profiler command and the query.
+    """
+
+    def __init__(self, system: System, data: DataSet, settings: SystemSettings, thread_index: int, env_vars: dict,
+                 cores: Optional[List[int]] = None, sample_peak_rss: bool = False):
+        self.system = system
+        self.data = data
+        self.settings = settings
+        self.thread_index = thread_index
+        self.env_vars = env_vars
+        self.cores = cores
+        self.sample_peak_rss = sample_peak_rss
+        self.proc: Optional[subprocess.Popen] = None
+        # the scripts the process actually received, logged if the session fails
+        self.setup_script: Optional[str] = None
+        self.last_script: Optional[str] = None
+
+    def start(self):
+        # the run file expects the script as a redirected file, in a session we pipe into stdin instead
+        command = get_run_command(self.system).rstrip().removesuffix('<').rstrip()
+        command = get_pinned_command(command, self.cores)
+        logger.info(f'Starting session with command: {command}')
+
+        verbose = logger.getEffectiveLevel() <= logging.INFO
+        output = None if verbose else subprocess.DEVNULL
+        self.proc = subprocess.Popen([command], shell=True, stdin=subprocess.PIPE, stdout=output, stderr=output,
+                                     env=self.env_vars)
+        self.setup_script = get_session_setup_script(self.system, self.data, self.settings)
+        self._write(self.setup_script)
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def run(self, query: Query, timeout: float) -> Tuple[Status, Optional[ResourceUsage]]:
+        marker_path = self._prepare_run()
+        script = get_session_run_script(self.system, query, self.thread_index, marker_path)
+        # the session process lives on, so only the usage during this run is counted
+        sampler = ResourceSampler(self.proc.pid, track_peak_rss=self.sample_peak_rss)
+        status = self._run_until_marker(script, marker_path, timeout, sampler)
+        return status, sampler.get_usage()
+
+    def warmup(self, query: Query, warmup_runs: int, timeout: float) -> Status:
+        # the previous marker disabled the profiler, so the warm-up runs are not profiled
+        marker_path = self._prepare_run()
+        script = get_warmup_script(self.system, query, warmup_runs)
+        script += self.system['get_session_marker_command'](marker_path) + '\n'
+        return self._run_until_marker(script, marker_path, timeout * warmup_runs)
+
+    def _prepare_run(self) -> str:
+        if not self.is_alive():
+            self.start()
+
+        marker_path = get_session_marker_path(self.thread_index)
+        if os.path.exists(marker_path):
+            os.remove(marker_path)
+        return marker_path
+
+    def _run_until_marker(self, script: str, marker_path: str, timeout: float,
+                          sampler: Optional[ResourceSampler] = None) -> Status:
+        self.last_script = script
+        if not self._write(script):
+            self.close()
+            return 'crash'
+
+        deadline = time.monotonic() + timeout
+        next_sample = time.monotonic() + SAMPLE_INTERVAL
+        while not os.path.exists(marker_path):
+            # the counters of the living process are exact at the end, only the peak rss needs polling
+            if sampler is not None and sampler.track_peak_rss and time.monotonic() >= next_sample:
+                sampler.sample()
+                next_sample += SAMPLE_INTERVAL
+            if self.proc.poll() is not None:
+                logger.error(f'Session process exited with return code {self.proc.returncode}')
+                self.proc = None
+                return 'crash'
+            if time.monotonic() > deadline:
+                logger.error(f'Session script timed out after {timeout} seconds')
+                self.close(force=True)
+                return 'timeout'
+            time.sleep(SESSION_POLL_INTERVAL)
+
+        if sampler is not None:
+            sampler.sample()
+        return 'success'
+
+    def close(self, force: bool = False):
+        if self.proc is None:
+            return
+        if not force and self.proc.poll() is None:
+            try:
+                # closing stdin ends the session gracefully
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except (subprocess.TimeoutExpired, OSError):
+                force = True
+        if force and self.proc.poll() is None:
+            kill(self.proc.pid)
+            self.proc.wait()
+        self.proc = None
+
+    def _write(self, script: str) -> bool:
+        try:
+            self.proc.stdin.write(script.encode())
+            self.proc.stdin.flush()
+            return True
+        except (BrokenPipeError, OSError) as e:
+            logger.error(f'Could not write to session process: {e}')
+            return False
+
+
+# one session per thread, the session is replaced as soon as the thread moves on to a different key
+_sessions: Dict[int, Tuple[SessionKey, SystemSession]] = {}
+
+
+def get_session(experiment: Experiment, thread_index: int, env_vars: dict) -> SystemSession:
+    key = get_experiment_group_key(experiment)
+    cores = get_worker_cores(thread_index, experiment['system_setting']['n_threads'])
+    if thread_index in _sessions:
+        current_key, session = _sessions[thread_index]
+        # with the packed scheduling, a thread index can get different cores for the same key
+        if current_key == key and session.cores == cores:
+            return session
+        session.close()
+
+    session = SystemSession(experiment['system'], experiment['data'], experiment['system_setting'], thread_index,
+                            env_vars, cores, experiment['settings']['sample_peak_rss'])
+    _sessions[thread_index] = (key, session)
+    return session
+
+
+def close_sessions():
+    for _, session in _sessions.values():
+        session.close()
+    _sessions.clear()
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.runner import experiment_journal
+from src.runner.experiment_journal import append_journal_entry, filter_completed_experiments, find_latest_run_date, \
+    get_experiment_hash, JOURNAL_FILE_NAME
+
+OLD_RUN_DATE = '2025-01-01-00-00-00'
+NEW_RUN_DATE = '2025-01-02-00-00-00'
+
+
+@pytest.fixture(autouse=True)
+def runs_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(experiment_journal, 'EXPERIMENT_RUNS_PATH', str(tmp_path))
+    return tmp_path
+
+
+def test_completed_and_skipped_experiments_are_dropped(get_experiment):
+    experiments = [get_experiment(query) for query in ['q1', 'q2', 'q3', 'q4', 'q5']]
+    append_journal_entry(experiments[0], 'completed')
+    append_journal_entry(experiments[1], 'skipped')
+    append_journal_entry(experiments[2], 'failed')
+    append_journal_entry(experiments[3], 'started')
+
+    remaining = filter_completed_experiments(experiments, 'test', OLD_RUN_DATE)
+    assert [experiment['query']['name'] for experiment in remaining] == ['q3', 'q4', 'q5']
+    assert all(experiment['run_date'] == OLD_RUN_DATE for experiment in remaining)
+
+
+def test_remaining_experiments_get_the_run_date_of_the_resumed_run(get_experiment):
+    append_journal_entry({**get_experiment('q1'), 'run_date': NEW_RUN_DATE}, 'completed')
+
+    remaining = filter_completed_experiments([get_experiment('q1'), get_experiment('q2')], 'test', NEW_RUN_DATE)
+    assert [(experiment['query']['name'], experiment['run_date']) for experiment in remaining] == \
+           [('q2', NEW_RUN_DATE)]
+
+
+def test_the_last_entry_of_an_experiment_counts(get_experiment):
+    experiment = get_experiment('q1')
+    append_journal_entry(experiment, 'started')
+    append_journal_entry(experiment, 'completed')
+    assert filter_completed_experiments([experiment], 'test', OLD_RUN_DATE) == []
+
+    append_journal_entry(experiment, 'failed')
+    assert len(filter_completed_experiments([experiment], 'test', OLD_RUN_DATE)) == 1
+
+
+def test_experiments_are_matched_by_content_not_by_name(get_experiment):
+    # after a config change, another experiment has the name of a completed one
+    append_journal_entry(get_experiment('q1', name='experiment-0'), 'completed')
+    moved = get_experiment('q2', name='experiment-0')
+
+    remaining = filter_completed_experiments([moved], 'test', OLD_RUN_DATE)
+    assert [experiment['name'] for experiment in remaining] == [f'experiment-0-{get_experiment_hash(moved)[:8]}']
+
+
+def test_corrupt_last_line_is_skipped(get_experiment, runs_path):
+    append_journal_entry(get_experiment('q1'), 'completed')
+    with open(os.path.join(runs_path, 'test', OLD_RUN_DATE, JOURNAL_FILE_NAME), 'a') as f:
+        f.write('{"hash": "abc", "na')
+
+    remaining = filter_completed_experiments([get_experiment('q1'), get_experiment('q2')], 'test', OLD_RUN_DATE)
+    assert [experiment['query']['name'] for experiment in remaining] == ['q2']
+
+
+def test_latest_run_date_has_a_journal(get_experiment, runs_path):
+    assert find_latest_run_date('test') is None
+    append_journal_entry(get_experiment('q1'), 'completed')
+    os.makedirs(os.path.join(runs_path, 'test', NEW_RUN_DATE))
+    assert find_latest_run_date('test') == OLD_RUN_DATE
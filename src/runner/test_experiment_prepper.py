@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.runner.experiment_prepper import expand_system_settings_grid, expand_system_settings
+
+
+def test_grid_expands_into_the_product():
+    settings = expand_system_settings_grid({'grid': {'n_threads': [1, 8], 'memory_limit': ['1GB', '4GB']}})
+    assert settings == [
+        {'n_threads': 1, 'memory_limit': '1GB'},
+        {'n_threads': 1, 'memory_limit': '4GB'},
+        {'n_threads': 8, 'memory_limit': '1GB'},
+        {'n_threads': 8, 'memory_limit': '4GB'},
+    ]
+
+
+def test_zipped_grid_combines_the_values_by_position():
+    settings = expand_system_settings_grid(
+        {'grid': {'n_threads': [1, 8], 'memory_limit': ['1GB', '4GB']}, 'mode': 'zip'})
+    assert settings == [{'n_threads': 1, 'memory_limit': '1GB'}, {'n_threads': 8, 'memory_limit': '4GB'}]
+
+
+def test_zipped_grid_needs_lists_of_the_same_length():
+    with pytest.raises(ValueError):
+        expand_system_settings_grid({'grid': {'n_threads': [1, 8], 'memory_limit': ['1GB']}, 'mode': 'zip'})
+
+
+def test_settings_mix_grids_and_single_settings_and_fill_defaults():
+    settings = expand_system_settings([{'grid': {'memory_limit': ['1GB', '4GB']}}, {'n_threads': 4}])
+    assert settings == [
+        {'n_threads': 1, 'memory_limit': '1GB'},
+        {'n_threads': 1, 'memory_limit': '4GB'},
+        {'n_threads': 4},
+    ]
+
+
+def test_single_setting_is_not_a_list():
+    assert expand_system_settings({'n_threads': 2}) == [{'n_threads': 2}]
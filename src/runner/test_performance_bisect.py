@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+
+import pytest
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.models import BisectConfig
+from src.runner import performance_bisect
+from src.runner.performance_bisect import get_candidates, bisect_commits
+
+GOOD_RUNTIMES = [1.0, 1.01, 0.99, 1.02, 0.98]
+BAD_RUNTIMES = [1.5, 1.51, 1.49, 1.52, 1.48]
+
+
+def get_config() -> BisectConfig:
+    return {
+        'name': 'test',
+        'system': {'name': 'duckdb', 'version': 'v1.2.0'},
+        'good_commit': 'good',
+        'bad_commit': 'c9',
+        'dataset': {'name': 'tpch', 'setup_script': {}, 'files': None, 'config': {'sf': 1}},
+        'queries': [],
+    }
+
+
+def get_fake_measure(first_bad: int, broken=(), slow_queries=('q1',)):
+    # commit ci is slower from the first bad commit on, broken commits cannot be built
+    measured = []
+
+    def measure(config: BisectConfig, commit: str):
+        measured.append(commit)
+        if commit in broken:
+            return None
+        index = int(commit[1:]) if commit != 'good' else -1
+        return {query: BAD_RUNTIMES if index >= first_bad and query in slow_queries else GOOD_RUNTIMES
+                for query in ['q1', 'q2']}
+
+    return measure, measured
+
+
+@pytest.fixture(autouse=True)
+def report_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(performance_bisect, 'RESULTS_PATH', str(tmp_path))
+    monkeypatch.setattr(performance_bisect, 'get_subject', lambda config, commit: f'subject of {commit}')
+    return tmp_path
+
+
+def load_steps(report_path) -> list:
+    path, = [os.path.join(root, name) for root, _, names in os.walk(report_path) for name in names
+             if name == 'steps.json']
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def test_candidates_start_at_the_midpoint_and_alternate_around_it():
+    assert get_candidates(-1, 9) == [4, 5, 3, 6, 2, 7, 1, 8, 0]
+
+
+def test_candidates_stay_between_the_bounds():
+    assert get_candidates(2, 5) == [3, 4]
+    assert get_candidates(2, 4) == [3]
+
+
+def test_bisection_finds_the_first_bad_commit(report_path):
+    commits = [f'c{i}' for i in range(10)]
+    measure, measured = get_fake_measure(first_bad=6)
+    report = bisect_commits(get_config(), 'good', commits, measure)
+
+    assert 'First bad commit: c6 subject of c6' in report
+    assert 'Last good commit: c5 subject of c5' in report
+    assert '| q1 |' in report
+    # the good and the bad commit, then about log2(10) steps
+    assert measured[:2] == ['good', 'c9'] and len(measured) <= 2 + 4
+    regressed = {step['commit']: step['regressed_queries'] for step in load_steps(report_path)}
+    assert regressed['c6'] == ['q1']
+
+
+def test_bisection_skips_commits_that_cannot_be_built():
+    commits = [f'c{i}' for i in range(10)]
+    measure, measured = get_fake_measure(first_bad=4, broken={'c4'})
+    report = bisect_commits(get_config(), 'good', commits, measure)
+
+    assert 'c4' in measured
+    assert 'First bad commit: c5' in report
+    assert 'Last good commit: c3' in report
+    assert 'could not be built or run' in report
+
+
+def test_bisection_stops_if_the_bad_commit_is_not_slower():
+    measure, measured = get_fake_measure(first_bad=100)
+    report = bisect_commits(get_config(), 'good', ['c0', 'c1', 'c2'], measure)
+
+    assert 'there is nothing to bisect' in report
+    assert measured == ['good', 'c2']
+
+
+def test_bisection_needs_a_working_good_commit():
+    measure, _ = get_fake_measure(first_bad=1, broken={'good'})
+    with pytest.raises(ValueError):
+        bisect_commits(get_config(), 'good', ['c0', 'c1'], measure)
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+from threading import Lock
+
+import pytest
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.models import run_settings_fill_defaults
+from src.runner import scheduler
+from src.runner.scheduler import run_experiment_packed
+
+
+@pytest.fixture(autouse=True)
+def four_cores(monkeypatch):
+    monkeypatch.setattr(scheduler, 'get_ordered_cpus', lambda: ([0, 1, 2, 3], 4))
+
+
+def run_packed(work_items, **settings) -> list:
+    # the names of the experiments in the order they started
+    started, lock = [], Lock()
+
+    def run_function(experiment, slot: int):
+        with lock:
+            started.append(experiment['name'])
+        time.sleep(0.05)
+
+    run_experiment_packed(work_items, run_settings_fill_defaults({'scheduling': 'packed', **settings}), run_function)
+    return started
+
+
+def test_largest_experiments_start_first(get_experiment):
+    experiments = [get_experiment(name=f'{n_threads}', n_threads=n_threads) for n_threads in [1, 2, 4, 1]]
+    assert run_packed(experiments)[0] == '4'
+
+
+def test_exclusive_experiment_is_not_passed_by_smaller_ones(get_experiment):
+    # the order of the timeout pruning is kept, so a small experiment is already running
+    experiments = [get_experiment(name=name, n_threads=n_threads)
+                   for name, n_threads in [('small-0', 1), ('exclusive', 4), ('small-1', 1), ('small-2', 1)]]
+    started = run_packed(experiments, prune_timeouts=True, exclusive_threads=4)
+    assert started == ['small-0', 'exclusive', 'small-1', 'small-2']
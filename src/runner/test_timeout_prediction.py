@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+
+import pytest
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.models import Experiment, timeout_prediction_parameters_fill_defaults
+from src.runner import timeout_prediction
+from src.runner.timeout_prediction import predict_timeout, predict_timeouts, load_duration_history
+
+
+def write_result(runs_path: str, name: str, experiment: Experiment, runtimes, wall_times=None, host_id='host-a'):
+    path = os.path.join(runs_path, 'run', '2025-01-01-00-00-00')
+    os.makedirs(path, exist_ok=True)
+    result = {
+        'experiment': experiment,
+        'runtimes': runtimes,
+        'resource_usage': [{'wall_time': wall_time} for wall_time in wall_times or []],
+        'host': {'id': host_id},
+    }
+    with open(os.path.join(path, f'{name}.json'), 'w') as f:
+        json.dump(result, f)
+
+
+@pytest.fixture
+def parameters():
+    return timeout_prediction_parameters_fill_defaults({'multiplier': 5.0, 'min_timeout': 1.0})
+
+
+def test_experiment_without_history_keeps_the_global_timeout(parameters):
+    assert predict_timeout(None, 60, parameters) == 60
+
+
+def test_timeout_is_a_multiple_of_the_longest_run(parameters):
+    assert predict_timeout(2.0, 60, parameters) == 10.0
+
+
+def test_timeout_is_at_least_the_minimum(parameters):
+    assert predict_timeout(0.01, 60, parameters) == 1.0
+
+
+def test_maximum_defaults_to_a_multiple_of_the_global_timeout(parameters):
+    assert predict_timeout(100.0, 60, parameters) == 180.0
+
+
+def test_explicit_maximum(parameters):
+    assert predict_timeout(100.0, 60, {**parameters, 'max_timeout': 90.0}) == 90.0
+
+
+def test_history_only_contains_runs_of_the_host(get_experiment, tmp_path):
+    write_result(str(tmp_path), 'a', get_experiment('q1'), [1.0, 2.0], host_id='host-a')
+    write_result(str(tmp_path), 'b', get_experiment('q2'), [1.0], host_id='host-b')
+    history = load_duration_history('host-a', str(tmp_path))
+    assert list(history.values()) == [2.0]
+
+
+def test_history_uses_the_wall_time_per_warmup_run(get_experiment, tmp_path):
+    write_result(str(tmp_path), 'a', get_experiment('q1', cache_mode='hot'), [1.0], wall_times=[6.0])
+    assert list(load_duration_history('host-a', str(tmp_path)).values()) == [3.0]
+
+
+def test_history_ignores_the_wall_time_of_a_batch(get_experiment, tmp_path):
+    write_result(str(tmp_path), 'a', get_experiment('q1', execution_mode='batch'), [1.0], wall_times=[6.0])
+    assert list(load_duration_history('host-a', str(tmp_path)).values()) == [1.0]
+
+
+def test_predict_timeouts(get_experiment, tmp_path, monkeypatch, parameters):
+    write_result(str(tmp_path), 'a', get_experiment('q1'), [1.0, 3.0])
+    monkeypatch.setattr(timeout_prediction, 'get_host_fingerprint', lambda: {'id': 'host-a'})
+    monkeypatch.setattr(timeout_prediction, 'load_duration_history',
+                        lambda host_id: load_duration_history(host_id, str(tmp_path)))
+
+    experiments = predict_timeouts([get_experiment('q1'), get_experiment('q2')], 60, parameters)
+    assert [experiment['timeout'] for experiment in experiments] == [15.0, 60]
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.runner import timeout_pruning
+from src.runner.timeout_pruning import sort_for_pruning, record_timeout, is_dominated
+
+
+@pytest.fixture(autouse=True)
+def clear_timeouts():
+    timeout_pruning._timeouts.clear()
+    yield
+    timeout_pruning._timeouts.clear()
+
+
+def test_sort_puts_small_scale_factors_and_many_threads_first(get_experiment):
+    experiments = [get_experiment(sf=sf, n_threads=n_threads) for sf, n_threads in [(10, 1), (1, 1), (10, 8), (1, 8)]]
+    ordered = [(e['data']['config']['sf'], e['system_setting']['n_threads']) for e in sort_for_pruning(experiments)]
+    assert ordered == [(1, 8), (1, 1), (10, 8), (10, 1)]
+
+
+def test_sort_uses_the_first_experiment_of_a_batch(get_experiment):
+    batches = [[get_experiment(sf=10, n_threads=4)],
+               [get_experiment(sf=1, n_threads=2), get_experiment(sf=1, n_threads=2, query='q2')]]
+    assert sort_for_pruning(batches) == [batches[1], batches[0]]
+
+
+def test_sort_is_stable_within_a_scale_factor_and_thread_count(get_experiment):
+    experiments = [get_experiment(sf=1, n_threads=4, query='q2'), get_experiment(sf=1, n_threads=4, query='q1')]
+    assert sort_for_pruning(experiments) == experiments
+
+
+def test_timeout_dominates_more_data_and_fewer_threads(get_experiment):
+    record_timeout(get_experiment(sf=1, n_threads=4))
+    assert is_dominated(get_experiment(sf=1, n_threads=4))
+    assert is_dominated(get_experiment(sf=10, n_threads=4))
+    assert is_dominated(get_experiment(sf=1, n_threads=2))
+    assert not is_dominated(get_experiment(sf=1, n_threads=8))
+    assert not is_dominated(get_experiment(sf=0.1, n_threads=4))
+
+
+def test_longer_timeout_is_not_dominated(get_experiment):
+    record_timeout(get_experiment(sf=1, n_threads=4, timeout=10.0))
+    assert not is_dominated(get_experiment(sf=10, n_threads=1, timeout=20.0))
+
+
+def test_other_queries_are_not_dominated(get_experiment):
+    record_timeout(get_experiment(sf=1, n_threads=4, query='q1'))
+    assert not is_dominated(get_experiment(sf=10, n_threads=1, query='q2'))
+
+
+def test_dataset_without_scale_factor_is_only_compared_with_itself(get_experiment):
+    record_timeout(get_experiment(sf=None, n_threads=4))
+    assert is_dominated(get_experiment(sf=None, n_threads=2))
+    assert not is_dominated(get_experiment(sf=1, n_threads=2))
@@ -0,0 +1,93 @@
+import glob
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import Experiment, TimeoutPredictionParameters
+from src.runner.experiment_journal import get_experiment_hash
+from src.runner.host_fingerprint import get_host_fingerprint
+from src.utils import EXPERIMENT_RUNS_PATH
+
+logger = get_logger(__name__)
+
+
+def get_run_durations(result: dict) -> List[float]:
+    """
+    The durations the timeout of each run has to cover. The wall time of the process includes loading the data, so it
+    is preferred over the runtime of the query. In the process execution mode, the warm-up runs share the process and
+    the timeout is multiplied by their number, so the wall time is divided by it.
+    """
+    experiment = result['experiment']
+    settings = experiment.get('settings', {})
+    warmup_runs = settings.get('warmup_runs', 0) if experiment.get('cache_mode') == 'hot' else 0
+    if settings.get('execution_mode', 'process') != 'process':
+        warmup_runs = 0
+
+    durations = list(result.get('runtimes', []))
+    # in the batch execution mode, the usage is the one of the whole script
+    if settings.get('execution_mode') == 'batch':
+        return durations
+    for i, usage in enumerate(result.get('resource_usage', [])):
+        if usage is None or i >= len(durations):
+            continue
+        durations[i] = max(durations[i], usage['wall_time'] / (1 + warmup_runs))
+    return durations
+
+
+def load_duration_history(host_id: str, runs_path: str = EXPERIMENT_RUNS_PATH) -> Dict[str, float]:
+    """
+    The longest run per experiment hash over all earlier runs on the host, experiments without a successful run are
+    missing. Runs on other machines, or from before the host was recorded, say nothing about the runtimes here.
+    """
+    history: Dict[str, float] = {}
+    for path in glob.glob(os.path.join(runs_path, '*', '*', '*.json')):
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+            if (result.get('host') or {}).get('id') != host_id:
+                continue
+            # results from before the cache modes ran without cache control
+            experiment = {'cache_mode': 'none', **result['experiment']}
+            durations = get_run_durations(result)
+            experiment_hash = get_experiment_hash(experiment)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'Skipping {path} for the timeout prediction: {e}')
+            continue
+        if durations:
+            history[experiment_hash] = max(history.get(experiment_hash, 0.0), max(durations))
+    return history
+
+
+def predict_timeout(longest_run: Optional[float], default_timeout: float,
+                    parameters: TimeoutPredictionParameters) -> float:
+    if longest_run is None:
+        return default_timeout
+    max_timeout = parameters['max_timeout']
+    if max_timeout is None:
+        max_timeout = default_timeout * parameters['max_timeout_multiplier']
+    return min(max(longest_run * parameters['multiplier'], parameters['min_timeout']), max_timeout)
+
+
+def predict_timeouts(experiments: List[Experiment], default_timeout: float,
+                     parameters: TimeoutPredictionParameters) -> List[Experiment]:
+    """
+    Sets the timeout of every experiment to a multiple of its longest run in the earlier results of this host, bounded
+    by the minimum and maximum timeout. Experiments that never ran successfully keep the global timeout.
+    """
+    history = load_duration_history(get_host_fingerprint()['id'])
+    predicted = []
+    n_predicted = 0
+    for experiment in experiments:
+        longest_run = history.get(get_experiment_hash(experiment))
+        if longest_run is not None:
+            n_predicted += 1
+        timeout = predict_timeout(longest_run, default_timeout, parameters)
+        predicted.append({**experiment, 'timeout': timeout})
+
+    logger.info(f"Predicted the timeout of {n_predicted} of {len(experiments)} experiments from earlier results")
+    return predicted
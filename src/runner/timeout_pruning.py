@@ -0,0 +1,71 @@
+import json
+import os
+import sys
+from threading import Lock
+from typing import Any, Dict, List, Tuple, Optional
+
+root_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, root_directory)
+
+from src.logger import get_logger
+from src.models import Experiment
+
+logger = get_logger(__name__)
+
+# the scale factor, number of threads and timeout of every timed out experiment, per dominance key
+_timeouts: Dict[str, List[Tuple[Optional[float], int, float]]] = {}
+_timeouts_lock = Lock()
+
+
+def get_dominance_key(experiment: Experiment) -> str:
+    """
+    Experiments with the same key only differ in their scale factor and number of threads. Datasets without a scale
+    factor are only compared with themselves.
+    """
+    system = experiment['system']
+    data_config = {k: v for k, v in experiment['data']['config'].items() if k != 'sf'}
+    if 'sf' not in experiment['data']['config']:
+        data_config['name'] = experiment['data']['name']
+    system_setting = {k: v for k, v in experiment['system_setting'].items() if k != 'n_threads'}
+    key = {
+        'system': system['name'] + '-' + system['version'],
+        'query': experiment['query']['name'],
+        'data': data_config,
+        'system_setting': system_setting,
+        'cache_mode': experiment['cache_mode'],
+    }
+    return json.dumps(key, sort_keys=True, default=str)
+
+
+def __get_sf_and_threads(experiment: Experiment) -> Tuple[Optional[float], int]:
+    return experiment['data']['config'].get('sf'), experiment['system_setting']['n_threads']
+
+
+def record_timeout(experiment: Experiment):
+    with _timeouts_lock:
+        _timeouts.setdefault(get_dominance_key(experiment), []).append(
+            (*__get_sf_and_threads(experiment), experiment['timeout']))
+
+
+def is_dominated(experiment: Experiment) -> bool:
+    # a query that timed out will also time out on more data or with fewer threads, unless it gets a longer timeout
+    sf, n_threads = __get_sf_and_threads(experiment)
+    with _timeouts_lock:
+        timeouts = list(_timeouts.get(get_dominance_key(experiment), []))
+
+    for timeout_sf, timeout_threads, timeout in timeouts:
+        more_data = sf is None or timeout_sf is None or sf >= timeout_sf
+        if more_data and n_threads <= timeout_threads and experiment['timeout'] <= timeout:
+            return True
+    return False
+
+
+def sort_for_pruning(work_items: List[Any]) -> List[Any]:
+    # small scale factors and many threads first, so a timeout can prune as many later experiments as possible
+    def sort_key(work_item: Any):
+        # a work item is either one experiment or a batch of experiments with the same dataset and system setting
+        sf, n_threads = __get_sf_and_threads(work_item[0] if isinstance(work_item, list) else work_item)
+        return sf if sf is not None else 0, -n_threads
+
+    return sorted(work_items, key=sort_key)
+
@@ -53,6 +53,14 @@ for dir_name in dirs:
 def get_tmp_path(path: str) -> str:
     return os.path.join(TMP_PATH, path)
 
+
+def set_tmp_directory(name: str):
+    # gives this process its own directory for the scripts and profiles, so several processes can share a machine
+    global TMP_PATH
+    TMP_PATH = os.path.join(_OUTPUT_DIR_PATH, 'tmp', name)
+    if not os.path.exists(TMP_PATH):
+        os.makedirs(TMP_PATH)
+
 def get_snb_path(sf: int) -> str:
     return os.path.join(DATA_PATH, f'SNB{sf}-projected|')
 